@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
+import bisect
 import codecs
 import os.path
 import platform
 import shutil
+import sqlite3
 import sys
 import webbrowser as wb
 from functools import partial
@@ -45,9 +47,17 @@ from libs.yolo_io import YoloReader
 from libs.yolo_io import TXT_EXT
 from libs.create_ml_io import CreateMLReader
 from libs.create_ml_io import JSON_EXT
+from libs.create_ml_io import create_ml_stores
 from libs.ustr import ustr
 from libs.hashableQListWidgetItem import HashableQListWidgetItem
 from libs.batchDialog import BatchDialog
+from libs.image_cache import ImageCache, DEFAULT_IMAGE_CACHE_MB
+from libs.image_prefetcher import ImagePrefetcher, decode_image
+from libs.dir_scanner import DirectoryScanner
+from libs.file_list_model import FileListModel
+from libs.dataset_index import DatasetIndex, DatasetIndexer, DatasetIndexWriter, find_annotation
+from libs.save_queue import SaveQueue
+from libs.atomic_file import set_fsync
 
 __appname__ = 'labelImg'
 
@@ -99,15 +109,44 @@ class MainWindow(QMainWindow, WindowMixin):
         self.label_file_format = settings.get(SETTING_LABEL_FILE_FORMAT, LabelFileFormat.PASCAL_VOC)
 
         # For loading all image under a directory
-        self.m_img_list = []
+        # m_img_list is the path list behind the file dock model
+        self.file_list_model = FileListModel(self)
+        self.m_img_list = self.file_list_model.paths
         self.dir_name = None
         self.label_hist = []
         self.last_open_dir = None
         self.cur_img_idx = 0
         self.img_count = len(self.m_img_list)
+        # Decoded images, and a prefetcher decoding the neighbouring ones in the background
+        self.image_cache = ImageCache(settings.get(SETTING_IMAGE_CACHE_MB, DEFAULT_IMAGE_CACHE_MB) * 1024 * 1024)
+        self.prefetcher = ImagePrefetcher(self.image_cache, parent=self)
+        # Background directory scan
+        self.dir_scanner = None
+        # On-disk index of the opened directory, the paths it listed when the
+        # directory was opened, and the paths the scan has confirmed since
+        self.dataset_index = None
+        self.dataset_indexer = None
+        self.dataset_index_writer = None
+        self.indexed_paths = set()
+        self.scanned_paths = set()
+        # CreateML saves are kept in memory and written in batches, shortly
+        # after the last save and on close
+        self.create_ml_flush_timer = QTimer(self)
+        self.create_ml_flush_timer.setSingleShot(True)
+        self.create_ml_flush_timer.setInterval(1000)
+        self.create_ml_flush_timer.timeout.connect(self.flush_create_ml_stores)
+        # Autosaves are written on a worker thread while the next image loads
+        self.save_queue = SaveQueue(self)
+        self.save_queue.saved.connect(self.annotation_saved)
+        self.save_queue.failed.connect(self.annotation_save_failed)
 
         # Whether we need to save or not.
         self.dirty = False
+        # (annotation path, content digest) of what is known to be on disk for
+        # the current image, and how many saves were written or found unchanged
+        self.saved_content = None
+        self.save_count = 0
+        self.skipped_save_count = 0
 
         self._no_selection_slot = False
         self._beginner = True
@@ -183,11 +222,14 @@ class MainWindow(QMainWindow, WindowMixin):
         self.dock.setObjectName(get_str('labels'))
         self.dock.setWidget(label_list_container)
 
-        self.file_list_widget = QListWidget()
-        self.file_list_widget.itemDoubleClicked.connect(self.file_item_double_clicked)
+        self.file_list_view = QListView()
+        self.file_list_view.setModel(self.file_list_model)
+        self.file_list_view.setUniformItemSizes(True)
+        self.file_list_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.file_list_view.doubleClicked.connect(self.file_item_double_clicked)
         file_list_layout = QVBoxLayout()
         file_list_layout.setContentsMargins(0, 0, 0, 0)
-        file_list_layout.addWidget(self.file_list_widget)
+        file_list_layout.addWidget(self.file_list_view)
         file_list_container = QWidget()
         file_list_container.setLayout(file_list_layout)
         self.file_dock = QDockWidget(get_str('fileList'), self)
@@ -237,6 +279,9 @@ class MainWindow(QMainWindow, WindowMixin):
         open_dir = action(get_str('openDir'), self.open_dir_dialog,
                           'Ctrl+u', 'open', get_str('openDir'))
 
+        cancel_scan = action(get_str('cancelScan'), self.cancel_dir_scan,
+                             None, 'close', get_str('cancelScanDetail'), enabled=False)
+
         change_save_dir = action(get_str('changeSaveDir'), self.change_save_dir_dialog,
                                  'Ctrl+r', 'open', get_str('changeSavedAnnotationDir'))
 
@@ -250,6 +295,12 @@ class MainWindow(QMainWindow, WindowMixin):
         open_prev_image = action(get_str('prevImg'), self.open_prev_image,
                                  'a', 'prev', get_str('prevImgDetail'))
 
+        open_next_unannotated = action(get_str('nextUnannotatedImg'), self.open_next_unannotated_image,
+                                       'Ctrl+Shift+N', 'next', get_str('nextUnannotatedImgDetail'))
+
+        open_next_unverified = action(get_str('nextUnverifiedImg'), self.open_next_unverified_image,
+                                      'Ctrl+Shift+V', 'next', get_str('nextUnverifiedImgDetail'))
+
         verify = action(get_str('verifyImg'), self.verify_image,
                         'space', 'verify', get_str('verifyImgDetail'))
 
@@ -419,6 +470,7 @@ class MainWindow(QMainWindow, WindowMixin):
                       lightBrighten=light_brighten, lightDarken=light_darken, lightOrg=light_org,
                       lightActions=light_actions,
                       createBatch=create_batch,  # 批量创建动作
+                      cancelScan=cancel_scan,
                       hideSelected=hide_selected,  # 添加隐藏选中动作
                       fileMenuActions=(
                           open, open_dir, save, save_as, close, reset_all, quit),
@@ -453,6 +505,16 @@ class MainWindow(QMainWindow, WindowMixin):
         self.auto_saving = QAction(get_str('autoSaveMode'), self)
         self.auto_saving.setCheckable(True)
         self.auto_saving.setChecked(settings.get(SETTING_AUTO_SAVE, False))
+        # Flush annotation files to disk on save, slower but survives a power loss
+        self.sync_saves = QAction(get_str('syncSaves'), self)
+        self.sync_saves.setCheckable(True)
+        self.sync_saves.setChecked(settings.get(SETTING_FSYNC_SAVES, True))
+        self.sync_saves.toggled.connect(set_fsync)
+        set_fsync(self.sync_saves.isChecked())
+        # Debug overlay with the paint time of each canvas frame
+        self.show_paint_stats = QAction(get_str('showPaintStats'), self)
+        self.show_paint_stats.setCheckable(True)
+        self.show_paint_stats.toggled.connect(self.canvas.set_show_paint_stats)
         # Sync single class mode from PR#106
         self.single_class_mode = QAction(get_str('singleClsMode'), self)
         self.single_class_mode.setShortcut("Ctrl+Shift+C")  # 改为新的快捷键
@@ -467,10 +529,12 @@ class MainWindow(QMainWindow, WindowMixin):
         self.display_label_option.triggered.connect(self.toggle_paint_labels_option)
 
         add_actions(self.menus.file,
-                    (open, open_dir, change_save_dir, open_annotation, copy_prev_bounding, self.menus.recentFiles, save, save_format, save_as, close, reset_all, delete_image, quit))
+                    (open, open_dir, cancel_scan, change_save_dir, open_annotation, copy_prev_bounding, open_next_unannotated, open_next_unverified, self.menus.recentFiles, save, save_format, save_as, close, reset_all, delete_image, quit))
         add_actions(self.menus.help, (help_default, show_info, show_shortcut))
         add_actions(self.menus.view, (
             self.auto_saving,
+            self.sync_saves,
+            self.show_paint_stats,
             self.single_class_mode,
             self.display_label_option,
             labels, advanced_mode, None,
@@ -717,6 +781,7 @@ class MainWindow(QMainWindow, WindowMixin):
         self.file_path = None
         self.image_data = None
         self.label_file = None
+        self.saved_content = None
         self.canvas.reset_state()
         self.label_coordinates.clear()
         self.combo_box.cb.clear()
@@ -860,8 +925,9 @@ class MainWindow(QMainWindow, WindowMixin):
             self.set_dirty()
 
     # Tzutalin 20160906 : Add file list and dock to move faster
-    def file_item_double_clicked(self, item=None):
-        self.cur_img_idx = self.m_img_list.index(ustr(item.text()))
+    def file_item_double_clicked(self, index=None):
+        self.prefetcher.cancel()
+        self.cur_img_idx = index.row()
         filename = self.m_img_list[self.cur_img_idx]
         if filename:
             self.load_file(filename)
@@ -1017,7 +1083,7 @@ class MainWindow(QMainWindow, WindowMixin):
             self.combo_box.cb.setCurrentText(self.current_filter_label)
         self.is_user_selection = True
 
-    def save_labels(self, annotation_file_path):
+    def save_labels(self, annotation_file_path, asynchronous=False):
         print(f"\n[Debug] save_labels - Starting save process")
         print(f"[Debug] Current filter label: {self.current_filter_label}")
         print(f"[Debug] Total shapes on canvas: {len(self.canvas.shapes)}")
@@ -1040,33 +1106,93 @@ class MainWindow(QMainWindow, WindowMixin):
         print(f"[Debug] Saving {len(shapes)} shapes")
         for shape in self.canvas.shapes:
             print(f"[Debug] Saving shape with label: {shape.label}")
-            
+
+        label_file = self.label_file
+        class_list = self.label_hist
+        annotation_file_path = self.annotation_path_with_ext(annotation_file_path)
+        content = (os.path.abspath(annotation_file_path), self.content_digest(shapes))
+        if content == self.saved_content and os.path.exists(content[0]):
+            self.skipped_save_count += 1
+            print(f"[Debug] Skipped save, {content[0]} is unchanged "
+                  f"({self.save_count} saved, {self.skipped_save_count} skipped)")
+            return True
+        if asynchronous:
+            # 后台线程只使用快照，不访问界面状态
+            label_file = LabelFile()
+            label_file.verified = self.label_file.verified
+            if self.label_file_format == LabelFileFormat.YOLO:
+                # The YOLO writer appends unknown labels to the class list
+                for shape in shapes:
+                    if shape['label'] not in self.label_hist:
+                        self.label_hist.append(shape['label'])
+                class_list = list(self.label_hist)
+
         # Can add different annotation formats here
+        if self.label_file_format == LabelFileFormat.PASCAL_VOC:
+            save = partial(label_file.save_pascal_voc_format, annotation_file_path, shapes, self.file_path,
+                           self.image_data, self.line_color.getRgb(), self.fill_color.getRgb())
+        elif self.label_file_format == LabelFileFormat.YOLO:
+            save = partial(label_file.save_yolo_format, annotation_file_path, shapes, self.file_path,
+                           self.image_data, class_list, self.line_color.getRgb(), self.fill_color.getRgb())
+        elif self.label_file_format == LabelFileFormat.CREATE_ML:
+            save = partial(label_file.save_create_ml_format, annotation_file_path, shapes, self.file_path,
+                           self.image_data, class_list, self.line_color.getRgb(), self.fill_color.getRgb(),
+                           flush=False)
+        else:
+            save = partial(label_file.save, annotation_file_path, shapes, self.file_path, self.image_data,
+                           self.line_color.getRgb(), self.fill_color.getRgb())
+
+        self.save_count += 1
+        if asynchronous:
+            print(f"[Debug] Queued save to {annotation_file_path}")
+            # A failed write clears it again in annotation_save_failed
+            self.saved_content = content
+            self.save_queue.submit(annotation_file_path, self.file_path, save)
+            return True
         try:
-            if self.label_file_format == LabelFileFormat.PASCAL_VOC:
-                if annotation_file_path[-4:].lower() != ".xml":
-                    annotation_file_path += XML_EXT
-                self.label_file.save_pascal_voc_format(annotation_file_path, shapes, self.file_path, self.image_data,
-                                                       self.line_color.getRgb(), self.fill_color.getRgb())
-            elif self.label_file_format == LabelFileFormat.YOLO:
-                if annotation_file_path[-4:].lower() != ".txt":
-                    annotation_file_path += TXT_EXT
-                self.label_file.save_yolo_format(annotation_file_path, shapes, self.file_path, self.image_data, self.label_hist,
-                                                 self.line_color.getRgb(), self.fill_color.getRgb())
-            elif self.label_file_format == LabelFileFormat.CREATE_ML:
-                if annotation_file_path[-5:].lower() != ".json":
-                    annotation_file_path += JSON_EXT
-                self.label_file.save_create_ml_format(annotation_file_path, shapes, self.file_path, self.image_data,
-                                                      self.label_hist, self.line_color.getRgb(), self.fill_color.getRgb())
-            else:
-                self.label_file.save(annotation_file_path, shapes, self.file_path, self.image_data,
-                                     self.line_color.getRgb(), self.fill_color.getRgb())
+            save()
+            self.saved_content = content
+            if self.label_file_format == LabelFileFormat.CREATE_ML:
+                self.create_ml_flush_timer.start()
             print(f"[Debug] Successfully saved to {annotation_file_path}")
             return True
         except LabelFileError as e:
             self.error_message(u'Error saving label data', u'<b>%s</b>' % e)
             return False
 
+    def annotation_saved(self, image_path, annotation_path):
+        print(f"[Debug] Successfully saved to {annotation_path}")
+        if annotation_path.lower().endswith(JSON_EXT):
+            self.create_ml_flush_timer.start()
+        self.update_dataset_index(image_path)
+        self.statusBar().showMessage('Saved to  %s' % annotation_path)
+        self.statusBar().show()
+
+    def annotation_save_failed(self, annotation_path, message):
+        if self.saved_content is not None and self.saved_content[0] == os.path.abspath(annotation_path):
+            self.saved_content = None
+        self.error_message(u'Error saving label data', u'<b>%s</b><br/>%s' % (annotation_path, message))
+
+    def annotation_path_with_ext(self, annotation_file_path):
+        """The path save_labels writes to for annotation_file_path in the current format."""
+        ext = {LabelFileFormat.PASCAL_VOC: XML_EXT, LabelFileFormat.YOLO: TXT_EXT,
+               LabelFileFormat.CREATE_ML: JSON_EXT}.get(self.label_file_format)
+        if ext is not None and annotation_file_path[-len(ext):].lower() != ext:
+            annotation_file_path += ext
+        return annotation_file_path
+
+    def content_digest(self, shapes=None):
+        """
+        Cheap hash of what a save writes: the labels, points and difficult
+        flags of the shapes and the verified flag. Colors are not saved by
+        any format and are left out.
+        """
+        if shapes is None:
+            shapes = [dict(label=s.label, points=[(p.x(), p.y()) for p in s.points], difficult=s.difficult)
+                      for s in self.canvas.shapes]
+        verified = self.label_file.verified if self.label_file is not None else self.canvas.verified
+        return hash((bool(verified), tuple((s['label'], tuple(s['points']), bool(s['difficult'])) for s in shapes)))
+
     def copy_selected_shape(self):
         self.add_label(self.canvas.copy_selected_shape())
         # fix copy and delete
@@ -1282,14 +1408,18 @@ class MainWindow(QMainWindow, WindowMixin):
         unicode_file_path = os.path.abspath(unicode_file_path)
         # Tzutalin 20160906 : Add file list and dock to move faster
         # Highlight the file item
-        if unicode_file_path and self.file_list_widget.count() > 0:
-            if unicode_file_path in self.m_img_list:
-                index = self.m_img_list.index(unicode_file_path)
-                file_widget_item = self.file_list_widget.item(index)
-                file_widget_item.setSelected(True)
+        if unicode_file_path:
+            row = self.file_list_model.row_of(unicode_file_path)
+            if row >= 0:
+                self.file_list_view.setCurrentIndex(self.file_list_model.index(row))
             else:
-                self.file_list_widget.clear()
-                self.m_img_list.clear()
+                # 打开列表之外的文件时停止仍在进行的目录扫描，否则之后的批次会把旧目录的图片加回列表
+                self.cancel_dir_scan()
+                self.indexed_paths = set()
+                self.scanned_paths = set()
+                if len(self.file_list_model) > 0:
+                    self.file_list_model.clear()
+                    self.img_count = 0
 
         if unicode_file_path and os.path.exists(unicode_file_path):
             if LabelFile.is_label_file(unicode_file_path):
@@ -1310,7 +1440,7 @@ class MainWindow(QMainWindow, WindowMixin):
             else:
                 # Load image:
                 # read data first and store for saving into label file.
-                self.image_data = read(unicode_file_path, None)
+                self.image_data = self.read_cached_image(unicode_file_path)
                 self.label_file = None
                 self.canvas.verified = False
 
@@ -1326,7 +1456,7 @@ class MainWindow(QMainWindow, WindowMixin):
             self.status("Loaded %s" % os.path.basename(unicode_file_path))
             self.image = image
             self.file_path = unicode_file_path
-            self.canvas.load_pixmap(QPixmap.fromImage(image))
+            self.canvas.load_image(image)
             if self.label_file:
                 # 在加载标签之前，如果存在过滤标签，设置下拉框
                 if self.current_filter_label is not None:
@@ -1349,44 +1479,51 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.label_list.item(self.label_list.count() - 1).setSelected(True)
 
             self.canvas.setFocus(True)
+            self.prefetch_neighbour_images()
             return True
         return False
 
+    def prefetch_neighbour_images(self):
+        """Start decoding the images around the current one in the background."""
+        idx = self.cur_img_idx
+        if 0 <= idx < len(self.m_img_list) and self.m_img_list[idx] == self.file_path:
+            self.prefetcher.prefetch(self.m_img_list, idx)
+
+    def read_cached_image(self, file_path):
+        """Return the decoded image for file_path, from the image cache if possible."""
+        image = self.image_cache.get(file_path)
+        if image is None:
+            image = read(file_path, None)
+            if image is not None:
+                self.image_cache.put(file_path, image)
+        print(f"[Debug] Image cache {self.image_cache.stats()}")
+        return image
+
     def counter_str(self):
         """
         Converts image counter to string representation.
         """
         return '[{} / {}]'.format(self.cur_img_idx + 1, self.img_count)
 
-    def show_bounding_box_from_annotation_file(self, file_path):
-        if self.default_save_dir is not None:
-            basename = os.path.basename(os.path.splitext(file_path)[0])
-            xml_path = os.path.join(self.default_save_dir, basename + XML_EXT)
-            txt_path = os.path.join(self.default_save_dir, basename + TXT_EXT)
-            json_path = os.path.join(self.default_save_dir, basename + JSON_EXT)
-
-            """Annotation file priority:
-            PascalXML > YOLO
-            """
-            if os.path.isfile(xml_path):
-                self.load_pascal_xml_by_filename(xml_path)
-            elif os.path.isfile(txt_path):
-                self.load_yolo_txt_by_filename(txt_path)
-            elif os.path.isfile(json_path):
-                self.load_create_ml_json_by_filename(json_path, file_path)
-
-        else:
-            xml_path = os.path.splitext(file_path)[0] + XML_EXT
-            txt_path = os.path.splitext(file_path)[0] + TXT_EXT
-            json_path = os.path.splitext(file_path)[0] + JSON_EXT
-
-            if os.path.isfile(xml_path):
-                self.load_pascal_xml_by_filename(xml_path)
-            elif os.path.isfile(txt_path):
-                self.load_yolo_txt_by_filename(txt_path)
-            elif os.path.isfile(json_path):
-                self.load_create_ml_json_by_filename(json_path, file_path)
-            
+    def show_bounding_box_from_annotation_file(self, file_path, image=None):
+        """Annotation file priority:
+        PascalXML > YOLO > CreateML
+        """
+        # Read back what a queued autosave of this image is writing
+        self.save_queue.wait_for_image(file_path)
+        annotation = find_annotation(file_path, self.default_save_dir)
+        if annotation is None:
+            return
+        annotation_path, annotation_format, _ = annotation
+        if annotation_format == FORMAT_PASCALVOC:
+            self.load_pascal_xml_by_filename(annotation_path)
+        elif annotation_format == FORMAT_YOLO:
+            self.load_yolo_txt_by_filename(annotation_path, image)
+        elif annotation_format == FORMAT_CREATEML:
+            self.load_create_ml_json_by_filename(annotation_path, file_path)
+        if file_path == self.file_path:
+            # 记录文件中已有的内容，未修改时保存可以跳过
+            self.saved_content = (os.path.abspath(annotation_path), self.content_digest())
 
     def resizeEvent(self, event):
         if self.canvas and not self.image.isNull()\
@@ -1426,6 +1563,17 @@ class MainWindow(QMainWindow, WindowMixin):
     def closeEvent(self, event):
         if not self.may_continue():
             event.ignore()
+            # 用户取消关闭时窗口仍然可用，不能停止后台线程
+            return
+        self.prefetcher.shutdown()
+        self.save_queue.shutdown()
+        if self.dir_scanner is not None:
+            scanner = self.dir_scanner
+            self.cancel_dir_scan()
+            scanner.wait()
+        self.close_dataset_index()
+        self.create_ml_flush_timer.stop()
+        self.flush_create_ml_stores()
         settings = self.settings
         # If it loads images from dir, don't load it at the beginning
         if self.dir_name is None:
@@ -1451,29 +1599,24 @@ class MainWindow(QMainWindow, WindowMixin):
             settings[SETTING_LAST_OPEN_DIR] = ''
 
         settings[SETTING_AUTO_SAVE] = self.auto_saving.isChecked()
+        settings[SETTING_FSYNC_SAVES] = self.sync_saves.isChecked()
         settings[SETTING_SINGLE_CLASS] = self.single_class_mode.isChecked()
         settings[SETTING_PAINT_LABEL] = self.display_label_option.isChecked()
         settings[SETTING_DRAW_SQUARE] = self.draw_squares_option.isChecked()
         settings[SETTING_LABEL_FILE_FORMAT] = self.label_file_format
+        settings[SETTING_IMAGE_CACHE_MB] = self.image_cache.budget_bytes // (1024 * 1024)
         settings.save()
 
+    def flush_create_ml_stores(self):
+        try:
+            create_ml_stores.flush()
+        except (OSError, ValueError) as e:
+            self.error_message(u'Error saving label data', u'<b>%s</b>' % e)
+
     def load_recent(self, filename):
         if self.may_continue():
             self.load_file(filename)
 
-    def scan_all_images(self, folder_path):
-        extensions = ['.%s' % fmt.data().decode("ascii").lower() for fmt in QImageReader.supportedImageFormats()]
-        images = []
-
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relative_path = os.path.join(root, file)
-                    path = ustr(os.path.abspath(relative_path))
-                    images.append(path)
-        natural_sort(images, key=lambda x: x.lower())
-        return images
-
     def change_save_dir_dialog(self, _value=False):
         if isinstance(_value, str) and os.path.isdir(_value):
             # If a valid directory path is provided, use it directly
@@ -1496,6 +1639,10 @@ class MainWindow(QMainWindow, WindowMixin):
 
         if dir_path is not None and len(dir_path) > 1:
             self.default_save_dir = dir_path
+            # The index lives next to the annotations
+            if self.dir_name and self.dir_scanner is None:
+                self.open_dataset_index(self.dir_name)
+                self.start_dataset_indexer()
 
         self.show_bounding_box_from_annotation_file(self.file_path)
 
@@ -1567,13 +1714,181 @@ class MainWindow(QMainWindow, WindowMixin):
         self.last_open_dir = dir_path
         self.dir_name = dir_path
         self.file_path = None
-        self.file_list_widget.clear()
-        self.m_img_list = self.scan_all_images(dir_path)
+        self.file_list_model.clear()
+        self.img_count = 0
+        # Show what the index knows about the directory right away, the scan
+        # below then only adds new images and drops the ones that are gone
+        self.open_dataset_index(dir_path)
+        self.indexed_paths = set()
+        self.scanned_paths = set()
+        if self.dataset_index is not None:
+            self.indexed_paths = set(self.dataset_index.paths_in_dir(dir_path))
+            if self.indexed_paths:
+                self.merge_image_paths(list(self.indexed_paths))
+                self.open_next_image()
+        self.start_dir_scan(dir_path)
+
+    def start_dir_scan(self, dir_path):
+        """Scan dir_path on a worker thread; images show up as they are found."""
+        self.cancel_dir_scan()
+        extensions = ['.%s' % fmt.data().decode("ascii").lower() for fmt in QImageReader.supportedImageFormats()]
+        scanner = DirectoryScanner(dir_path, extensions, parent=self)
+        scanner.found.connect(partial(self.add_scanned_images, scanner))
+        scanner.finished.connect(partial(self.dir_scan_finished, scanner))
+        self.dir_scanner = scanner
+        self.actions.cancelScan.setEnabled(True)
+        self.status('Scanning %s ...' % dir_path, 0)
+        scanner.start()
+
+    def cancel_dir_scan(self, _value=False):
+        scanner = self.dir_scanner
+        if scanner is not None:
+            scanner.cancel()
+            self.dir_scanner = None
+            self.actions.cancelScan.setEnabled(False)
+            self.status('Scan cancelled, %d images found' % self.img_count)
+
+    def add_scanned_images(self, scanner, paths):
+        if scanner is not self.dir_scanner:
+            return
+        if self.indexed_paths:
+            self.scanned_paths.update(paths)
+            paths = [path for path in paths if path not in self.indexed_paths]
+            if not paths:
+                return
+        first_batch = not self.m_img_list
+        self.merge_image_paths(paths)
+        self.status('Scanning %s: %d images found' % (scanner.dir_path, self.img_count), 0)
+        if first_batch and self.file_path is None:
+            self.open_next_image()
+        elif self.file_path is not None:
+            self.setWindowTitle(__appname__ + ' ' + self.file_path + ' ' + self.counter_str())
+
+    def merge_image_paths(self, paths):
+        """Merge paths into the sorted image list, keeping cur_img_idx on the open image."""
+        positions = self.file_list_model.insert_sorted(paths)
         self.img_count = len(self.m_img_list)
-        self.open_next_image()
-        for imgPath in self.m_img_list:
-            item = QListWidgetItem(imgPath)
-            self.file_list_widget.addItem(item)
+        if self.file_path is not None:
+            self.cur_img_idx += bisect.bisect_right(positions, self.cur_img_idx)
+            # Keep the open image highlighted without scrolling the list
+            self.file_list_view.selectionModel().select(self.file_list_model.index(self.cur_img_idx),
+                                                        QItemSelectionModel.ClearAndSelect)
+
+    def dir_scan_finished(self, scanner):
+        scanner.deleteLater()
+        if scanner is not self.dir_scanner:
+            return
+        self.dir_scanner = None
+        self.file_list_model.release_sort_keys()
+        self.actions.cancelScan.setEnabled(False)
+        if self.indexed_paths and not scanner.is_cancelled():
+            self.remove_stale_images(self.indexed_paths - self.scanned_paths)
+        self.indexed_paths = set()
+        self.scanned_paths = set()
+        self.status('Found %d images in %s' % (self.img_count, scanner.dir_path))
+        self.start_dataset_indexer()
+
+    def remove_stale_images(self, stale_paths):
+        """Drop indexed images that the scan did not find anymore."""
+        if not stale_paths:
+            return
+        for path in stale_paths:
+            row = self.file_list_model.row_of(path)
+            if row >= 0:
+                self.file_list_model.remove_row(row)
+                if row < self.cur_img_idx:
+                    self.cur_img_idx -= 1
+        self.img_count = len(self.m_img_list)
+        if self.dataset_index_writer is not None:
+            self.dataset_index_writer.remove(stale_paths)
+        if self.file_path in stale_paths:
+            self.file_path = None
+            self.cur_img_idx = 0
+            if self.m_img_list:
+                self.open_next_image()
+            else:
+                self.close_file()
+        elif self.file_path is not None:
+            self.setWindowTitle(__appname__ + ' ' + self.file_path + ' ' + self.counter_str())
+
+    def open_dataset_index(self, dir_path):
+        self.close_dataset_index()
+        db_path = DatasetIndex.path_for(dir_path, self.default_save_dir)
+        try:
+            self.dataset_index = DatasetIndex(db_path)
+        except (sqlite3.Error, OSError) as e:
+            # e.g. a read-only save dir: work without the index
+            print(f"[Debug] Cannot open dataset index {db_path}: {e}")
+            self.dataset_index = None
+            return
+        # 保存后的索引更新在后台线程写入，避免界面等待SQLite写锁
+        self.dataset_index_writer = DatasetIndexWriter(db_path, parent=self)
+
+    def close_dataset_index(self):
+        if self.dataset_indexer is not None:
+            self.dataset_indexer.cancel()
+            self.dataset_indexer.wait()
+            self.dataset_indexer = None
+        if self.dataset_index_writer is not None:
+            self.dataset_index_writer.shutdown()
+            self.dataset_index_writer = None
+        if self.dataset_index is not None:
+            self.dataset_index.close()
+            self.dataset_index = None
+
+    def start_dataset_indexer(self):
+        """Bring the index of the image list up to date on a worker thread."""
+        if self.dataset_index is None or not self.m_img_list:
+            return
+        if self.dataset_indexer is not None:
+            self.dataset_indexer.cancel()
+            self.dataset_indexer.wait()
+        indexer = DatasetIndexer(self.dataset_index.db_path, self.m_img_list, self.default_save_dir, parent=self)
+        indexer.refreshed.connect(self.dataset_index_refreshed)
+        indexer.finished.connect(partial(self.dataset_indexer_finished, indexer))
+        self.dataset_indexer = indexer
+        indexer.start()
+
+    def dataset_index_refreshed(self, count):
+        if count:
+            print(f"[Debug] Dataset index: {count} entries updated")
+
+    def dataset_indexer_finished(self, indexer):
+        indexer.deleteLater()
+        if indexer is self.dataset_indexer:
+            self.dataset_indexer = None
+
+    def update_dataset_index(self, file_path):
+        if self.dataset_index_writer is None or not file_path:
+            return
+        self.dataset_index_writer.update(file_path, self.default_save_dir)
+
+    def open_next_unannotated_image(self, _value=False):
+        self.open_next_indexed_image(lambda index: index.unannotated_paths(), 'unannotated')
+
+    def open_next_unverified_image(self, _value=False):
+        self.open_next_indexed_image(lambda index: index.unverified_paths(), 'unverified')
+
+    def open_next_indexed_image(self, query, description):
+        """Open the first image after the current one that is in the set returned by query(index)."""
+        if self.dataset_index is None or not self.m_img_list:
+            return
+        if self.auto_saving.isChecked() and self.default_save_dir is not None and self.dirty is True:
+            self.save_file(asynchronous=True)
+        if not self.may_continue():
+            return
+        try:
+            candidates = query(self.dataset_index)
+        except sqlite3.Error as e:
+            print(f"[Debug] Dataset index query failed: {e}")
+            return
+        start = self.cur_img_idx + 1 if self.file_path is not None else 0
+        for row in range(start, len(self.m_img_list)):
+            if self.m_img_list[row] in candidates:
+                self.cur_img_idx = row
+                self.load_file(self.m_img_list[row])
+                return
+        self.status('No %s image after the current one' % description)
 
     def verify_image(self, _value=False):
         # Proceeding next image without dialog if having any label
@@ -1601,7 +1916,7 @@ class MainWindow(QMainWindow, WindowMixin):
             if self.default_save_dir is not None:
                 if self.dirty is True:
                     print("[Debug] Auto-saving before loading previous image")
-                    self.save_file()
+                    self.save_file(asynchronous=True)
             else:
                 self.change_save_dir_dialog()
                 return
@@ -1633,7 +1948,7 @@ class MainWindow(QMainWindow, WindowMixin):
             if self.default_save_dir is not None:
                 if self.dirty is True:
                     print("[Debug] Auto-saving before loading next image")
-                    self.save_file()
+                    self.save_file(asynchronous=True)
             else:
                 self.change_save_dir_dialog()
                 return
@@ -1677,20 +1992,20 @@ class MainWindow(QMainWindow, WindowMixin):
             self.img_count = 1
             self.load_file(filename)
 
-    def save_file(self, _value=False):
+    def save_file(self, _value=False, asynchronous=False):
         if self.default_save_dir is not None and len(ustr(self.default_save_dir)):
             if self.file_path:
                 image_file_name = os.path.basename(self.file_path)
                 saved_file_name = os.path.splitext(image_file_name)[0]
                 saved_path = os.path.join(ustr(self.default_save_dir), saved_file_name)
-                self._save_file(saved_path)
+                self._save_file(saved_path, asynchronous)
         else:
             image_file_dir = os.path.dirname(self.file_path)
             image_file_name = os.path.basename(self.file_path)
             saved_file_name = os.path.splitext(image_file_name)[0]
             saved_path = os.path.join(image_file_dir, saved_file_name)
             self._save_file(saved_path if self.label_file
-                            else self.save_file_dialog(remove_ext=False))
+                            else self.save_file_dialog(remove_ext=False), asynchronous)
 
     def save_file_as(self, _value=False):
         assert not self.image.isNull(), "cannot save empty image"
@@ -1714,9 +2029,13 @@ class MainWindow(QMainWindow, WindowMixin):
                 return full_file_path
         return ''
 
-    def _save_file(self, annotation_file_path):
-        if annotation_file_path and self.save_labels(annotation_file_path):
+    def _save_file(self, annotation_file_path, asynchronous=False):
+        if annotation_file_path and self.save_labels(annotation_file_path, asynchronous):
             self.set_clean()
+            if asynchronous:
+                # The status and the dataset index are updated by annotation_saved
+                return
+            self.update_dataset_index(self.file_path)
             self.statusBar().showMessage('Saved to  %s' % annotation_file_path)
             self.statusBar().show()
 
@@ -1733,6 +2052,8 @@ class MainWindow(QMainWindow, WindowMixin):
         delete_path = self.file_path
         if delete_path is not None:
             idx = self.cur_img_idx
+            # A queued save would write the annotation again after it is removed
+            self.save_queue.wait_for_image(delete_path)
             if os.path.exists(delete_path):
                 # Delete the image file
                 os.remove(delete_path)
@@ -1754,14 +2075,21 @@ class MainWindow(QMainWindow, WindowMixin):
                     for f in [xml_file_def, txt_file_def, json_file_def]:
                         if os.path.exists(f):
                             os.remove(f)
+                    create_ml_stores.discard(json_file_def)
 
                 # Try to remove annotation files from image directory
                 for f in [xml_file, txt_file, json_file]:
                     if os.path.exists(f):
                         os.remove(f)
-
-            self.import_dir_images(self.last_open_dir)
-            if self.img_count > 0:
+                create_ml_stores.discard(json_file)
+
+            if self.dataset_index_writer is not None:
+                self.dataset_index_writer.remove([delete_path])
+            row = self.file_list_model.row_of(delete_path)
+            if row >= 0:
+                self.file_list_model.remove_row(row)
+                self.img_count = len(self.m_img_list)
+            if self.m_img_list:
                 self.cur_img_idx = min(idx, self.img_count - 1)
                 filename = self.m_img_list[self.cur_img_idx]
                 self.load_file(filename)
@@ -1871,18 +2199,22 @@ class MainWindow(QMainWindow, WindowMixin):
         self.set_format(FORMAT_PASCALVOC)
 
         t_voc_parse_reader = PascalVocReader(xml_path)
+        if t_voc_parse_reader.parse_error is not None:
+            self.error_message(u'Error opening file',
+                               u'<b>%s</b><br/>%s' % (xml_path, t_voc_parse_reader.parse_error))
         shapes = t_voc_parse_reader.get_shapes()
         self.load_labels(shapes)
         self.canvas.verified = t_voc_parse_reader.verified
 
-    def load_yolo_txt_by_filename(self, txt_path):
+    def load_yolo_txt_by_filename(self, txt_path, image=None):
         if self.file_path is None:
             return
         if os.path.isfile(txt_path) is False:
             return
 
         self.set_format(FORMAT_YOLO)
-        t_yolo_parse_reader = YoloReader(txt_path, self.image)
+        # YOLO boxes are relative to the size of the image they were made for
+        t_yolo_parse_reader = YoloReader(txt_path, image if image is not None else self.image)
         shapes = t_yolo_parse_reader.get_shapes()
         #print(shapes)
         self.load_labels(shapes)
@@ -1902,10 +2234,10 @@ class MainWindow(QMainWindow, WindowMixin):
         self.canvas.verified = create_ml_parse_reader.verified
 
     def copy_previous_bounding_boxes(self):
-        current_index = self.m_img_list.index(self.file_path)
+        current_index = self.file_list_model.row_of(self.file_path)
         if current_index - 1 >= 0:
             prev_file_path = self.m_img_list[current_index - 1]
-            self.show_bounding_box_from_annotation_file(prev_file_path)
+            self.show_bounding_box_from_annotation_file(prev_file_path, self.read_cached_image(prev_file_path))
             self.save_file()
 
     def toggle_paint_labels_option(self):
@@ -1990,9 +2322,7 @@ class MainWindow(QMainWindow, WindowMixin):
             # 如果组合框为空，移动所有选中的项；否则只移动匹配当前标签的选中项
             if is_checked and (not current_label or shape.label == current_label):
                 # 移动形状的所有点
-                for point in shape.points:
-                    point.setX(point.x() + dx)
-                    point.setY(point.y() + dy)
+                shape.move_by(QPointF(dx, dy))
                 moved = True
         
         if moved:
@@ -2126,9 +2456,7 @@ def inverted(color):
 
 def read(filename, default=None):
     try:
-        reader = QImageReader(filename)
-        reader.setAutoTransform(True)
-        return reader.read()
+        return decode_image(filename)
     except:
         return default
 
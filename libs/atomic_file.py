@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Crash-safe file replacement for the annotation writers.
+
+atomic_write() writes to a temporary file in the directory of the target
+and renames it over the target with os.replace, so readers and a crash at
+any point see either the old or the new file, never a truncated one. With
+fsync enabled the data (and on POSIX the directory entry) is flushed to disk
+before the call returns, which makes the new file survive a power loss at
+the cost of a much slower save.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Default of atomic_write(fsync=None), see set_fsync()
+_fsync = True
+
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Mode of new files, as open() would create them
+_NEW_FILE_MODE = 0o666 & ~_current_umask()
+
+
+def set_fsync(enabled):
+    """Set whether atomic_write() flushes the file to disk by default."""
+    global _fsync
+    _fsync = bool(enabled)
+
+
+def fsync_enabled():
+    return _fsync
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding=None, fsync=None):
+    """
+    Open a temporary file to write the contents of path to. When the block
+    ends without an exception the file replaces path; otherwise it is
+    removed and path is left untouched. fsync=None uses the set_fsync()
+    default.
+    """
+    fsync = _fsync if fsync is None else fsync
+    dir_name, base_name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % base_name, suffix='.tmp', dir=dir_name)
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as file:
+            yield file
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+        try:
+            mode_bits = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode_bits = _NEW_FILE_MODE
+        os.chmod(tmp_path, mode_bits)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(dir_name)
+
+
+def _fsync_dir(dir_name):
+    # Makes the rename itself durable; directories cannot be opened on Windows
+    if os.name != 'posix':
+        return
+    fd = os.open(dir_name, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -1,3 +1,6 @@
+import math
+import time
+
 try:
     from PyQt5.QtGui import *
     from PyQt5.QtCore import *
@@ -9,6 +12,9 @@ except ImportError:
 # from PyQt4.QtOpenGL import *
 
 from libs.shape import Shape
+from libs.content_shrink import MIN_CONTENT_PIXELS, ContentMaskCache
+from libs.spatial_index import ShapeGrid
+from libs.image_pyramid import ImagePyramid, use_pyramid
 from libs.utils import distance
 from PyQt5.QtCore import pyqtSignal
 CURSOR_DEFAULT = Qt.ArrowCursor
@@ -49,6 +55,8 @@ class Canvas(QWidget):
         self.offsets = QPointF(), QPointF()
         self.scale = 1.0
         self.overlay_color = None
+        self._overlay_pixmap = None  # 叠加亮度后的图片缓存
+        self._overlay_key = None  # (图片cacheKey, 叠加颜色)
         self.label_font_size = 8
         self.pixmap = QPixmap()
         self.visible = {}
@@ -66,6 +74,13 @@ class Canvas(QWidget):
         self.verified = False
         self.draw_square = False
         self.content_threshold = 200  # 新增内容像素灰度阈值
+        self.content_cache = ContentMaskCache()  # 当前图片的灰度缓存及积分图
+        self.shape_index = ShapeGrid()  # shape外接矩形的网格索引，用于命中测试
+        self.show_paint_stats = False  # 是否在左上角显示绘制耗时
+        self.paint_stats = (0.0, 0, 0)  # 上一帧的 (耗时ms, 绘制的shape数, 可见shape总数)
+        self._label_widths = {}  # 标签文字宽度缓存
+        self.batch_paint = True  # 未选中、未高亮的shapes按颜色分组成批绘制
+        self._vertex_sprites = {}  # 顶点标记的预渲染小图
         # initialisation for panning
         self.pan_initial_pos = QPoint()
 
@@ -95,6 +110,19 @@ class Canvas(QWidget):
     def isVisible(self, shape):
         return shape.visible
 
+    def indexed_shapes(self):
+        """返回网格索引；self.shapes被外部直接修改过时重建索引"""
+        index = self.shape_index
+        if index.source is not self.shapes or len(index) != len(self.shapes) \
+                or (self.shapes and self.shapes[-1] not in index):
+            index.rebuild(self.shapes)
+        return index
+
+    def shapes_at(self, pos, radius=0.0):
+        """pos附近(外接矩形距离不超过radius)的可见shapes，从上到下排列"""
+        candidates = self.indexed_shapes().query_point(pos.x(), pos.y(), radius)
+        return [s for s in reversed(candidates) if self.isVisible(s)]
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -224,7 +252,7 @@ class Canvas(QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip("Image")
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        for shape in self.shapes_at(pos, self.epsilon):
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
             index = shape.nearest_vertex(pos, self.epsilon)
@@ -317,8 +345,10 @@ class Canvas(QWidget):
                 for shape in self.selected_shapes:
                     shape.selected = False
                 self.selected_shapes.clear()
-                # 选中框内的可见shapes
-                for shape in self.shapes:
+                # 选中框内的可见shapes，只检查外接矩形与选择框相交的shapes
+                box = self.selection_box.normalized()
+                candidates = self.indexed_shapes().query_rect(box.left(), box.top(), box.right(), box.bottom())
+                for shape in candidates:
                     # 使用isVisible方法检查shape是否可见且在选择框内
                     if self.isVisible(shape) and self.is_shape_in_box(shape, self.selection_box):
                         self.selected_shapes.append(shape)
@@ -374,6 +404,7 @@ class Canvas(QWidget):
         # del shape.line_color
         if copy:
             self.shapes.append(shape)
+            self.shape_index.insert(shape)
             self.selected_shape.selected = False
             self.selected_shape = shape
             self.repaint()
@@ -444,8 +475,8 @@ class Canvas(QWidget):
             self.select_shape(shape)
             return self.h_vertex
         
-        for shape in reversed(self.shapes):
-            if self.isVisible(shape) and shape.contains_point(point):
+        for shape in self.shapes_at(point):
+            if shape.contains_point(point):
                 self.select_shape(shape)
                 self.calculate_offsets(shape, point)
                 return shape
@@ -546,6 +577,7 @@ class Canvas(QWidget):
             for shape in self.selected_shapes:
                 if shape in self.shapes:
                     self.shapes.remove(shape)
+                    self.shape_index.remove(shape)
                     deleted.append(shape)
             self.selected_shapes.clear()
             self.selected_shape = None
@@ -554,6 +586,7 @@ class Canvas(QWidget):
             shape = self.selected_shape
             if shape in self.shapes:
                 self.shapes.remove(shape)
+                self.shape_index.remove(shape)
                 self.selected_shape = None
                 deleted.append(shape)
                 self.update()
@@ -564,6 +597,7 @@ class Canvas(QWidget):
             shape = self.selected_shape.copy()
             self.deselect_shape()
             self.shapes.append(shape)
+            self.shape_index.insert(shape)
             shape.selected = True
             self.selected_shape = shape
             self.bounded_shift_shape(shape)
@@ -579,10 +613,125 @@ class Canvas(QWidget):
         if not self.bounded_move_shape(shape, point - offset):
             self.bounded_move_shape(shape, point + offset)
 
+    def exposed_rect(self, event):
+        """需要重绘的区域在图像坐标系中的矩形"""
+        rect = event.rect()
+        return QRectF(self.transform_pos(QPointF(rect.left(), rect.top())),
+                      self.transform_pos(QPointF(rect.right() + 1, rect.bottom() + 1)))
+
+    def paint_rect(self, event):
+        """把需要重绘的区域转换为图像坐标，并按顶点、线宽和标签文字向外扩展"""
+        rect = self.exposed_rect(event)
+        top_left, bottom_right = rect.topLeft(), rect.bottomRight()
+        # 高亮顶点的直径为4倍point_size，线宽为2个屏幕像素
+        margin = (2 * Shape.point_size + 2) / self.scale
+        left = top = bottom = margin
+        labels = {s.label for s in self.shapes if s.paint_label}
+        if labels:
+            # 标签从外接矩形左上角向右上方绘制，所以下方和左侧的shape也可能画进重绘区域；
+            # 靠近图片顶部的shape标签会下移1.25倍字号，可能画进其下方的区域
+            font = QFont()
+            font.setPointSize(self.label_font_size)
+            font.setBold(True)
+            metrics = QFontMetricsF(font)
+            for label in labels:
+                key = (label, self.label_font_size)
+                if key not in self._label_widths:
+                    self._label_widths[key] = metrics.width(label or '')
+            left += max(self._label_widths[(label, self.label_font_size)] for label in labels)
+            bottom += metrics.height()
+            top += 1.25 * self.label_font_size + metrics.descent()
+        return (top_left.x() - left, top_left.y() - top,
+                bottom_right.x() + margin, bottom_right.y() + bottom)
+
+    def paint_batch(self, p, shapes):
+        """按(线条颜色, 填充颜色, 线宽)分组绘制未选中、未高亮的shapes。
+        每组的矩形用一次drawRects画出，顶点用预渲染的小图一次drawPixmapFragments画出"""
+        width = max(1, int(round(2.0 / self.scale)))
+        groups = {}
+        for shape in shapes:
+            if not shape.points:
+                continue
+            key = (shape.line_color.rgba(), shape.fill_color.rgba(), width)
+            group = groups.get(key)
+            if group is None:
+                sprite = self.vertex_sprite(shape.line_color, width)
+                group = groups[key] = (shape.line_color, sprite, [], [], [], [])
+            _, (_, source, scale), rects, paths, fragments, labels = group
+            if shape.is_closed() and shape.is_axis_aligned_rect():
+                rects.append(shape.bounding_rect())
+            else:
+                paths.append(shape.line_path())
+            fragments.extend(shape.vertex_fragments(source, scale))
+            if shape.paint_label:
+                labels.append(shape)
+
+        p.setBrush(Qt.NoBrush)
+        for color, (sprite, _, _), rects, paths, fragments, labels in groups.values():
+            pen = QPen(color)
+            pen.setWidth(width)
+            p.setPen(pen)
+            if rects:
+                p.drawRects(rects)
+            for path in paths:
+                p.drawPath(path)
+            p.drawPixmapFragments(fragments, sprite)
+            for shape in labels:
+                shape.draw_label(p)
+
+    def vertex_sprite(self, line_color, width):
+        """按设备像素渲染的未高亮顶点标记，返回 (小图, 源矩形, 绘制时的缩放)"""
+        device_scale = self.scale * self.devicePixelRatioF()
+        key = (line_color.rgba(), width, device_scale, Shape.point_size, Shape.point_type,
+               Shape.vertex_fill_color.rgba())
+        sprite = self._vertex_sprites.get(key)
+        if sprite is None:
+            if len(self._vertex_sprites) > 64:  # 缩放变化后旧的小图不再使用
+                self._vertex_sprites.clear()
+            # 与Shape.draw_vertex相同的大小：直径point_size/scale，描边宽度width
+            d = Shape.point_size / self.scale * device_scale
+            pen_width = width * device_scale
+            size = int(math.ceil(d + pen_width)) + 2
+            pixmap = QPixmap(size, size)
+            pixmap.fill(Qt.transparent)
+            path = QPainterPath()
+            center = QPointF(size / 2.0, size / 2.0)
+            if Shape.point_type == Shape.P_SQUARE:
+                path.addRect(center.x() - d / 2, center.y() - d / 2, d, d)
+            else:
+                path.addEllipse(center, d / 2.0, d / 2.0)
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing)
+            pen = QPen(line_color)
+            pen.setWidthF(pen_width)
+            painter.setPen(pen)
+            painter.drawPath(path)
+            painter.fillPath(path, Shape.vertex_fill_color)
+            painter.end()
+            sprite = self._vertex_sprites[key] = (pixmap, QRectF(0, 0, size, size), 1.0 / device_scale)
+        return sprite
+
+    def overlay_pixmap(self):
+        """返回叠加了亮度颜色的图片；只在图片或亮度变化时重新合成，而不是每次重绘都复制整张图片"""
+        if not self.overlay_color:
+            self._overlay_pixmap = self._overlay_key = None
+            return self.pixmap
+        key = (self.pixmap.cacheKey(), self.overlay_color.rgba())
+        if key != self._overlay_key:
+            self._overlay_pixmap = None  # 先释放旧的缓存再分配新的
+            temp = QPixmap(self.pixmap)
+            painter = QPainter(temp)
+            painter.setCompositionMode(painter.CompositionMode_Overlay)
+            painter.fillRect(temp.rect(), self.overlay_color)
+            painter.end()
+            self._overlay_pixmap, self._overlay_key = temp, key
+        return self._overlay_pixmap
+
     def paintEvent(self, event):
         if not self.pixmap:
             return super(Canvas, self).paintEvent(event)
 
+        start = time.perf_counter()
         p = self._painter
         p.begin(self)
         p.setRenderHint(QPainter.Antialiasing)
@@ -592,31 +741,44 @@ class Canvas(QWidget):
         p.scale(self.scale, self.scale)
         p.translate(self.offset_to_center())
 
-        temp = self.pixmap
-        if self.overlay_color:
-            temp = QPixmap(self.pixmap)
-            painter = QPainter(temp)
-            painter.setCompositionMode(painter.CompositionMode_Overlay)
-            painter.fillRect(temp.rect(), self.overlay_color)
-            painter.end()
-
-        p.drawPixmap(0, 0, temp)
+        if isinstance(self.pixmap, ImagePyramid):
+            # 超大图片只绘制可见的图块，缩小时使用金字塔中分辨率合适的层
+            self.pixmap.draw(p, self.exposed_rect(event), self.scale * self.devicePixelRatioF(), self.overlay_color)
+        else:
+            p.drawPixmap(0, 0, self.overlay_pixmap())
         Shape.scale = self.scale
         Shape.label_font_size = self.label_font_size
 
+        # 只绘制与重绘区域相交的shapes
+        exposed = self.indexed_shapes().query_rect(*self.paint_rect(event))
+        selected = set(self.selected_shapes)
+        painted = 0
+
         # 先绘制所有未选中的shapes
-        for shape in self.shapes:
+        batch, single = [], []
+        for shape in exposed:
             if not shape.visible:  # 跳过不可见的形状
                 continue
-            if shape not in self.selected_shapes:  # 只绘制未选中的
+            if shape not in selected:  # 只绘制未选中的
                 shape.fill = shape.selected or shape == self.h_shape
-                shape.paint(p)
+                if self.batch_paint and not shape.fill:
+                    batch.append(shape)
+                else:
+                    single.append(shape)
+        # 成批绘制的shapes先画，高亮的shape逐个绘制，显示在它们上面
+        if batch:
+            self.paint_batch(p, batch)
+        for shape in single:
+            shape.paint(p)
+        painted += len(batch) + len(single)
 
         # 再绘制选中的shapes，确保它们在最上层
+        exposed = set(exposed)
         for shape in self.selected_shapes:
-            if shape.visible:  # 只绘制可见的形状
+            if shape.visible and shape in exposed:  # 只绘制可见的形状
                 shape.fill = True  # 选中的shape填充显示
                 shape.paint(p)
+                painted += 1
 
         # 绘制当前正在创建的shape
         if self.current:
@@ -635,8 +797,32 @@ class Canvas(QWidget):
         for shape in self.preview_shapes:
             shape.paint(p)
 
+        if self.show_paint_stats:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.paint_stats = (elapsed, painted, sum(1 for s in self.shapes if s.visible))
+            self.paint_stats_overlay(p)
+
         p.end()
 
+    def paint_stats_overlay(self, p):
+        """在可见区域左上角显示本帧的绘制耗时和shape数量"""
+        elapsed, painted, total = self.paint_stats
+        p.resetTransform()
+        origin = self.visibleRegion().boundingRect().topLeft()
+        text = 'paint %.1f ms  shapes %d/%d' % (elapsed, painted, total)
+        font = QFont()
+        font.setPointSize(9)
+        p.setFont(font)
+        rect = QRectF(QFontMetricsF(font).boundingRect(text)).adjusted(-4, -2, 4, 2)
+        rect.moveTopLeft(QPointF(origin) + QPointF(4, 4))
+        p.fillRect(rect, QColor(0, 0, 0, 160))
+        p.setPen(QColor(255, 255, 255))
+        p.drawText(rect, Qt.AlignCenter, text)
+
+    def set_show_paint_stats(self, value):
+        self.show_paint_stats = value
+        self.update()
+
     def transform_pos(self, point):
         """Convert from widget-logical coordinates to painter-logical coordinates."""
         return point / self.scale - self.offset_to_center()
@@ -664,97 +850,8 @@ class Canvas(QWidget):
 
         # 在关闭形状之前进行自动收缩
         if self.pixmap:
-            # 获取当前矩形的边界
-            rect = self.current.bounding_rect()
-            x1, y1, x2, y2 = int(rect.x()), int(rect.y()), int(rect.x() + rect.width()), int(rect.y() + rect.height())
-            
-            # 确保边界在图片范围内
-            x1 = max(0, x1)
-            y1 = max(0, y1)
-            x2 = min(self.pixmap.width(), x2)
-            y2 = min(self.pixmap.height(), y2)
-
-            # 确保为整数
-            x1 = int(round(x1))
-            x2 = int(round(x2))
-            y1 = int(round(y1))
-            y2 = int(round(y2))
-            
-            # 将QPixmap转换为QImage以进行像素分析
-            image = self.pixmap.toImage()
-            
-            def is_content_pixel(x, y):
-                # 获取像素颜色
-                color = QColor(image.pixel(x, y))
-                # 计算灰度值
-                gray_value = (color.red() + color.green() + color.blue()) / 3
-                # 使用更严格的阈值
-                return gray_value < self.content_threshold
-            
-            # 定义边距
-            MARGIN = 0  # 边距像素
-            
-            # 左边界 - 从左向右扫描
-            for x in range(x1, x2):
-                has_content = False
-                for y in range(y1, y2):
-                    if is_content_pixel(x, y):
-                        x1 = max(x - MARGIN, 0)
-                        has_content = True
-                        break
-                if has_content:
-                    break
-            
-            # 右边界 - 从右向左扫描
-            for x in range(x2 - 1, x1, -1):
-                has_content = False
-                for y in range(y1, y2):
-                    if is_content_pixel(x, y):
-                        x2 = min(x + 1, self.pixmap.width())
-                        has_content = True
-                        break
-                if has_content:
-                    break
-            
-            # 上边界 - 从上向下扫描
-            for y in range(y1, y2):
-                has_content = False
-                for x in range(x1, x2):
-                    if is_content_pixel(x, y):
-                        y1 = max(y - MARGIN, 0)
-                        has_content = True
-                        break
-                if has_content:
-                    break
-            
-            # 下边界 - 从下向上扫描
-            for y in range(y2 - 1, y1, -1):
-                has_content = False
-                for x in range(x1, x2):
-                    if is_content_pixel(x, y):
-                        y2 = min(y + 1, self.pixmap.height())
-                        has_content = True
-                        break
-                if has_content:
-                    break
-
-            # 确保最小尺寸
-            MIN_SIZE = 5  # 最小尺寸（像素）
-            if x2 - x1 < MIN_SIZE:
-                center = (x1 + x2) / 2
-                x1 = int(max(0, center - MIN_SIZE / 2))
-                x2 = int(min(self.pixmap.width(), center + MIN_SIZE / 2))
-            if y2 - y1 < MIN_SIZE:
-                center = (y1 + y2) / 2
-                y1 = int(max(0, center - MIN_SIZE / 2))
-                y2 = int(min(self.pixmap.height(), center + MIN_SIZE / 2))
-            
-            # 再次确保为整数
-            x1 = int(round(x1))
-            x2 = int(round(x2))
-            y1 = int(round(y1))
-            y2 = int(round(y2))
-            
+            x1, y1, x2, y2, valid_count = self._shrink_rect_to_content(self.current.bounding_rect())
+
             # 更新形状的点
             self.current.points = [
                 QPointF(x1, y1),
@@ -764,14 +861,7 @@ class Canvas(QWidget):
             ]
 
             # 新增：统计有效像素点数量，若不超过30则取消添加
-            valid_count = 0
-            for x in range(x1, x2):
-                for y in range(y1, y2):
-                    color = QColor(image.pixel(x, y))
-                    gray_value = (color.red() + color.green() + color.blue()) / 3
-                    if gray_value < self.content_threshold:
-                        valid_count += 1
-            if valid_count <= 30:
+            if valid_count <= MIN_CONTENT_PIXELS:
                 self.current = None
                 self.drawingPolygon.emit(False)
                 self.update()
@@ -779,6 +869,7 @@ class Canvas(QWidget):
 
         self.current.close()
         self.shapes.append(self.current)
+        self.shape_index.insert(self.current)
         self.current = None
         self.set_hiding(False)
         self.draw_square = False  # 完成绘制后重置draw_square状态
@@ -877,8 +968,7 @@ class Canvas(QWidget):
         
         # 移动所有选中的shapes
         for shape in shapes_to_move:
-            for point in shape.points:
-                point += offset
+            shape.move_by(offset)
                 
         self.shapeMoved.emit()
         self.repaint()
@@ -907,6 +997,7 @@ class Canvas(QWidget):
     def undo_last_line(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.shape_index.remove(self.current)
         self.current.set_open()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -914,6 +1005,7 @@ class Canvas(QWidget):
     def reset_all_lines(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.shape_index.remove(self.current)
         self.current.set_open()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -921,9 +1013,25 @@ class Canvas(QWidget):
         self.drawingPolygon.emit(False)
         self.update()
 
+    def load_image(self, image):
+        """加载QImage；超大图片用ImagePyramid分块绘制，不再整张转换为QPixmap"""
+        if use_pyramid(image):
+            pyramid = ImagePyramid(image)
+            pyramid.level_ready.connect(lambda level: self.update())
+            pyramid.start()
+            self.load_pixmap(pyramid)
+        else:
+            self.load_pixmap(QPixmap.fromImage(image))
+
     def load_pixmap(self, pixmap):
+        if isinstance(self.pixmap, ImagePyramid):
+            self.pixmap.cancel()
         self.pixmap = pixmap
+        self._overlay_pixmap = self._overlay_key = None
+        # 灰度缓存在第一次收缩框时才建立
+        self.content_cache.clear()
         self.shapes = []
+        self.shape_index.rebuild(self.shapes)
         self.repaint()
 
     def load_shapes(self, shapes):
@@ -933,6 +1041,7 @@ class Canvas(QWidget):
         for shape in self.shapes:
             if not hasattr(shape, 'visible'):
                 shape.visible = True
+        self.shape_index.rebuild(self.shapes)
         self.repaint()
 
     def set_shape_visible(self, shape, value):
@@ -962,7 +1071,11 @@ class Canvas(QWidget):
         self.selected_shape_copy = None
         self.draw_square = False  # 重置draw_square状态
         self.restore_cursor()
+        if isinstance(self.pixmap, ImagePyramid):
+            self.pixmap.cancel()
         self.pixmap = None
+        self._overlay_pixmap = self._overlay_key = None
+        self.content_cache.clear()
         self.update()
 
     def set_drawing_shape_to_square(self, status):
@@ -979,89 +1092,29 @@ class Canvas(QWidget):
         """移动所有选中的shapes"""
         if self.selected_shapes:
             for shape in self.selected_shapes:
-                for point in shape.points:
-                    point.setX(point.x() + dx)
-                    point.setY(point.y() + dy)
+                shape.move_by(QPointF(dx, dy))
             self.update()
 
+    def _shrink_rect_to_content(self, rect):
+        """将矩形收缩到有效内容区域，返回 (x1, y1, x2, y2, 有效像素数)。"""
+        width, height = self.pixmap.width(), self.pixmap.height()
+        x1, y1, x2, y2 = int(rect.x()), int(rect.y()), int(rect.x() + rect.width()), int(rect.y() + rect.height())
+        # 确保边界在图片范围内
+        x1 = max(0, x1)
+        y1 = max(0, y1)
+        x2 = min(width, x2)
+        y2 = min(height, y2)
+        if not self.content_cache.is_loaded():
+            self.content_cache.load(self.pixmap.toImage())
+        return self.content_cache.shrink(x1, y1, x2, y2, self.content_threshold)
+
     def _shrink_rect_shape_to_content(self, shape):
         """将传入的4点矩形shape自动收缩到有效内容区域，逻辑与finalise一致。"""
         if not self.pixmap or not shape or len(shape.points) != 4:
             return
-        rect = shape.bounding_rect()
-        x1, y1, x2, y2 = int(rect.x()), int(rect.y()), int(rect.x() + rect.width()), int(rect.y() + rect.height())
-        x1 = max(0, x1)
-        y1 = max(0, y1)
-        x2 = min(self.pixmap.width(), x2)
-        y2 = min(self.pixmap.height(), y2)
-        x1 = int(round(x1))
-        x2 = int(round(x2))
-        y1 = int(round(y1))
-        y2 = int(round(y2))
-        image = self.pixmap.toImage()
-        def is_content_pixel(x, y):
-            color = QColor(image.pixel(x, y))
-            gray_value = (color.red() + color.green() + color.blue()) / 3
-            return gray_value < self.content_threshold
-        MARGIN = 0
-        for x in range(x1, x2):
-            has_content = False
-            for y in range(y1, y2):
-                if is_content_pixel(x, y):
-                    x1 = max(x - MARGIN, 0)
-                    has_content = True
-                    break
-            if has_content:
-                break
-        for x in range(x2 - 1, x1, -1):
-            has_content = False
-            for y in range(y1, y2):
-                if is_content_pixel(x, y):
-                    x2 = min(x + 1, self.pixmap.width())
-                    has_content = True
-                    break
-            if has_content:
-                break
-        for y in range(y1, y2):
-            has_content = False
-            for x in range(x1, x2):
-                if is_content_pixel(x, y):
-                    y1 = max(y - MARGIN, 0)
-                    has_content = True
-                    break
-            if has_content:
-                break
-        for y in range(y2 - 1, y1, -1):
-            has_content = False
-            for x in range(x1, x2):
-                if is_content_pixel(x, y):
-                    y2 = min(y + 1, self.pixmap.height())
-                    has_content = True
-                    break
-            if has_content:
-                break
-        MIN_SIZE = 5
-        if x2 - x1 < MIN_SIZE:
-            center = (x1 + x2) / 2
-            x1 = int(max(0, center - MIN_SIZE / 2))
-            x2 = int(min(self.pixmap.width(), center + MIN_SIZE / 2))
-        if y2 - y1 < MIN_SIZE:
-            center = (y1 + y2) / 2
-            y1 = int(max(0, center - MIN_SIZE / 2))
-            y2 = int(min(self.pixmap.height(), center + MIN_SIZE / 2))
-        x1 = int(round(x1))
-        x2 = int(round(x2))
-        y1 = int(round(y1))
-        y2 = int(round(y2))
+        x1, y1, x2, y2, valid_count = self._shrink_rect_to_content(shape.bounding_rect())
         # 统计有效像素点数量，若不超过30则不处理
-        valid_count = 0
-        for x in range(x1, x2):
-            for y in range(y1, y2):
-                color = QColor(image.pixel(x, y))
-                gray_value = (color.red() + color.green() + color.blue()) / 3
-                if gray_value < self.content_threshold:
-                    valid_count += 1
-        if valid_count <= 30:
+        if valid_count <= MIN_CONTENT_PIXELS:
             return
         shape.points = [
             QPointF(x1, y1),
@@ -17,4 +17,6 @@ FORMAT_YOLO='YOLO'
 FORMAT_CREATEML='CreateML'
 SETTING_DRAW_SQUARE = 'draw/square'
 SETTING_LABEL_FILE_FORMAT= 'labelFileFormat'
+SETTING_IMAGE_CACHE_MB = 'imageCache/budgetMB'
+SETTING_FSYNC_SAVES = 'save/fsync'
 DEFAULT_ENCODING = 'utf-8'
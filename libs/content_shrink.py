@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Vectorised helpers used by the canvas to shrink boxes onto image content.
+
+A pixel counts as content when its gray value ``(r + g + b) / 3`` is below
+the canvas ``content_threshold``. The image is read into a NumPy array the
+first time a box is shrunk, and a summed-area table of the content mask
+answers "how many content pixels are inside this box" in constant time. Box
+edges are then found by binary search over those counts instead of scanning
+pixels. Images larger than ``MAX_CACHED_PIXELS`` are not cached as a whole;
+a table is built for the area around each box instead.
+"""
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    from PyQt4.QtGui import QImage
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Boxes smaller than this (in pixels) are grown around their center.
+MIN_SIZE = 5
+# Boxes with at most this many content pixels are discarded.
+MIN_CONTENT_PIXELS = 30
+# Larger images get a table per box instead of one for the whole image.
+MAX_CACHED_PIXELS = 16 * 1024 * 1024
+
+# Formats whose 32 bit words can be read as they are stored, which is
+# also what QImage.pixel() returns for them.
+_RAW_FORMATS = (QImage.Format_RGB32, QImage.Format_ARGB32, QImage.Format_ARGB32_Premultiplied)
+
+
+def qimage_to_rgb_sum(image, rect=None):
+    """
+    Return an (h, w) uint16 array holding r + g + b of every pixel.
+    If rect = (x1, y1, x2, y2) is given only that area is converted.
+    The returned array owns its data and does not reference the image buffer.
+    """
+    if rect is not None and image.format() not in _RAW_FORMATS:
+        # Convert only the requested area
+        x1, y1, x2, y2 = rect
+        image = image.copy(x1, y1, x2 - x1, y2 - y1)
+        rect = None
+    if image.format() not in _RAW_FORMATS:
+        image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+    width, height = image.width(), image.height()
+    bytes_per_line = image.bytesPerLine()
+    ptr = image.constBits()
+    ptr.setsize(bytes_per_line * height)
+    words = np.frombuffer(ptr, dtype=np.uint32).reshape(height, bytes_per_line // 4)[:, :width]
+    if rect is not None:
+        x1, y1, x2, y2 = rect
+        words = words[y1:y2, x1:x2]
+    rgb_sum = (words >> 16) & 0xff
+    rgb_sum += (words >> 8) & 0xff
+    rgb_sum += words & 0xff
+    return rgb_sum.astype(np.uint16)
+
+
+def content_mask(rgb_sum, threshold):
+    """Boolean mask of the pixels whose gray value is below threshold."""
+    # (r + g + b) / 3 < threshold  <=>  r + g + b < 3 * threshold
+    return rgb_sum < 3 * threshold
+
+
+class SummedAreaTable(object):
+    """Integral image of a content mask."""
+
+    def __init__(self, mask):
+        height, width = mask.shape
+        dtype = np.int32 if mask.size < 2 ** 31 else np.int64
+        self.width = width
+        self.height = height
+        self.table = np.zeros((height + 1, width + 1), dtype=dtype)
+        np.cumsum(np.cumsum(mask, axis=0, dtype=dtype), axis=1, out=self.table[1:, 1:])
+
+    def count(self, x1, y1, x2, y2):
+        """Number of content pixels in [x1, x2) x [y1, y2)."""
+        if x2 <= x1 or y2 <= y1:
+            return 0
+        t = self.table
+        return int(t[y2, x2] - t[y1, x2] - t[y2, x1] + t[y1, x1])
+
+    def first_column(self, x1, y1, x2, y2):
+        """First column in [x1, x2) holding content, or None."""
+        x = _bisect(x1, x2, lambda c: self.count(x1, y1, c + 1, y2) > 0)
+        return x if x < x2 else None
+
+    def last_column(self, x1, y1, x2, y2):
+        """Last column in [x1, x2) holding content, or None."""
+        if not self.count(x1, y1, x2, y2):
+            return None
+        return _bisect(x1, x2, lambda c: self.count(c + 1, y1, x2, y2) == 0)
+
+    def first_row(self, x1, y1, x2, y2):
+        """First row in [y1, y2) holding content, or None."""
+        y = _bisect(y1, y2, lambda r: self.count(x1, y1, x2, r + 1) > 0)
+        return y if y < y2 else None
+
+    def last_row(self, x1, y1, x2, y2):
+        """Last row in [y1, y2) holding content, or None."""
+        if not self.count(x1, y1, x2, y2):
+            return None
+        return _bisect(y1, y2, lambda r: self.count(x1, r + 1, x2, y2) == 0)
+
+
+def _bisect(lo, hi, pred):
+    """Smallest i in [lo, hi) for which the monotonic pred is true, hi if none."""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if pred(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def shrink_box(table, x1, y1, x2, y2, min_size=MIN_SIZE):
+    """
+    Shrink the box [x1, x2) x [y1, y2) onto the content pixels of table.
+
+    Return (x1, y1, x2, y2, count) where count is the number of content
+    pixels inside the resulting box.
+    """
+    width, height = table.width, table.height
+
+    # Left / right edges: first and last column holding content.
+    left = table.first_column(x1, y1, x2, y2)
+    if left is not None:
+        right = table.last_column(left, y1, x2, y2)
+        if right > left:
+            x2 = min(right + 1, width)
+        x1 = left
+
+    # Top / bottom edges, searched inside the narrowed column range.
+    top = table.first_row(x1, y1, x2, y2)
+    if top is not None:
+        bottom = table.last_row(x1, top, x2, y2)
+        if bottom > top:
+            y2 = min(bottom + 1, height)
+        y1 = top
+
+    # Ensure the minimum size
+    if x2 - x1 < min_size:
+        center = (x1 + x2) / 2
+        x1 = int(max(0, center - min_size / 2))
+        x2 = int(min(width, center + min_size / 2))
+    if y2 - y1 < min_size:
+        center = (y1 + y2) / 2
+        y1 = int(max(0, center - min_size / 2))
+        y2 = int(min(height, center + min_size / 2))
+
+    return x1, y1, x2, y2, table.count(x1, y1, x2, y2)
+
+
+class ContentMaskCache(object):
+    """
+    Per-image cache of the r + g + b buffer and of the summed-area tables
+    built from it. Nothing is computed until the first box is shrunk. Tables
+    are kept for the most recently used thresholds only.
+    """
+
+    def __init__(self, max_tables=3, max_pixels=MAX_CACHED_PIXELS):
+        self.max_tables = max_tables
+        self.max_pixels = max_pixels
+        self.image = None
+        self.rgb_sum = None
+        self._tables = OrderedDict()
+
+    def load(self, image):
+        self.clear()
+        if image is not None and not image.isNull():
+            self.image = image
+
+    def clear(self):
+        self.image = None
+        self.rgb_sum = None
+        self._tables.clear()
+
+    def is_loaded(self):
+        return self.image is not None
+
+    def is_cached(self):
+        """True when the image is small enough for one table of the whole image."""
+        return self.image.width() * self.image.height() <= self.max_pixels
+
+    def shrink(self, x1, y1, x2, y2, threshold, min_size=MIN_SIZE):
+        """shrink_box() over the loaded image."""
+        if self.is_cached():
+            return shrink_box(self.table(threshold), x1, y1, x2, y2, min_size)
+        # Only the box and the margin it may grow into to reach min_size
+        left, top = max(0, x1 - min_size), max(0, y1 - min_size)
+        right = min(self.image.width(), x2 + min_size)
+        bottom = min(self.image.height(), y2 + min_size)
+        rgb_sum = qimage_to_rgb_sum(self.image, (left, top, right, bottom))
+        table = SummedAreaTable(content_mask(rgb_sum, threshold))
+        x1, y1, x2, y2, count = shrink_box(table, x1 - left, y1 - top, x2 - left, y2 - top, min_size)
+        return x1 + left, y1 + top, x2 + left, y2 + top, count
+
+    def table(self, threshold):
+        if threshold in self._tables:
+            self._tables.move_to_end(threshold)
+            return self._tables[threshold]
+        if self.rgb_sum is None:
+            self.rgb_sum = qimage_to_rgb_sum(self.image)
+        table = SummedAreaTable(content_mask(self.rgb_sum, threshold))
+        self._tables[threshold] = table
+        while len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+        return table
@@ -1,13 +1,324 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+import codecs
 import json
-from pathlib import Path
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
 
+from libs.atomic_file import atomic_write
 from libs.constants import DEFAULT_ENCODING
 import os
 
 JSON_EXT = '.json'
 ENCODE_METHOD = DEFAULT_ENCODING
+# Files at least this large are read through a CreateMLOffsetIndex
+STREAM_THRESHOLD_BYTES = 8 * 1024 * 1024
+OFFSETS_EXT = '.offsets'
+
+
+class CreateMLStore(object):
+    """
+    Parsed CreateML document of one JSON file, with an image name -> position
+    map. Saving an image replaces its entry in memory; flush() writes the
+    whole document back atomically, so many saves cost a single write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.images = []
+        self.index = {}
+        self.dirty = False
+        self._stamp = None
+        self.load()
+
+    def load(self):
+        self.images, self.index, self.dirty = [], {}, False
+        self._stamp = _file_stamp(self.path)
+        if self._stamp is None:
+            return
+        with open(self.path, 'r', encoding=ENCODE_METHOD) as file:
+            images = json.load(file)
+        self.images = images if isinstance(images, list) else []
+        for i, image in enumerate(self.images):
+            # Like the linear scan it replaces, the first entry of a name wins
+            self.index.setdefault(image.get('image'), i)
+
+    def is_stale(self):
+        """True if the file was changed on disk since it was loaded or written."""
+        return _file_stamp(self.path) != self._stamp
+
+    def get(self, image_name):
+        i = self.index.get(image_name)
+        return self.images[i] if i is not None else None
+
+    def put(self, image_dict):
+        i = self.index.get(image_dict['image'])
+        if i is None:
+            self.index[image_dict['image']] = len(self.images)
+            self.images.append(image_dict)
+        else:
+            self.images[i] = image_dict
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        with atomic_write(self.path, 'w', encoding=ENCODE_METHOD) as file:
+            file.write(json.dumps(self.images))
+        self.dirty = False
+        self._stamp = _file_stamp(self.path)
+
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def scan_records(file, chunk_size=1 << 20):
+    """
+    Yield (offset, length, record) of each object of the top level JSON array
+    in the binary file, offset and length being in bytes. The file is read in
+    chunks and each record is decoded by itself, so only the current chunk is
+    held in memory.
+    """
+    decoder = codecs.getincrementaldecoder(ENCODE_METHOD)()
+    # offset is the byte offset of text[pos]
+    text, pos, offset, in_array, eof = '', 0, 0, False, False
+    while True:
+        end = _JSON_SEPARATORS.match(text, pos).end()
+        offset += len(text[pos:end].encode(ENCODE_METHOD))
+        pos = end
+        if pos < len(text):
+            if not in_array:
+                if text[pos] != '[':
+                    return
+                in_array, pos, offset = True, pos + 1, offset + 1
+                continue
+            if text[pos] == ']':
+                return
+            try:
+                record, end = _JSON_DECODER.raw_decode(text, pos)
+            except ValueError:
+                # The value continues in the next chunk
+                if eof:
+                    raise
+            else:
+                # A number that ends the chunk may continue in the next one
+                if end < len(text) or eof:
+                    length = len(text[pos:end].encode(ENCODE_METHOD))
+                    if isinstance(record, dict):
+                        yield offset, length, record
+                    pos, offset = end, offset + length
+                    continue
+        if eof:
+            return
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        text, pos = text[pos:] + decoder.decode(chunk, final=eof), 0
+
+
+class CreateMLOffsetIndex(object):
+    """
+    Byte offsets of the image records of a CreateML JSON file, kept in a
+    SQLite sidecar (path + OFFSETS_EXT). The JSON file is scanned once; after
+    that a lookup seeks to the record and decodes only that record, so memory
+    use does not grow with the file. The sidecar is rebuilt when the size or
+    mtime of the JSON file changes.
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.conn = None
+        self._stamp = None
+        self.open()
+
+    def open(self):
+        self.close()
+        stamp = _file_stamp(self.path)
+        sidecar = self.path + OFFSETS_EXT
+        conn = _connect(sidecar)
+        if conn is not None and _read_stamp(conn) == stamp:
+            self.conn, self._stamp = conn, stamp
+            return
+        if conn is not None:
+            conn.close()
+        tmp_path = sidecar + '.tmp'
+        conn = _connect(tmp_path, rebuild=True)
+        if conn is not None:
+            self._build(conn, stamp)
+            conn.close()
+            os.replace(tmp_path, sidecar)
+            conn = _connect(sidecar)
+        if conn is None:
+            # The directory is read-only: keep the offsets in memory
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
+            self._build(conn, stamp)
+        self.conn, self._stamp = conn, stamp
+
+    def _build(self, conn, stamp):
+        conn.executescript('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);'
+                           'CREATE TABLE IF NOT EXISTS records (image TEXT PRIMARY KEY, position INTEGER, '
+                           'offset INTEGER, length INTEGER);')
+        first = []
+
+        def rows(file):
+            for position, (offset, length, record) in enumerate(scan_records(file, self.chunk_size)):
+                if not first:
+                    first.extend((offset, length))
+                yield record.get('image'), position, offset, length
+        with open(self.path, 'rb') as file:
+            # Like a linear scan, the first record of a name wins
+            conn.executemany('INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?)', rows(file))
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('first', json.dumps(first or None)))
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('stamp', json.dumps(stamp)))
+        conn.commit()
+
+    def is_stale(self):
+        return _file_stamp(self.path) != self._stamp
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def get(self, image_name):
+        row = self.conn.execute('SELECT offset, length FROM records WHERE image = ?', (image_name,)).fetchone()
+        return self._read(row)
+
+    def first(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'first'").fetchone()
+        return self._read(json.loads(row[0]) if row is not None else None)
+
+    def _read(self, row):
+        if row is None:
+            return None
+        with open(self.path, 'rb') as file:
+            file.seek(row[0])
+            return json.loads(file.read(row[1]).decode(ENCODE_METHOD))
+
+
+def _connect(path, rebuild=False):
+    try:
+        if rebuild and os.path.exists(path):
+            os.remove(path)
+        return sqlite3.connect(path, check_same_thread=False)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+def _read_stamp(conn):
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()
+    except sqlite3.Error:
+        return None
+    return tuple(json.loads(row[0])) if row is not None else None
+
+
+class CreateMLStores(object):
+    """
+    The CreateML stores opened in this process, keyed by JSON path. Stores
+    with unsaved changes are kept until flushed; of the others only the
+    max_clean most recently used ones stay in memory.
+    """
+
+    def __init__(self, max_clean=16, stream_threshold=STREAM_THRESHOLD_BYTES, max_offset_indexes=4):
+        self.max_clean = max_clean
+        self.stream_threshold = stream_threshold
+        self.max_offset_indexes = max_offset_indexes
+        self.lock = threading.RLock()
+        self._stores = OrderedDict()
+        self._offset_indexes = OrderedDict()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            store = self._stores.get(path)
+            if store is not None and not store.dirty and store.is_stale():
+                store = None
+            if store is None:
+                store = CreateMLStore(path)
+            self._stores[path] = store
+            self._stores.move_to_end(path)
+            clean = [p for p, s in self._stores.items() if not s.dirty and p != path]
+            for p in clean[:max(0, len(clean) - self.max_clean)]:
+                del self._stores[p]
+            return store
+
+    def read(self, path, image_name):
+        """
+        Return (image entry or None, first entry or None) of the JSON file at
+        path. Large files that are not loaded for writing are read through
+        their offset index instead of being parsed as a whole.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            store = self._stores.get(path)
+            if store is None or (not store.dirty and store.is_stale()):
+                stamp = _file_stamp(path)
+                if stamp is not None and stamp[1] >= self.stream_threshold:
+                    index = self.offset_index(path)
+                    return index.get(image_name), index.first()
+            store = self.get(path)
+            return store.get(image_name), (store.images[0] if store.images else None)
+
+    def offset_index(self, path):
+        with self.lock:
+            index = self._offset_indexes.pop(path, None)
+            if index is not None and index.is_stale():
+                index.open()
+            if index is None:
+                index = CreateMLOffsetIndex(path)
+            self._offset_indexes[path] = index
+            while len(self._offset_indexes) > self.max_offset_indexes:
+                self._offset_indexes.popitem(last=False)[1].close()
+            return index
+
+    def write(self, path, image_dict, flush=True):
+        """
+        Replace the entry of an image. A new file is always written at once
+        so that it can be found on disk; otherwise the write is deferred to
+        flush() unless flush is True.
+        """
+        with self.lock:
+            store = self.get(path)
+            store.put(image_dict)
+            if flush or store._stamp is None:
+                store.flush()
+
+    def has_pending(self):
+        with self.lock:
+            return any(store.dirty for store in self._stores.values())
+
+    def flush(self):
+        """Write every store with unsaved changes."""
+        with self.lock:
+            for store in list(self._stores.values()):
+                store.flush()
+
+    def discard(self, path):
+        """Forget the store of path, dropping unsaved changes (e.g. the file was deleted)."""
+        with self.lock:
+            self._stores.pop(os.path.abspath(path), None)
+            index = self._offset_indexes.pop(os.path.abspath(path), None)
+            if index is not None:
+                index.close()
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Shared by the CreateML readers and writers of the process
+create_ml_stores = CreateMLStores()
 
 
 class CreateMLWriter:
@@ -22,14 +333,7 @@ class CreateMLWriter:
         self.shapes = shapes
         self.output_file = output_file
 
-    def write(self):
-        if os.path.isfile(self.output_file):
-            with open(self.output_file, "r") as file:
-                input_data = file.read()
-                output_dict = json.loads(input_data)
-        else:
-            output_dict = []
-
+    def write(self, flush=True):
         output_image_dict = {
             "image": self.filename,
             "verified": self.verified,
@@ -57,18 +361,8 @@ class CreateMLWriter:
             }
             output_image_dict["annotations"].append(shape_dict)
 
-        # check if image already in output
-        exists = False
-        for i in range(0, len(output_dict)):
-            if output_dict[i]["image"] == output_image_dict["image"]:
-                exists = True
-                output_dict[i] = output_image_dict
-                break
-
-        if not exists:
-            output_dict.append(output_image_dict)
-
-        Path(self.output_file).write_text(json.dumps(output_dict), ENCODE_METHOD)
+        # Replace the entry of the image in the indexed document
+        create_ml_stores.write(self.output_file, output_image_dict, flush)
 
     def calculate_coordinates(self, x1, x2, y1, y2):
         if x1 < x2:
@@ -105,21 +399,16 @@ class CreateMLReader:
             print("JSON decoding failed")
 
     def parse_json(self):
-        with open(self.json_path, "r") as file:
-            input_data = file.read()
-
-        # Returns a list
-        output_list = json.loads(input_data)
+        image, first = create_ml_stores.read(self.json_path, self.filename)
 
-        if output_list:
-            self.verified = output_list[0].get("verified", False)
+        if first is not None:
+            self.verified = first.get("verified", False)
 
         if len(self.shapes) > 0:
             self.shapes = []
-        for image in output_list:
-            if image["image"] == self.filename:
-                for shape in image["annotations"]:
-                    self.add_shape(shape["label"], shape["coordinates"])
+        if image is not None:
+            for shape in image["annotations"]:
+                self.add_shape(shape["label"], shape["coordinates"])
 
     def add_shape(self, label, bnd_box):
         x_min = bnd_box["x"] - (bnd_box["width"] / 2)
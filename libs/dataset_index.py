@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-disk index of the images of a dataset and of their annotation status.
+
+The index is a SQLite file kept next to the annotations in the save dir. When
+no save dir is set it is kept in the user's home, so that nothing is written
+into the image dir. For every image it records the file size,
+mtime and dimensions, plus the annotation file found for it, its format, box
+count, label set and verified flag. Entries are only re-probed when the image
+or annotation mtime changed, so refreshing a known dataset is cheap, and the
+annotation status can be queried without touching the image files.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtCore import QThread, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QThread, pyqtSignal
+
+from libs.constants import FORMAT_PASCALVOC, FORMAT_YOLO, FORMAT_CREATEML
+from libs.create_ml_io import JSON_EXT, create_ml_stores
+from libs.image_header import probe_image_size
+from libs.pascal_voc_io import XML_EXT, PascalVocReader
+from libs.yolo_io import TXT_EXT, class_list_cache
+
+INDEX_FILE_NAME = '.labelImg_index.sqlite'
+# Indexes of image dirs without a save dir, one file per dir
+INDEX_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.labelImgIndex')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    width INTEGER,
+    height INTEGER,
+    ann_path TEXT,
+    ann_format TEXT,
+    ann_mtime REAL,
+    box_count INTEGER NOT NULL DEFAULT 0,
+    labels TEXT NOT NULL DEFAULT '[]',
+    verified INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_dir ON images (dir);
+"""
+
+_COLUMNS = ('path', 'dir', 'size', 'mtime', 'width', 'height', 'ann_path', 'ann_format',
+            'ann_mtime', 'box_count', 'labels', 'verified')
+
+
+def annotation_paths(image_path, save_dir=None):
+    """
+    Candidate annotation files of image_path, in the order labelImg loads them:
+    PascalXML > YOLO > CreateML.
+    """
+    if save_dir is not None:
+        base = os.path.join(save_dir, os.path.basename(os.path.splitext(image_path)[0]))
+    else:
+        base = os.path.splitext(image_path)[0]
+    return ((base + XML_EXT, FORMAT_PASCALVOC),
+            (base + TXT_EXT, FORMAT_YOLO),
+            (base + JSON_EXT, FORMAT_CREATEML))
+
+
+def find_annotation(image_path, save_dir=None):
+    """Return (path, format, mtime) of the annotation of image_path, or None."""
+    for ann_path, ann_format in annotation_paths(image_path, save_dir):
+        try:
+            return ann_path, ann_format, os.path.getmtime(ann_path)
+        except OSError:
+            continue
+    return None
+
+
+def read_annotation_summary(image_path, ann_path, ann_format):
+    """Return (box_count, labels, verified) of an annotation file."""
+    if ann_format == FORMAT_PASCALVOC:
+        reader = PascalVocReader(ann_path)
+        return len(reader.labels), reader.labels, reader.verified
+    if ann_format == FORMAT_YOLO:
+        # Only the class ids are needed, which does not require the image size
+        classes_path = os.path.join(os.path.dirname(os.path.realpath(ann_path)), 'classes.txt')
+        try:
+            classes = class_list_cache.get(classes_path).names
+        except OSError:
+            classes = []
+        labels = []
+        with open(ann_path, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 5:
+                    class_index = int(fields[0])
+                    labels.append(classes[class_index] if 0 <= class_index < len(classes) else fields[0])
+        return len(labels), labels, False
+    if ann_format == FORMAT_CREATEML:
+        # Through the shared store, which also holds saves not flushed yet
+        image, first = create_ml_stores.read(ann_path, os.path.basename(image_path))
+        labels = [shape['label'] for shape in image['annotations']] if image is not None else []
+        verified = bool(first.get('verified', False)) if first is not None else False
+        return len(labels), labels, verified
+    return 0, [], False
+
+
+class DatasetIndex(object):
+    """
+    SQLite index of images and their annotation status. A connection must
+    only be used by the thread that created it; other threads open their own
+    DatasetIndex on the same db_path.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def path_for(dir_path, save_dir=None):
+        if save_dir:
+            return os.path.join(save_dir, INDEX_FILE_NAME)
+        key = hashlib.sha1(os.path.abspath(dir_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(INDEX_CACHE_DIR, key + '.sqlite')
+
+    def close(self):
+        self.conn.close()
+
+    def paths_in_dir(self, dir_path):
+        """Indexed image paths under dir_path, without checking they still exist."""
+        dir_path = os.path.abspath(dir_path)
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        rows = self.conn.execute(
+            'SELECT path FROM images WHERE dir = ? OR substr(dir, 1, ?) = ?',
+            (dir_path, len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    def get(self, image_path):
+        """The indexed entry of image_path as a dict, or None."""
+        row = self.conn.execute('SELECT %s FROM images WHERE path = ?' % ', '.join(_COLUMNS),
+                                (image_path,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        entry['labels'] = json.loads(entry['labels'])
+        entry['verified'] = bool(entry['verified'])
+        return entry
+
+    def unannotated_paths(self):
+        rows = self.conn.execute('SELECT path FROM images WHERE box_count = 0')
+        return set(row[0] for row in rows)
+
+    def unverified_paths(self):
+        rows = self.conn.execute('SELECT path FROM images WHERE verified = 0')
+        return set(row[0] for row in rows)
+
+    def refresh(self, image_paths, save_dir=None, is_cancelled=None, commit_every=100):
+        """
+        Bring the entries of image_paths up to date. The image is only probed
+        again when its size or mtime changed, and the annotation only parsed
+        again when another file was found for it or its mtime changed.
+        Return the number of entries that were written.
+        """
+        known = {}
+        for start in range(0, len(image_paths), 500):
+            chunk = image_paths[start:start + 500]
+            rows = self.conn.execute(
+                'SELECT path, size, mtime, width, height, ann_path, ann_mtime FROM images WHERE path IN (%s)'
+                % ', '.join('?' * len(chunk)), chunk)
+            for row in rows:
+                known[row[0]] = row[1:]
+
+        written = 0
+        for image_path in image_paths:
+            if is_cancelled is not None and is_cancelled():
+                break
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue
+            old = known.get(image_path)
+            annotation = find_annotation(image_path, save_dir)
+            ann_key = (annotation[0], annotation[2]) if annotation else (None, None)
+            if old is not None and old[:2] == (stat.st_size, stat.st_mtime) and old[4:] == ann_key:
+                continue
+            if old is not None and old[:2] == (stat.st_size, stat.st_mtime):
+                width, height = old[2:4]
+            else:
+                width, height = self._probe_size(image_path)
+            self._write(image_path, stat, width, height, annotation)
+            written += 1
+            if written % commit_every == 0:
+                self.conn.commit()
+        self.conn.commit()
+        return written
+
+    def update(self, image_path, save_dir=None):
+        """Re-index a single image, e.g. after its annotation was saved."""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            self.remove([image_path])
+            return
+        entry = self.conn.execute('SELECT size, mtime, width, height FROM images WHERE path = ?',
+                                  (image_path,)).fetchone()
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime):
+            width, height = entry[2:]
+        else:
+            width, height = self._probe_size(image_path)
+        self._write(image_path, stat, width, height, find_annotation(image_path, save_dir))
+        self.conn.commit()
+
+    def remove(self, image_paths):
+        self.conn.executemany('DELETE FROM images WHERE path = ?', ((p,) for p in image_paths))
+        self.conn.commit()
+
+    def _write(self, image_path, stat, width, height, annotation):
+        ann_path = ann_format = ann_mtime = None
+        box_count, labels, verified = 0, [], False
+        if annotation is not None:
+            ann_path, ann_format, ann_mtime = annotation
+            try:
+                box_count, labels, verified = read_annotation_summary(image_path, ann_path, ann_format)
+            except Exception as e:
+                # Unreadable annotations are indexed as empty
+                print(f"[Debug] DatasetIndex - failed to read {ann_path}: {e}")
+        self.conn.execute(
+            'INSERT OR REPLACE INTO images (%s) VALUES (%s)' % (', '.join(_COLUMNS), ', '.join('?' * len(_COLUMNS))),
+            (image_path, os.path.dirname(image_path), stat.st_size, stat.st_mtime, width, height,
+             ann_path, ann_format, ann_mtime, box_count, json.dumps(sorted(set(labels))), int(verified)))
+
+    @staticmethod
+    def _probe_size(image_path):
+        size = probe_image_size(image_path)
+        if size is None:
+            return None, None
+        return size[0], size[1]
+
+
+class DatasetIndexer(QThread):
+    """Refreshes a DatasetIndex for a list of images on a worker thread."""
+    refreshed = pyqtSignal(int)
+
+    def __init__(self, db_path, image_paths, save_dir=None, parent=None):
+        super(DatasetIndexer, self).__init__(parent)
+        self.db_path = db_path
+        self.image_paths = list(image_paths)
+        self.save_dir = save_dir
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            index = DatasetIndex(self.db_path)
+        except sqlite3.Error as e:
+            print(f"[Debug] DatasetIndexer - cannot open {self.db_path}: {e}")
+            return
+        try:
+            written = index.refresh(self.image_paths, self.save_dir, lambda: self._cancelled)
+        except sqlite3.Error as e:
+            print(f"[Debug] DatasetIndexer - refresh failed: {e}")
+            written = 0
+        finally:
+            index.close()
+        self.refreshed.emit(written)
+
+
+class DatasetIndexWriter(QThread):
+    """
+    Applies single-image updates and removals to a DatasetIndex on a worker
+    thread, so that parsing the annotation and waiting for the SQLite write
+    lock never block the GUI. Requests are keyed by image path: a path that is
+    still waiting only keeps its latest request.
+    """
+
+    def __init__(self, db_path, parent=None):
+        super(DatasetIndexWriter, self).__init__(parent)
+        self.db_path = db_path
+        self._condition = threading.Condition()
+        # image path -> (True, save dir) to update, (False, None) to remove
+        self._pending = OrderedDict()
+        self._busy = False
+        self._stopping = False
+
+    def update(self, image_path, save_dir=None):
+        self._submit(image_path, (True, save_dir))
+
+    def remove(self, image_paths):
+        for image_path in image_paths:
+            self._submit(image_path, (False, None))
+
+    def flush(self):
+        """Block until every submitted request is written."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._busy)
+
+    def shutdown(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self.wait()
+
+    def _submit(self, image_path, request):
+        with self._condition:
+            if self._stopping:
+                return
+            self._pending.pop(image_path, None)
+            self._pending[image_path] = request
+            self._condition.notify_all()
+        if not self.isRunning():
+            self.start()
+
+    def run(self):
+        try:
+            index = DatasetIndex(self.db_path)
+        except (sqlite3.Error, OSError) as e:
+            print(f"[Debug] DatasetIndexWriter - cannot open {self.db_path}: {e}")
+            index = None
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._pending or self._stopping)
+                    if not self._pending:
+                        return
+                    requests = list(self._pending.items())
+                    self._pending.clear()
+                    self._busy = True
+                try:
+                    if index is not None:
+                        self._apply(index, requests)
+                finally:
+                    with self._condition:
+                        self._busy = False
+                        self._condition.notify_all()
+        finally:
+            if index is not None:
+                index.close()
+
+    @staticmethod
+    def _apply(index, requests):
+        removed = [image_path for image_path, (is_update, _) in requests if not is_update]
+        try:
+            if removed:
+                index.remove(removed)
+            for image_path, (is_update, save_dir) in requests:
+                if is_update:
+                    index.update(image_path, save_dir)
+        except sqlite3.Error as e:
+            print(f"[Debug] DatasetIndexWriter - update failed: {e}")
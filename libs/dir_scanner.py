@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+
+try:
+    from PyQt5.QtCore import QThread, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QThread, pyqtSignal
+
+from libs.ustr import ustr
+
+
+class DirectoryScanner(QThread):
+    """
+    Walks a directory tree with os.scandir on a worker thread and reports the
+    image paths it finds in batches, so the GUI can show them while the scan
+    is still running. The first image is reported on its own to be opened as
+    early as possible.
+    """
+    found = pyqtSignal(list)
+
+    def __init__(self, dir_path, extensions, batch_size=2000, batch_interval=0.2, parent=None):
+        super(DirectoryScanner, self).__init__(parent)
+        self.dir_path = dir_path
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.total = 0
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        batch = []
+        last_emit = time.time()
+        for path in self.iter_images():
+            batch.append(path)
+            now = time.time()
+            if self.total == 0 or len(batch) >= self.batch_size or now - last_emit >= self.batch_interval:
+                self._emit(batch)
+                batch = []
+                last_emit = now
+        if batch and not self._cancelled:
+            self._emit(batch)
+
+    def iter_images(self):
+        return iter_image_paths(self.dir_path, self.extensions, self.is_cancelled)
+
+    def _emit(self, batch):
+        self.total += len(batch)
+        self.found.emit(batch)
+
+
+def iter_image_paths(dir_path, extensions, is_cancelled=None):
+    """
+    Yield the paths of the files under dir_path whose name ends with one of
+    extensions (lower case, with the dot), walking with os.scandir.
+    The walk stops early once is_cancelled() returns True.
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    stack = [os.path.abspath(dir_path)]
+    while stack and not (is_cancelled and is_cancelled()):
+        root = stack.pop()
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        sub_dirs = []
+        for entry in entries:
+            if is_cancelled and is_cancelled():
+                return
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                # Like os.walk, do not follow symbolic links to directories
+                if not entry.is_symlink():
+                    sub_dirs.append(entry.path)
+            elif entry.name.lower().endswith(extensions):
+                yield ustr(entry.path)
+        # Visit sub directories in listing order
+        stack.extend(reversed(sub_dirs))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bisect
+
+try:
+    from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+except ImportError:
+    from PyQt4.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+def sort_key(path):
+    return path.lower()
+
+
+class FileListModel(QAbstractListModel):
+    """
+    List model over the image paths of the opened directory.
+
+    The paths live in a plain python list (also used as MainWindow.m_img_list),
+    and the view only asks for the rows it shows, so no per-file widget items
+    are created. A path -> row dict, rebuilt lazily after the list changes,
+    makes looking up the row of a path O(1).
+    """
+
+    def __init__(self, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self.paths = []
+        self._keys = []
+        self._rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self.paths):
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.paths[index.row()]
+        return None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return self.row_of(path) >= 0
+
+    def path_at(self, row):
+        return self.paths[row]
+
+    def row_of(self, path):
+        """Row of path, or -1 if it is not in the list."""
+        if self._rows is None:
+            self._rows = dict((p, row) for row, p in enumerate(self.paths))
+        return self._rows.get(path, -1)
+
+    def clear(self):
+        self.beginResetModel()
+        self.paths[:] = []
+        self._keys = []
+        self._rows = {}
+        self.endResetModel()
+
+    def set_paths(self, paths):
+        self.beginResetModel()
+        self.paths[:] = paths
+        self._keys = []
+        self._rows = None
+        self.endResetModel()
+
+    def insert_sorted(self, paths):
+        """
+        Merge paths into the list, keeping it sorted by sort_key.
+        Return the insert positions in the previous list, in ascending order:
+        a position p means the new path was placed before the old row p.
+        """
+        if len(self._keys) != len(self.paths):
+            self._keys = [sort_key(p) for p in self.paths]
+        batch = sorted(paths, key=sort_key)
+        batch_keys = [sort_key(p) for p in batch]
+        positions = [bisect.bisect_right(self._keys, key) for key in batch_keys]
+        count = len(self.paths)
+        if not batch:
+            return positions
+        if positions[0] == count:
+            # Everything goes to the end of the list
+            self.beginInsertRows(QModelIndex(), count, count + len(batch) - 1)
+            self.paths.extend(batch)
+            self._keys.extend(batch_keys)
+            if self._rows is not None:
+                self._rows.update((p, count + i) for i, p in enumerate(batch))
+            self.endInsertRows()
+            return positions
+
+        new_paths, new_keys, prev = [], [], 0
+        for pos, path, key in zip(positions, batch, batch_keys):
+            new_paths.extend(self.paths[prev:pos])
+            new_keys.extend(self._keys[prev:pos])
+            new_paths.append(path)
+            new_keys.append(key)
+            prev = pos
+        new_paths.extend(self.paths[prev:])
+        new_keys.extend(self._keys[prev:])
+        self.beginResetModel()
+        self.paths[:] = new_paths
+        self._keys = new_keys
+        self._rows = None
+        self.endResetModel()
+        return positions
+
+    def release_sort_keys(self):
+        """Free the sort keys once no more sorted inserts are expected."""
+        self._keys = []
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.paths[row]
+        if len(self._keys) > row:
+            del self._keys[row]
+        self._rows = None
+        self.endRemoveRows()
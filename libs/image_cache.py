@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+from collections import OrderedDict
+
+# Default memory budget for decoded images, in megabytes.
+DEFAULT_IMAGE_CACHE_MB = 512
+
+
+def image_nbytes(image):
+    return image.bytesPerLine() * image.height()
+
+
+class ImageCache(object):
+    """
+    LRU cache of decoded QImages keyed by file path.
+
+    Every entry remembers the file mtime it was decoded from, so an image that
+    changed on disk is decoded again. The least recently used images are
+    dropped once the total size goes over budget_bytes.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_IMAGE_CACHE_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, file_path):
+        entry = self._entries.get(file_path)
+        return entry is not None and entry[0] == file_mtime(file_path)
+
+    def get(self, file_path):
+        """Return the cached image for file_path, or None on a miss."""
+        entry = self._entries.get(file_path)
+        if entry is not None and entry[0] == file_mtime(file_path):
+            self._entries.move_to_end(file_path)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            self._remove(file_path)
+        self.misses += 1
+        return None
+
+    def put(self, file_path, image, mtime=None):
+        if image is None or image.isNull():
+            return
+        if mtime is None:
+            mtime = file_mtime(file_path)
+        if file_path in self._entries:
+            self._remove(file_path)
+        size = image_nbytes(image)
+        if size > self.budget_bytes:
+            return
+        self._entries[file_path] = (mtime, image, size)
+        self.used_bytes += size
+        while self.used_bytes > self.budget_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        while self._entries and self.used_bytes > self.budget_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        self._entries.clear()
+        self.used_bytes = 0
+
+    def stats(self):
+        return 'hits: %d, misses: %d, %d images, %.1f MB' % (
+            self.hits, self.misses, len(self._entries), self.used_bytes / (1024.0 * 1024.0))
+
+    def _remove(self, file_path):
+        _, _, size = self._entries.pop(file_path)
+        self.used_bytes -= size
+
+
+def file_mtime(file_path):
+    """Modification time of file_path, or None if it cannot be read."""
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
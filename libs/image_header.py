@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Read image dimensions and channel count from the file header.
+
+Saving an annotation only needs the image height, width and depth, so there
+is no reason to decode the pixels for it. JPEG, PNG, BMP and TIFF headers are
+parsed here directly; other formats fall back to QImageReader, which also
+reads the size without decoding. Like decode_image, the EXIF orientation of
+JPEG and TIFF files is honoured, so a rotated photo reports the size it is
+displayed with.
+"""
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtGui import QImage, QImageIOHandler, QImageReader
+except ImportError:
+    from PyQt4.QtGui import QImage, QImageIOHandler, QImageReader
+
+_JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+_TIFF_WIDTH, _TIFF_HEIGHT, _TIFF_PHOTOMETRIC, _TIFF_ORIENTATION, _TIFF_SAMPLES = 256, 257, 262, 274, 277
+_GRAYSCALE_FORMATS = (QImage.Format_Mono, QImage.Format_MonoLSB, QImage.Format_Grayscale8)
+
+
+def probe_image_size(file_path):
+    """
+    Return (width, height, depth) of the image at file_path, depth being 1 for
+    grayscale images and 3 otherwise, or None if the size cannot be read.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b'\xff\xd8'):
+                size = _jpeg_size(f)
+            elif head.startswith(b'\x89PNG\r\n\x1a\n'):
+                size = _png_size(head)
+            elif head.startswith(b'BM'):
+                size = _bmp_size(head)
+            elif head[:4] in (b'II*\x00', b'MM\x00*'):
+                size = _tiff_size(f)
+            else:
+                size = None
+    except (OSError, struct.error, ValueError):
+        size = None
+    if size is None:
+        size = _qt_size(file_path)
+    return size
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = ord(byte)
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan before any frame header
+            return None
+        length = struct.unpack('>H', f.read(2))[0]
+        data = f.read(length - 2)
+        if marker == 0xE1 and data.startswith(b'Exif\x00\x00'):
+            exif = data[6:]
+            tags = _tiff_tags(lambda offset, n: exif[offset:offset + n], (_TIFF_ORIENTATION,))
+            orientation = tags.get(_TIFF_ORIENTATION, 1)
+        elif marker in _JPEG_SOF_MARKERS:
+            height, width, components = struct.unpack('>HHB', data[1:6])
+            return _oriented(width, height, 1 if components == 1 else 3, orientation)
+
+
+def _png_size(head):
+    if head[12:16] != b'IHDR':
+        return None
+    width, height, _, color_type = struct.unpack('>IIBB', head[16:26])
+    # Color types 0 and 4 are grayscale, without and with alpha
+    return width, height, 1 if color_type in (0, 4) else 3
+
+
+def _bmp_size(head):
+    header_size = struct.unpack('<I', head[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack('<HH', head[18:22])
+    else:
+        width, height = struct.unpack('<ii', head[18:26])
+    # A negative height means the rows are stored top-down
+    return abs(width), abs(height), 3
+
+
+def _tiff_size(f):
+    def read_at(offset, n):
+        f.seek(offset)
+        return f.read(n)
+    tags = _tiff_tags(read_at, (_TIFF_WIDTH, _TIFF_HEIGHT, _TIFF_PHOTOMETRIC, _TIFF_ORIENTATION, _TIFF_SAMPLES))
+    if _TIFF_WIDTH not in tags or _TIFF_HEIGHT not in tags:
+        return None
+    gray = tags.get(_TIFF_SAMPLES, 1) == 1 and tags.get(_TIFF_PHOTOMETRIC) in (0, 1)
+    return _oriented(tags[_TIFF_WIDTH], tags[_TIFF_HEIGHT], 1 if gray else 3, tags.get(_TIFF_ORIENTATION, 1))
+
+
+def _tiff_tags(read_at, wanted):
+    """Return the SHORT/LONG values of the wanted tags of the first IFD of a TIFF structure."""
+    header = read_at(0, 8)
+    endian = '<' if header[:2] == b'II' else '>'
+    ifd_offset = struct.unpack(endian + 'I', header[4:8])[0]
+    count = struct.unpack(endian + 'H', read_at(ifd_offset, 2))[0]
+    entries = read_at(ifd_offset + 2, count * 12)
+    tags = {}
+    for i in range(0, len(entries) - 11, 12):
+        tag, value_type = struct.unpack(endian + 'HH', entries[i:i + 4])
+        if tag not in wanted:
+            continue
+        if value_type == 3:
+            tags[tag] = struct.unpack(endian + 'H', entries[i + 8:i + 10])[0]
+        elif value_type == 4:
+            tags[tag] = struct.unpack(endian + 'I', entries[i + 8:i + 12])[0]
+    return tags
+
+
+def _oriented(width, height, depth, orientation):
+    # EXIF orientations 5 to 8 rotate the image by 90 degrees
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return width, height, depth
+
+
+def _qt_size(file_path):
+    reader = QImageReader(file_path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if not size.isValid():
+        return None
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size.transpose()
+    return size.width(), size.height(), _depth(reader.imageFormat())
+
+
+def _depth(image_format):
+    return 1 if image_format in _GRAYSCALE_FORMATS else 3
+
+
+class ImageSizeCache(object):
+    """
+    Per path cache of [height, width, depth], the image shape the annotation
+    writers use. Entries are invalidated when the file mtime changes.
+    The cache is shared by the GUI thread and the save queue worker, so
+    every access to the entries holds a lock.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shape(self, file_path, image=None):
+        """
+        Return [height, width, depth] of the image at file_path, or None.
+        The file header is read first, so the depth does not depend on how
+        the image was decoded; the decoded image is only used when the header
+        cannot be read.
+        """
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(file_path)
+                return list(entry[1])
+        size = probe_image_size(file_path)
+        if size is not None:
+            shape = (size[1], size[0], size[2])
+        elif image is not None and not image.isNull():
+            shape = (image.height(), image.width(), _depth(image.format()))
+        else:
+            return None
+        with self._lock:
+            self._entries[file_path] = (mtime, shape)
+            self._entries.move_to_end(file_path)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(shape)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by the annotation writers of the process
+image_size_cache = ImageSizeCache()
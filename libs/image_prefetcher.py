@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+try:
+    from PyQt5.QtGui import QImage, QImageReader
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+except ImportError:
+    from PyQt4.QtGui import QImage, QImageReader
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from libs.image_cache import ImageCache, file_mtime
+
+
+def decode_image(file_path):
+    """Decode an image file into a QImage, honouring its EXIF orientation."""
+    reader = QImageReader(file_path)
+    reader.setAutoTransform(True)
+    return reader.read()
+
+
+class ImageDecodeTask(QRunnable):
+
+    def __init__(self, prefetcher, file_path, generation):
+        super(ImageDecodeTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.file_path = file_path
+        self.generation = generation
+
+    def run(self):
+        # Skip work that was queued before the last cancel.
+        if self.generation != self.prefetcher.generation:
+            return
+        mtime = file_mtime(self.file_path)
+        image = decode_image(self.file_path)
+        self.prefetcher.decoded.emit(self.file_path, image, mtime)
+
+
+class ImagePrefetcher(QObject):
+    """
+    Decodes the images around the current position of the image list on a
+    worker thread pool, so that next/prev navigation can use an already
+    decoded QImage instead of reading the file on the GUI thread.
+
+    Decoded images are stored in an ImageCache, whose byte budget bounds the
+    memory used.
+    """
+    decoded = pyqtSignal(str, QImage, object)
+
+    def __init__(self, cache=None, ahead=2, behind=1, max_threads=2, parent=None):
+        super(ImagePrefetcher, self).__init__(parent)
+        self.cache = cache if cache is not None else ImageCache()
+        self.ahead = ahead
+        self.behind = behind
+        self.generation = 0
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self.decoded.connect(self._on_decoded)
+
+    def prefetch(self, paths, index):
+        """
+        Queue decoding of the window around paths[index]. The image at index
+        itself is expected to be loaded already and put into the cache.
+        """
+        self.cancel()
+        first = max(0, index - self.behind)
+        window = paths[first:index + self.ahead + 1]
+        # Nearest images first, next ones before previous ones.
+        order = sorted(range(len(window)), key=lambda i: (abs(first + i - index), first + i < index))
+        for i in order:
+            file_path = window[i]
+            if first + i != index and file_path not in self.cache:
+                self._pool.start(ImageDecodeTask(self, file_path, self.generation))
+
+    def cancel(self):
+        """Drop queued decode tasks; tasks already running finish on their own."""
+        self.generation += 1
+        self._pool.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.waitForDone()
+
+    def _on_decoded(self, file_path, image, mtime):
+        self.cache.put(file_path, image, mtime)
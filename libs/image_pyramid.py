@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import math
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtGui import QImage, QPainter, QPixmap
+    from PyQt5.QtCore import QObject, QRectF, QRunnable, QSize, Qt, QThreadPool, pyqtSignal
+except ImportError:
+    from PyQt4.QtGui import QImage, QPainter, QPixmap
+    from PyQt4.QtCore import QObject, QRectF, QRunnable, QSize, Qt, QThreadPool, pyqtSignal
+
+# Images with at least this many pixels are drawn through an ImagePyramid.
+MIN_TILED_PIXELS = 16 * 1024 * 1024
+TILE_SIZE = 512
+# Memory budget for tile pixmaps, in megabytes.
+DEFAULT_TILE_CACHE_MB = 128
+
+
+def use_pyramid(image):
+    return image.width() * image.height() >= MIN_TILED_PIXELS
+
+
+class PyramidBuildTask(QRunnable):
+
+    def __init__(self, pyramid, generation):
+        super(PyramidBuildTask, self).__init__()
+        self.pyramid = pyramid
+        self.generation = generation
+
+    def run(self):
+        image = self.pyramid.image
+        level = 0
+        while max(image.width(), image.height()) > self.pyramid.tile_size:
+            # Stop when the pyramid was replaced or cancelled.
+            if self.generation != self.pyramid.generation:
+                return
+            image = image.scaled(max(1, image.width() // 2), max(1, image.height() // 2),
+                                 Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            level += 1
+            self.pyramid.built.emit(self.generation, level, image)
+
+
+class ImagePyramid(QObject):
+    """
+    Draws a large image as tiles from a pyramid of halved copies. Level 0 is
+    the image itself; every further level is half the size of the previous
+    one and is built on a worker thread. Painting picks the level closest to
+    the screen resolution and converts only the tiles in view to pixmaps,
+    keeping the most recently drawn ones up to budget_bytes.
+
+    The pyramid stands in for the canvas pixmap: width(), height(), size()
+    and toImage() are those of the full image, so the canvas coordinates stay
+    the same as with a QPixmap.
+
+    level_ready(level) is emitted on the GUI thread when a level was built.
+    """
+    built = pyqtSignal(int, int, QImage)
+    level_ready = pyqtSignal(int)
+
+    def __init__(self, image, tile_size=TILE_SIZE, budget_bytes=DEFAULT_TILE_CACHE_MB * 1024 * 1024,
+                 pool=None, parent=None):
+        super(ImagePyramid, self).__init__(parent)
+        self.image = image
+        self.tile_size = tile_size
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.levels = [image]
+        self.generation = 0
+        # (level, column, row, overlay rgba) -> (pixmap, source rect, bytes)
+        self._tiles = OrderedDict()
+        self._pool = pool if pool is not None else QThreadPool.globalInstance()
+        self.built.connect(self._on_built)
+
+    def start(self):
+        """Build the smaller levels in the background."""
+        self._pool.start(PyramidBuildTask(self, self.generation))
+
+    def cancel(self):
+        self.generation += 1
+
+    def width(self):
+        return self.image.width()
+
+    def height(self):
+        return self.image.height()
+
+    def size(self):
+        return QSize(self.image.width(), self.image.height())
+
+    def isNull(self):
+        return self.image.isNull()
+
+    def toImage(self):
+        return self.image
+
+    def level_for_scale(self, scale):
+        """Coarsest built level that still has at least one pixel per screen pixel at scale."""
+        if scale <= 0:
+            return len(self.levels) - 1
+        level = int(math.floor(math.log(1.0 / scale, 2))) if scale < 1 else 0
+        return max(0, min(level, len(self.levels) - 1))
+
+    def draw(self, painter, rect, scale, overlay_color=None):
+        """
+        Draw the tiles intersecting rect, in image coordinates, for a painter
+        whose transform maps image coordinates to the device at scale.
+        """
+        level = self.level_for_scale(scale)
+        image = self.levels[level]
+        # Image coordinates of one pixel of the level
+        fx = self.image.width() / float(image.width())
+        fy = self.image.height() / float(image.height())
+        size = self.tile_size
+        left = max(0, int(rect.left() / fx) // size)
+        top = max(0, int(rect.top() / fy) // size)
+        right = min((image.width() - 1) // size, int(math.ceil(rect.right() / fx)) // size)
+        bottom = min((image.height() - 1) // size, int(math.ceil(rect.bottom() / fy)) // size)
+
+        overlay = overlay_color.rgba() if overlay_color else None
+        # Antialiased edges would leave seams between the tiles
+        antialiasing = painter.testRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for row in range(top, bottom + 1):
+            for column in range(left, right + 1):
+                pixmap, source = self._tile(level, column, row, overlay_color, overlay)
+                target = QRectF(column * size * fx, row * size * fy, source.width() * fx, source.height() * fy)
+                painter.drawPixmap(target, pixmap, source)
+        painter.setRenderHint(QPainter.Antialiasing, antialiasing)
+
+    def _tile(self, level, column, row, overlay_color, overlay):
+        key = (level, column, row, overlay)
+        entry = self._tiles.get(key)
+        if entry is not None:
+            self._tiles.move_to_end(key)
+            return entry[:2]
+        image = self.levels[level]
+        size = self.tile_size
+        x, y = column * size, row * size
+        width, height = min(size, image.width() - x), min(size, image.height() - y)
+        # A border of one pixel from the neighbouring tiles, so that smooth
+        # scaling samples across the tile edges instead of leaving seams
+        left, top = min(1, x), min(1, y)
+        right, bottom = min(1, image.width() - x - width), min(1, image.height() - y - height)
+        pixmap = QPixmap.fromImage(image.copy(x - left, y - top, width + left + right, height + top + bottom))
+        source = QRectF(left, top, width, height)
+        if overlay_color:
+            painter = QPainter(pixmap)
+            painter.setCompositionMode(QPainter.CompositionMode_Overlay)
+            painter.fillRect(pixmap.rect(), overlay_color)
+            painter.end()
+        nbytes = pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+        self._tiles[key] = (pixmap, source, nbytes)
+        self.used_bytes += nbytes
+        while self.used_bytes > self.budget_bytes and len(self._tiles) > 1:
+            _, (_, _, old_bytes) = self._tiles.popitem(last=False)
+            self.used_bytes -= old_bytes
+        return pixmap, source
+
+    def _on_built(self, generation, level, image):
+        if generation != self.generation or level != len(self.levels):
+            return
+        self.levels.append(image)
+        self.level_ready.emit(level)
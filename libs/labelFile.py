@@ -10,6 +10,7 @@ import os.path
 from enum import Enum
 
 from libs.create_ml_io import CreateMLWriter
+from libs.image_header import image_size_cache
 from libs.pascal_voc_io import PascalVocWriter
 from libs.pascal_voc_io import XML_EXT
 from libs.yolo_io import YOLOWriter
@@ -36,18 +37,17 @@ class LabelFile(object):
         self.image_data = None
         self.verified = False
 
-    def save_create_ml_format(self, filename, shapes, image_path, image_data, class_list, line_color=None, fill_color=None, database_src=None):
+    def save_create_ml_format(self, filename, shapes, image_path, image_data, class_list, line_color=None, fill_color=None, database_src=None,
+                              flush=True):
         img_folder_name = os.path.basename(os.path.dirname(image_path))
         img_file_name = os.path.basename(image_path)
 
-        image = QImage()
-        image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
+        image_shape = LabelFile.image_shape(image_path, image_data)
         writer = CreateMLWriter(img_folder_name, img_file_name,
                                 image_shape, shapes, filename, local_img_path=image_path)
         writer.verified = self.verified
-        writer.write()
+        # With flush=False the JSON file is written by create_ml_stores.flush()
+        writer.write(flush)
         return
 
 
@@ -57,15 +57,7 @@ class LabelFile(object):
         img_folder_name = os.path.split(img_folder_path)[-1]
         img_file_name = os.path.basename(image_path)
         # imgFileNameWithoutExt = os.path.splitext(img_file_name)[0]
-        # Read from file path because self.imageData might be empty if saving to
-        # Pascal format
-        if isinstance(image_data, QImage):
-            image = image_data
-        else:
-            image = QImage()
-            image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
+        image_shape = LabelFile.image_shape(image_path, image_data)
         writer = PascalVocWriter(img_folder_name, img_file_name,
                                  image_shape, local_img_path=image_path)
         writer.verified = self.verified
@@ -87,15 +79,7 @@ class LabelFile(object):
         img_folder_name = os.path.split(img_folder_path)[-1]
         img_file_name = os.path.basename(image_path)
         # imgFileNameWithoutExt = os.path.splitext(img_file_name)[0]
-        # Read from file path because self.imageData might be empty if saving to
-        # Pascal format
-        if isinstance(image_data, QImage):
-            image = image_data
-        else:
-            image = QImage()
-            image.load(image_path)
-        image_shape = [image.height(), image.width(),
-                       1 if image.isGrayscale() else 3]
+        image_shape = LabelFile.image_shape(image_path, image_data)
         writer = YOLOWriter(img_folder_name, img_file_name,
                             image_shape, local_img_path=image_path)
         writer.verified = self.verified
@@ -143,6 +127,18 @@ class LabelFile(object):
                     f, ensure_ascii=True, indent=2)
     '''
 
+    @staticmethod
+    def image_shape(image_path, image_data=None):
+        """
+        [height, width, depth] of the image. The pixels are never decoded for
+        it: the size comes from the file header, cached per path, and from
+        image_data only when it is a decoded QImage and the header is unreadable.
+        """
+        image = image_data if isinstance(image_data, QImage) else None
+        shape = image_size_cache.shape(image_path, image)
+        # Same as the shape of a null QImage
+        return shape if shape is not None else [0, 0, 3]
+
     @staticmethod
     def is_label_file(filename):
         file_suffix = os.path.splitext(filename)[1].lower()
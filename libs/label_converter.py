@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Headless batch conversion of annotations between PascalVOC, YOLO and CreateML.
+
+    labelImg-convert IMAGE_DIR --from voc --to yolo --classes classes.txt
+
+The images under IMAGE_DIR are walked with os.scandir and converted in chunks
+on a ProcessPoolExecutor, using the same readers and writers as the GUI. No
+QApplication is created: image sizes are read from the file headers with
+libs.image_header, or taken from the <size> of a PascalVOC file.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+try:
+    from PyQt5.QtGui import QImageReader
+except ImportError:
+    from PyQt4.QtGui import QImageReader
+
+from libs.constants import FORMAT_PASCALVOC, FORMAT_YOLO, FORMAT_CREATEML
+from libs.create_ml_io import CreateMLReader, CreateMLWriter
+from libs.dataset_index import annotation_paths
+from libs.dir_scanner import iter_image_paths
+from libs.image_header import probe_image_size
+from libs.labelFile import LabelFile
+from libs.pascal_voc_io import PascalVocReader, PascalVocWriter
+from libs.yolo_io import YoloReader, YOLOWriter, write_class_list
+
+FORMATS = {
+    'voc': FORMAT_PASCALVOC,
+    'yolo': FORMAT_YOLO,
+    'createml': FORMAT_CREATEML,
+}
+
+class ImageInfo(object):
+    """Size of an image, with the part of the QImage interface the readers use."""
+
+    def __init__(self, width, height, depth=3):
+        self._width = width
+        self._height = height
+        self.depth = depth
+
+    @staticmethod
+    def probe(image_path):
+        """Read the size from the image header without decoding the pixels."""
+        size = probe_image_size(image_path)
+        if size is None:
+            raise IOError('cannot read image size of %s' % image_path)
+        return ImageInfo(*size)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def isGrayscale(self):
+        return self.depth == 1
+
+    def shape(self):
+        return [self._height, self._width, self.depth]
+
+
+class ConversionOptions(object):
+
+    def __init__(self, source_format, target_format, source_dir=None, target_dir=None,
+                 class_list=None, overwrite=False):
+        self.source_format = source_format
+        self.target_format = target_format
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.class_list = class_list
+        self.overwrite = overwrite
+
+
+def annotation_path(image_path, annotation_format, save_dir=None):
+    for path, path_format in annotation_paths(image_path, save_dir):
+        if path_format == annotation_format:
+            return path
+
+
+def read_shapes(image_path, annotation_file, options):
+    """Return (shapes, verified, image_info) read from annotation_file."""
+    image_info = None
+    if options.source_format == FORMAT_PASCALVOC:
+        reader = PascalVocReader(annotation_file)
+        if reader.parse_error is not None:
+            raise reader.parse_error
+        if reader.img_size is not None:
+            height, width, depth = reader.img_size
+            image_info = ImageInfo(width, height, depth)
+    elif options.source_format == FORMAT_YOLO:
+        # YOLO boxes are relative to the image size
+        image_info = ImageInfo.probe(image_path)
+        reader = YoloReader(annotation_file, image_info)
+    else:
+        reader = CreateMLReader(annotation_file, image_path)
+    shapes = [dict(label=label, points=points, difficult=difficult)
+              for label, points, _, _, difficult in reader.get_shapes()]
+    if options.source_format == FORMAT_CREATEML:
+        # CreateML has no difficult flag, the reader marks every box as difficult
+        for shape in shapes:
+            shape['difficult'] = False
+    return shapes, reader.verified, image_info
+
+
+def write_shapes(image_path, target_file, shapes, verified, image_info, options):
+    folder_name = os.path.basename(os.path.dirname(image_path))
+    file_name = os.path.basename(image_path)
+    if options.target_format == FORMAT_CREATEML:
+        writer = CreateMLWriter(folder_name, file_name, image_info.shape() if image_info else None,
+                                shapes, target_file, local_img_path=image_path)
+        writer.verified = verified
+        writer.write()
+        return
+
+    if image_info is None:
+        image_info = ImageInfo.probe(image_path)
+    if options.target_format == FORMAT_PASCALVOC:
+        writer = PascalVocWriter(folder_name, file_name, image_info.shape(), local_img_path=image_path)
+    else:
+        writer = YOLOWriter(folder_name, file_name, image_info.shape(), local_img_path=image_path)
+    writer.verified = verified
+    for shape in shapes:
+        if options.target_format == FORMAT_YOLO and shape['label'] not in options.class_list:
+            raise ValueError('label "%s" is not in the class list' % shape['label'])
+        bnd_box = LabelFile.convert_points_to_bnd_box(shape['points'])
+        writer.add_bnd_box(bnd_box[0], bnd_box[1], bnd_box[2], bnd_box[3], shape['label'], int(shape['difficult']))
+    if options.target_format == FORMAT_PASCALVOC:
+        writer.save(target_file=target_file)
+    else:
+        # classes.txt is written once by the main process
+        writer.save(class_list=options.class_list, target_file=target_file, write_class_file=False)
+
+
+def convert_file(image_path, options):
+    """
+    Convert the annotation of image_path. Return the written annotation path,
+    or None if the image has no annotation in the source format.
+    """
+    source_file = annotation_path(image_path, options.source_format, options.source_dir)
+    if not os.path.isfile(source_file):
+        return None
+    target_file = annotation_path(image_path, options.target_format, options.target_dir)
+    if not options.overwrite and os.path.exists(target_file):
+        raise IOError('%s exists, use --overwrite to replace it' % target_file)
+    shapes, verified, image_info = read_shapes(image_path, source_file, options)
+    write_shapes(image_path, target_file, shapes, verified, image_info, options)
+    return target_file
+
+
+_worker_options = None
+
+
+def _init_worker(options):
+    global _worker_options
+    _worker_options = options
+
+
+def convert_chunk(image_paths, options=None):
+    """
+    Convert a chunk of images. Return (converted, skipped, errors, target_dirs)
+    where errors is a list of (image_path, message).
+    """
+    options = options if options is not None else _worker_options
+    converted, skipped, errors, target_dirs = 0, 0, [], set()
+    for image_path in image_paths:
+        try:
+            target_file = convert_file(image_path, options)
+        except Exception as e:
+            errors.append((image_path, '%s: %s' % (type(e).__name__, e)))
+            continue
+        if target_file is None:
+            skipped += 1
+        else:
+            converted += 1
+            target_dirs.add(os.path.dirname(target_file))
+    return converted, skipped, errors, target_dirs
+
+
+def iter_chunks(paths, chunk_size):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def image_extensions():
+    return ['.%s' % fmt.data().decode('ascii').lower() for fmt in QImageReader.supportedImageFormats()]
+
+
+def convert_dir(image_dir, options, workers=None, chunk_size=64, log=None):
+    """
+    Convert the annotations of every image under image_dir. Chunks are
+    submitted as the directory walk goes, with a bounded number in flight.
+    Return (converted, skipped, errors, elapsed seconds).
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    converted, skipped, errors, target_dirs = 0, 0, [], set()
+    start = time.time()
+
+    def collect(future):
+        nonlocal converted, skipped
+        c, s, e, d = future.result()
+        converted += c
+        skipped += s
+        errors.extend(e)
+        target_dirs.update(d)
+        if log is not None:
+            for image_path, message in e:
+                log('error: %s: %s' % (image_path, message))
+
+    chunks = iter_chunks(iter_image_paths(image_dir, image_extensions()), chunk_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(convert_chunk, chunk))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        for future in pending:
+            collect(future)
+
+    if options.target_format == FORMAT_YOLO:
+        for target_dir in target_dirs:
+            write_class_list(os.path.join(target_dir, 'classes.txt'), options.class_list)
+    return converted, skipped, errors, time.time() - start
+
+
+def read_class_list(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='labelImg-convert',
+        description='Convert annotations between PascalVOC, YOLO and CreateML without the GUI.')
+    parser.add_argument('image_dir', help='directory of the images, searched recursively')
+    parser.add_argument('--from', dest='source', required=True, choices=sorted(FORMATS), help='source format')
+    parser.add_argument('--to', dest='target', required=True, choices=sorted(FORMATS), help='target format')
+    parser.add_argument('--source-dir', help='directory of the source annotations (default: next to the images)')
+    parser.add_argument('--target-dir', help='directory to write the annotations to (default: next to the images)')
+    parser.add_argument('--classes', help='class list for YOLO output, one label per line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=64, help='images per task sent to a worker')
+    parser.add_argument('--overwrite', action='store_true', help='replace existing target annotations')
+    args = parser.parse_args(argv)
+
+    if args.source == args.target:
+        parser.error('--from and --to are the same format')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    class_list = None
+    if FORMATS[args.target] == FORMAT_YOLO:
+        if not args.classes:
+            parser.error('--classes is required when converting to yolo')
+        class_list = read_class_list(args.classes)
+    if args.target_dir and not os.path.isdir(args.target_dir):
+        os.makedirs(args.target_dir)
+
+    options = ConversionOptions(FORMATS[args.source], FORMATS[args.target], args.source_dir, args.target_dir,
+                                class_list, args.overwrite)
+    converted, skipped, errors, elapsed = convert_dir(
+        args.image_dir, options, args.workers, args.chunk_size, log=lambda message: print(message, file=sys.stderr))
+
+    processed = converted + skipped + len(errors)
+    print('Converted %d files in %.2fs (%.1f files/s), %d without %s annotation, %d errors'
+          % (converted, elapsed, processed / elapsed if elapsed > 0 else 0.0, skipped, args.source, len(errors)))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 import sys
-from xml.etree import ElementTree
-from xml.etree.ElementTree import Element, SubElement
+from collections import OrderedDict
+
+import numpy as np
 from lxml import etree
-import codecs
+from lxml.etree import Element, SubElement
+from libs.atomic_file import atomic_write
 from libs.constants import DEFAULT_ENCODING
 from libs.ustr import ustr
 
@@ -25,14 +27,11 @@ class PascalVocWriter:
 
     def prettify(self, elem):
         """
-            Return a pretty-printed XML string for the Element.
+            Return the tab indented XML bytes of the Element.
+            The tree is indented in place and serialized once by lxml.
         """
-        rough_string = ElementTree.tostring(elem, 'utf8')
-        root = etree.fromstring(rough_string)
-        return etree.tostring(root, pretty_print=True, encoding=ENCODE_METHOD).replace("  ".encode(), "\t".encode())
-        # minidom does not support UTF-8
-        # reparsed = minidom.parseString(rough_string)
-        # return reparsed.toprettyxml(indent="\t", encoding=ENCODE_METHOD)
+        etree.indent(elem, space='\t')
+        return etree.tostring(elem, encoding=ENCODE_METHOD) + b'\n'
 
     def gen_xml(self):
         """
@@ -84,6 +83,7 @@ class PascalVocWriter:
         self.box_list.append(bnd_box)
 
     def append_objects(self, top):
+        img_height, img_width = int(float(self.img_size[0])), int(float(self.img_size[1]))
         for each_object in self.box_list:
             object_item = SubElement(top, 'object')
             name = SubElement(object_item, 'name')
@@ -91,81 +91,124 @@ class PascalVocWriter:
             pose = SubElement(object_item, 'pose')
             pose.text = "Unspecified"
             truncated = SubElement(object_item, 'truncated')
-            if int(float(each_object['ymax'])) == int(float(self.img_size[0])) or (int(float(each_object['ymin'])) == 1):
+            x_min, y_min = int(float(each_object['xmin'])), int(float(each_object['ymin']))
+            x_max, y_max = int(float(each_object['xmax'])), int(float(each_object['ymax']))
+            if y_max == img_height or y_min == 1:
                 truncated.text = "1"  # max == height or min
-            elif (int(float(each_object['xmax'])) == int(float(self.img_size[1]))) or (int(float(each_object['xmin'])) == 1):
+            elif x_max == img_width or x_min == 1:
                 truncated.text = "1"  # max == width or min
             else:
                 truncated.text = "0"
             difficult = SubElement(object_item, 'difficult')
             difficult.text = str(bool(each_object['difficult']) & 1)
             bnd_box = SubElement(object_item, 'bndbox')
-            x_min = SubElement(bnd_box, 'xmin')
-            x_min.text = str(each_object['xmin'])
-            y_min = SubElement(bnd_box, 'ymin')
-            y_min.text = str(each_object['ymin'])
-            x_max = SubElement(bnd_box, 'xmax')
-            x_max.text = str(each_object['xmax'])
-            y_max = SubElement(bnd_box, 'ymax')
-            y_max.text = str(each_object['ymax'])
+            for key in ('xmin', 'ymin', 'xmax', 'ymax'):
+                SubElement(bnd_box, key).text = str(each_object[key])
 
     def save(self, target_file=None):
         root = self.gen_xml()
         self.append_objects(root)
-        out_file = None
         if target_file is None:
-            out_file = codecs.open(
-                self.filename + XML_EXT, 'w', encoding=ENCODE_METHOD)
-        else:
-            out_file = codecs.open(target_file, 'w', encoding=ENCODE_METHOD)
-
-        prettify_result = self.prettify(root)
-        out_file.write(prettify_result.decode('utf8'))
-        out_file.close()
+            target_file = self.filename + XML_EXT
+        with atomic_write(target_file, 'wb') as out_file:
+            out_file.write(self.prettify(root))
 
 
 class PascalVocReader:
+    """
+    Reads a PascalVOC file with lxml.etree.iterparse. Each <object> is
+    cleared once its label, difficult flag and box are taken, so memory use
+    does not depend on the DOM of the whole file. The boxes are kept as NumPy
+    arrays; the shape tuples of get_shapes() are only built when asked for.
+    """
 
     def __init__(self, file_path):
         # shapes type:
         # [labbel, [(x1,y1), (x2,y2), (x3,y3), (x4,y4)], color, color, difficult]
-        self.shapes = []
+        self._shapes = None
         self.file_path = file_path
         self.verified = False
+        # [height, width, depth] from the <size> element, if present
+        self.img_size = None
+        # Label of each object, in file order
+        self.labels = []
+        # (N, 4) int32 array of xmin, ymin, xmax, ymax and (N,) bool array
+        self.boxes = np.zeros((0, 4), dtype=np.int32)
+        self.difficult = np.zeros(0, dtype=bool)
+        self.parse_error = None
         try:
             self.parse_xml()
-        except:
-            pass
+        except Exception as e:
+            self.parse_error = e
+
+    @property
+    def shapes(self):
+        if self._shapes is None:
+            self._shapes = [(label, [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)],
+                             None, None, difficult)
+                            for label, (x_min, y_min, x_max, y_max), difficult
+                            in zip(self.labels, self.boxes.tolist(), self.difficult.tolist())]
+        return self._shapes
 
     def get_shapes(self):
         return self.shapes
 
-    def add_shape(self, label, bnd_box, difficult):
-        x_min = int(float(bnd_box.find('xmin').text))
-        y_min = int(float(bnd_box.find('ymin').text))
-        x_max = int(float(bnd_box.find('xmax').text))
-        y_max = int(float(bnd_box.find('ymax').text))
-        points = [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
-        self.shapes.append((label, points, None, None, difficult))
+    def get_box_arrays(self):
+        """
+        Return (boxes, label_ids, label_names, difficult) without building the
+        shape tuples: boxes is the (N, 4) int32 array of xmin, ymin, xmax,
+        ymax, label_ids an (N,) int32 array indexing label_names, the labels
+        in order of first appearance, and difficult an (N,) bool array.
+        """
+        label_names = list(OrderedDict.fromkeys(self.labels))
+        ids = {label: i for i, label in enumerate(label_names)}
+        label_ids = np.fromiter((ids[label] for label in self.labels), dtype=np.int32, count=len(self.labels))
+        return self.boxes, label_ids, label_names, self.difficult
 
     def parse_xml(self):
         assert self.file_path.endswith(XML_EXT), "Unsupported file format"
-        parser = etree.XMLParser(encoding=ENCODE_METHOD)
-        xml_tree = ElementTree.parse(self.file_path, parser=parser).getroot()
-        filename = xml_tree.find('filename').text
-        try:
-            verified = xml_tree.attrib['verified']
-            if verified == 'yes':
-                self.verified = True
-        except KeyError:
-            self.verified = False
-
-        for object_iter in xml_tree.findall('object'):
-            bnd_box = object_iter.find("bndbox")
-            label = object_iter.find('name').text
-            # Add chris
-            difficult = False
-            if object_iter.find('difficult') is not None:
-                difficult = bool(int(object_iter.find('difficult').text))
-            self.add_shape(label, bnd_box, difficult)
+        labels, coordinates, difficult = [], [], []
+        context = etree.iterparse(self.file_path, events=('start', 'end'), tag=('annotation', 'size', 'object'),
+                                  encoding=ENCODE_METHOD)
+        for event, elem in context:
+            if event == 'start':
+                if elem.tag == 'annotation' and elem.getparent() is None:
+                    self.verified = elem.get('verified') == 'yes'
+                continue
+            parent = elem.getparent()
+            if parent is None or parent.getparent() is not None:
+                # Not a child of the root element
+                continue
+            if elem.tag == 'size':
+                self.parse_size(elem)
+            else:
+                label, bnd_box, is_difficult = None, None, False
+                # Only the direct children, the <part>s of an object have their own name and box
+                for child in elem:
+                    if child.tag == 'name':
+                        label = child.text
+                    elif child.tag == 'difficult':
+                        is_difficult = bool(int(child.text))
+                    elif child.tag == 'bndbox':
+                        bnd_box = {box_child.tag: box_child.text for box_child in child}
+                labels.append(label)
+                coordinates.extend(bnd_box[key] for key in ('xmin', 'ymin', 'xmax', 'ymax'))
+                difficult.append(is_difficult)
+                # Drop the object and the siblings read before it
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del parent[0]
+        # int(float(text)) for every coordinate at once
+        boxes = np.array(coordinates, dtype=np.float64).reshape(-1, 4)
+        self.boxes = np.trunc(boxes).astype(np.int32)
+        self.difficult = np.array(difficult, dtype=bool)
+        self.labels = labels
+        self._shapes = None
         return True
+
+    def parse_size(self, size):
+        width, height = size.find('width'), size.find('height')
+        if width is not None and height is not None:
+            depth = size.find('depth')
+            self.img_size = [int(float(height.text)), int(float(width.text)),
+                             int(depth.text) if depth is not None and depth.text else 3]
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtCore import QThread, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QThread, pyqtSignal
+
+
+class SaveQueue(QThread):
+    """
+    Writes annotation files on a single worker thread. A job is a callable
+    doing the write from a snapshot of the shapes taken on the GUI thread.
+    Jobs are keyed by annotation path: submitting a path that is still
+    waiting replaces its job, so repeated saves of one file cost one write.
+
+    saved(image_path, annotation_path) and failed(annotation_path, message)
+    are emitted from the worker thread and delivered to the GUI thread.
+    """
+    saved = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super(SaveQueue, self).__init__(parent)
+        self._condition = threading.Condition()
+        # annotation path -> (image path, job)
+        self._pending = OrderedDict()
+        self._running = None
+        self._stopping = False
+
+    def submit(self, annotation_path, image_path, job):
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError('save queue is shut down')
+            self._pending[annotation_path] = (image_path, job)
+            self._condition.notify_all()
+        if not self.isRunning():
+            self.start()
+
+    def has_pending(self):
+        with self._condition:
+            return bool(self._pending) or self._running is not None
+
+    def wait_for_image(self, image_path):
+        """Block until no write of image_path is waiting or running."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._is_busy_with(image_path))
+
+    def flush(self):
+        """Block until every submitted write is done."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and self._running is None)
+
+    def shutdown(self):
+        self.flush()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self.wait()
+
+    def _is_busy_with(self, image_path):
+        if self._running is not None and self._running[0] == image_path:
+            return True
+        return any(pending_image == image_path for pending_image, _ in self._pending.values())
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+                annotation_path, (image_path, job) = self._pending.popitem(last=False)
+                self._running = (image_path, annotation_path)
+            try:
+                job()
+            except Exception as e:
+                self.failed.emit(annotation_path, '%s: %s' % (type(e).__name__, e))
+            else:
+                self.saved.emit(image_path, annotation_path)
+            finally:
+                with self._condition:
+                    self._running = None
+                    self._condition.notify_all()
@@ -10,7 +10,6 @@ except ImportError:
     from PyQt4.QtCore import *
 
 from libs.utils import distance
-import sys
 
 DEFAULT_LINE_COLOR = QColor(0, 255, 0, 128)
 DEFAULT_FILL_COLOR = QColor(255, 0, 0, 128)
@@ -39,6 +38,17 @@ class Shape(object):
     label_font_size = 8
 
     def __init__(self, label=None, line_color=None, difficult=False, paint_label=False):
+        # Told about point changes, e.g. the ShapeGrid of the canvas
+        self.listener = None
+        # Paths and bounding rect built from the points, see points_changed()
+        self._path = None
+        self._line_path = None
+        self._vertex_path = None
+        self._vertex_path_key = None
+        self._bounding_rect = None
+        self._axis_aligned = None
+        self._fragments = None
+        self._fragments_key = None
         self.label = label
         self.points = []
         self.fill = False
@@ -62,8 +72,25 @@ class Shape(object):
             # is used for drawing the pending line a different color.
             self.line_color = line_color
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self.points_changed()
+
+    def points_changed(self):
+        """Must be called after changing a point in place, e.g. point += offset."""
+        self._path = self._line_path = self._vertex_path = self._bounding_rect = self._axis_aligned = None
+        self._fragments = None
+        if self.listener is not None:
+            self.listener.shape_changed(self)
+
     def close(self):
         self._closed = True
+        self._line_path = None
 
     def reach_max_points(self):
         if len(self.points) >= 4:
@@ -73,10 +100,13 @@ class Shape(object):
     def add_point(self, point):
         if not self.reach_max_points():
             self.points.append(point)
+            self.points_changed()
 
     def pop_point(self):
         if self.points:
-            return self.points.pop()
+            point = self.points.pop()
+            self.points_changed()
+            return point
         return None
 
     def is_closed(self):
@@ -84,6 +114,7 @@ class Shape(object):
 
     def set_open(self):
         self._closed = False
+        self._line_path = None
 
     def paint(self, painter):
         if self.points:
@@ -93,20 +124,8 @@ class Shape(object):
             pen.setWidth(max(1, int(round(2.0 / self.scale))))
             painter.setPen(pen)
 
-            line_path = QPainterPath()
-            vertex_path = QPainterPath()
-
-            line_path.moveTo(self.points[0])
-            # Uncommenting the following line will draw 2 paths
-            # for the 1st vertex, and make it non-filled, which
-            # may be desirable.
-            # self.drawVertex(vertex_path, 0)
-
-            for i, p in enumerate(self.points):
-                line_path.lineTo(p)
-                self.draw_vertex(vertex_path, i)
-            if self.is_closed():
-                line_path.lineTo(self.points[0])
+            line_path = self.line_path()
+            vertex_path = self.vertex_path()
 
             painter.drawPath(line_path)
             painter.drawPath(vertex_path)
@@ -114,27 +133,67 @@ class Shape(object):
 
             # Draw text at the top-left
             if self.paint_label:
-                min_x = sys.maxsize
-                min_y = sys.maxsize
-                min_y_label = int(1.25 * self.label_font_size)
-                for point in self.points:
-                    min_x = min(min_x, point.x())
-                    min_y = min(min_y, point.y())
-                if min_x != sys.maxsize and min_y != sys.maxsize:
-                    font = QFont()
-                    font.setPointSize(self.label_font_size)
-                    font.setBold(True)
-                    painter.setFont(font)
-                    if self.label is None:
-                        self.label = ""
-                    if min_y < min_y_label:
-                        min_y += min_y_label
-                    painter.drawText(int(min_x), int(min_y), self.label)
+                self.draw_label(painter)
 
             if self.fill:
                 color = self.select_fill_color if self.selected else self.fill_color
                 painter.fillPath(line_path, color)
 
+    def draw_label(self, painter):
+        rect = self.bounding_rect()
+        min_x = rect.left()
+        min_y = rect.top()
+        min_y_label = int(1.25 * self.label_font_size)
+        font = QFont()
+        font.setPointSize(self.label_font_size)
+        font.setBold(True)
+        painter.setFont(font)
+        if self.label is None:
+            self.label = ""
+        if min_y < min_y_label:
+            min_y += min_y_label
+        painter.drawText(int(min_x), int(min_y), self.label)
+
+    def line_path(self):
+        """Outline through all points, back to the first one if closed."""
+        if self._line_path is None:
+            line_path = QPainterPath()
+            line_path.moveTo(self.points[0])
+            for p in self.points:
+                line_path.lineTo(p)
+            if self.is_closed():
+                line_path.lineTo(self.points[0])
+            self._line_path = line_path
+        return self._line_path
+
+    def vertex_path(self):
+        """Vertex markers, rebuilt when the scale or the highlighted vertex changes."""
+        key = (self.scale, self.point_size, self.point_type, self._highlight_index, self._highlight_mode)
+        if self._vertex_path is None or self._vertex_path_key != key:
+            vertex_path = QPainterPath()
+            # Uncommenting the following line will draw 2 paths
+            # for the 1st vertex, and make it non-filled, which
+            # may be desirable.
+            # self.drawVertex(vertex_path, 0)
+            for i in range(len(self.points)):
+                self.draw_vertex(vertex_path, i)
+            self._vertex_path = vertex_path
+            self._vertex_path_key = key
+        # Set by draw_vertex() as well, which a cached path skips
+        if self._highlight_index is not None:
+            self.vertex_fill_color = self.h_vertex_fill_color
+        else:
+            self.vertex_fill_color = Shape.vertex_fill_color
+        return self._vertex_path
+
+    def vertex_fragments(self, source, scale):
+        """Pixmap fragments putting the source rect of a vertex marker image on every point."""
+        key = (source.width(), source.height(), scale)
+        if self._fragments is None or self._fragments_key != key:
+            self._fragments = [QPainter.PixmapFragment.create(p, source, scale, scale) for p in self.points]
+            self._fragments_key = key
+        return self._fragments
+
     def draw_vertex(self, path, i):
         d = self.point_size / self.scale
         shape = self.point_type
@@ -166,19 +225,34 @@ class Shape(object):
         return self.make_path().contains(point)
 
     def make_path(self):
-        path = QPainterPath(self.points[0])
-        for p in self.points[1:]:
-            path.lineTo(p)
-        return path
+        if self._path is None:
+            path = QPainterPath(self.points[0])
+            for p in self.points[1:]:
+                path.lineTo(p)
+            self._path = path
+        return self._path
 
     def bounding_rect(self):
-        return self.make_path().boundingRect()
+        if self._bounding_rect is None:
+            self._bounding_rect = self.make_path().boundingRect()
+        return QRectF(self._bounding_rect)
+
+    def is_axis_aligned_rect(self):
+        """True for four points tracing a rectangle with horizontal and vertical sides."""
+        if self._axis_aligned is None:
+            self._axis_aligned = False
+            if len(self.points) == 4:
+                p0, p1, p2, p3 = self.points
+                self._axis_aligned = (p0.y() == p1.y() and p1.x() == p2.x() and p2.y() == p3.y() and p3.x() == p0.x()) or \
+                                     (p0.x() == p1.x() and p1.y() == p2.y() and p2.x() == p3.x() and p3.y() == p0.y())
+        return self._axis_aligned
 
     def move_by(self, offset):
         self.points = [p + offset for p in self.points]
 
     def move_vertex_by(self, i, offset):
         self.points[i] = self.points[i] + offset
+        self.points_changed()
 
     def highlight_vertex(self, i, action):
         self._highlight_index = i
@@ -208,3 +282,4 @@ class Shape(object):
 
     def __setitem__(self, key, value):
         self.points[key] = value
+        self.points_changed()
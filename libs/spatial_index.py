@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Uniform grid over the bounding rectangles of the canvas shapes.
+
+Hit tests (hover, click selection, rubber band selection) only look at the
+shapes filed in the grid cells around the mouse position or the selection
+box instead of every shape on the canvas. Shapes report point changes to
+the grid, which files them again before the next query.
+"""
+import math
+
+
+class ShapeGrid(object):
+    """
+    Shapes filed by the grid cells their bounding rectangle overlaps.
+    Queries return the shapes in insertion order, which is the z-order of
+    the canvas: a shape inserted later is painted on top.
+    """
+
+    def __init__(self, cell_size=128, max_cells_per_shape=1024):
+        self.cell_size = float(cell_size)
+        self.max_cells_per_shape = max_cells_per_shape
+        self.source = None
+        self._cells = {}
+        # shape -> (sequence number, cell keys or None when oversized, bounds)
+        self._entries = {}
+        # Shapes covering too many cells are checked by every query
+        self._oversized = set()
+        self._dirty = set()
+        self._next_seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, shape):
+        return shape in self._entries
+
+    def rebuild(self, shapes):
+        self.clear()
+        self.source = shapes
+        for shape in shapes:
+            self.insert(shape)
+
+    def clear(self):
+        for shape in self._entries:
+            shape.listener = None
+        self.source = None
+        self._cells.clear()
+        self._entries.clear()
+        self._oversized.clear()
+        self._dirty.clear()
+        self._next_seq = 0
+
+    def insert(self, shape):
+        """Add shape on top of the shapes already in the grid."""
+        if shape in self._entries:
+            self.remove(shape)
+        seq = self._next_seq
+        self._next_seq += 1
+        self._entries[shape] = (seq, None, None)
+        self._file(shape, seq)
+        shape.listener = self
+
+    def remove(self, shape):
+        entry = self._entries.pop(shape, None)
+        if entry is None:
+            return
+        self._unfile(shape, entry[1])
+        self._dirty.discard(shape)
+        if shape.listener is self:
+            shape.listener = None
+
+    def shape_changed(self, shape):
+        """Called by a shape whose points changed; it is filed again lazily."""
+        if shape in self._entries:
+            self._dirty.add(shape)
+
+    def query_rect(self, x1, y1, x2, y2):
+        """Return the shapes whose bounding rectangle intersects the rectangle, bottom to top."""
+        self._refresh()
+        found = set(self._oversized)
+        size = self.cell_size
+        columns = math.floor(x2 / size) - math.floor(x1 / size) + 1
+        rows = math.floor(y2 / size) - math.floor(y1 / size) + 1
+        if columns * rows > len(self._cells):
+            # A large rectangle, e.g. the whole canvas zoomed out: walk the occupied cells instead
+            for cell in self._cells.values():
+                found.update(cell)
+        else:
+            for key in self._cell_keys(x1, y1, x2, y2):
+                cell = self._cells.get(key)
+                if cell:
+                    found.update(cell)
+        entries = self._entries
+        result = []
+        for shape in found:
+            seq, _, bounds = entries[shape]
+            if bounds is not None and bounds[0] <= x2 and x1 <= bounds[2] and bounds[1] <= y2 and y1 <= bounds[3]:
+                result.append((seq, shape))
+        result.sort(key=lambda item: item[0])
+        return [shape for _, shape in result]
+
+    def query_point(self, x, y, radius=0.0):
+        """Return the shapes whose bounding rectangle is within radius of (x, y), bottom to top."""
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
+
+    def _refresh(self):
+        while self._dirty:
+            shape = self._dirty.pop()
+            seq, keys, _ = self._entries[shape]
+            self._unfile(shape, keys)
+            self._file(shape, seq)
+
+    def _file(self, shape, seq):
+        bounds = _bounds(shape)
+        keys = ()
+        if bounds is not None:
+            x1, y1, x2, y2 = bounds
+            columns = math.floor(x2 / self.cell_size) - math.floor(x1 / self.cell_size) + 1
+            rows = math.floor(y2 / self.cell_size) - math.floor(y1 / self.cell_size) + 1
+            if columns * rows > self.max_cells_per_shape:
+                self._oversized.add(shape)
+                keys = None
+            else:
+                keys = tuple(self._cell_keys(x1, y1, x2, y2))
+                for key in keys:
+                    self._cells.setdefault(key, set()).add(shape)
+        self._entries[shape] = (seq, keys, bounds)
+
+    def _unfile(self, shape, keys):
+        if keys is None:
+            self._oversized.discard(shape)
+            return
+        for key in keys:
+            cell = self._cells.get(key)
+            if cell is not None:
+                cell.discard(shape)
+                if not cell:
+                    del self._cells[key]
+
+    def _cell_keys(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for cx in range(math.floor(x1 / size), math.floor(x2 / size) + 1):
+            for cy in range(math.floor(y1 / size), math.floor(y2 / size) + 1):
+                yield cx, cy
+
+
+def _bounds(shape):
+    """(x1, y1, x2, y2) of the points of shape, or None if it has none."""
+    points = shape.points
+    if not points:
+        return None
+    xs = [p.x() for p in points]
+    ys = [p.y() for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
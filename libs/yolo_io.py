@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
-import codecs
 import os
+import threading
+from collections import OrderedDict
 
+import numpy as np
+
+from libs.atomic_file import atomic_write
 from libs.constants import DEFAULT_ENCODING
 
 TXT_EXT = '.txt'
@@ -46,36 +50,158 @@ class YOLOWriter:
 
         return class_index, x_center, y_center, w, h
 
-    def save(self, class_list=[], target_file=None):
-
-        out_file = None  # Update yolo .txt
-        out_class_file = None   # Update class list .txt
-
+    def save(self, class_list=[], target_file=None, write_class_file=True):
+        # Update yolo .txt
         if target_file is None:
-            out_file = open(
-            self.filename + TXT_EXT, 'w', encoding=ENCODE_METHOD)
+            target_file = self.filename + TXT_EXT
             classes_file = os.path.join(os.path.dirname(os.path.abspath(self.filename)), "classes.txt")
-            out_class_file = open(classes_file, 'w')
-
         else:
-            out_file = codecs.open(target_file, 'w', encoding=ENCODE_METHOD)
             classes_file = os.path.join(os.path.dirname(os.path.abspath(target_file)), "classes.txt")
-            out_class_file = open(classes_file, 'w')
 
-
-        for box in self.box_list:
-            class_index, x_center, y_center, w, h = self.bnd_box_to_yolo_line(box, class_list)
-            # print (classIndex, x_center, y_center, w, h)
-            out_file.write("%d %.6f %.6f %.6f %.6f\n" % (class_index, x_center, y_center, w, h))
+        with atomic_write(target_file, 'w', encoding=ENCODE_METHOD) as out_file:
+            out_file.write(self.encode(class_list))
 
         # print (classList)
-        # print (out_class_file)
+        # Batch writers sharing one class list write classes.txt themselves
+        if write_class_file:
+            write_class_list(classes_file, class_list)
+
+    def encode(self, class_list):
+        """
+        Return the YOLO lines of all boxes, converting them in one array
+        operation. Labels missing from class_list are appended to it.
+        """
+        if not self.box_list:
+            return ''
+        class_ids = {}
+        for i, name in enumerate(class_list):
+            class_ids.setdefault(name, i)
+        ids = []
+        for box in self.box_list:
+            # PR387
+            box_name = box['name']
+            if box_name not in class_ids:
+                class_ids[box_name] = len(class_list)
+                class_list.append(box_name)
+            ids.append(class_ids[box_name])
+        corners = np.array([(box['xmin'], box['ymin'], box['xmax'], box['ymax']) for box in self.box_list],
+                           dtype=np.float64)
+        rows = corners_to_yolo(corners, self.img_size[1], self.img_size[0])
+        return ''.join('%d %.6f %.6f %.6f %.6f\n' % (class_index, x_center, y_center, w, h)
+                       for class_index, (x_center, y_center, w, h) in zip(ids, rows.tolist()))
+
+
+def corners_to_yolo(corners, width, height):
+    """(N, 4) xmin, ymin, xmax, ymax pixel corners -> (N, 4) normalized x_center, y_center, w, h."""
+    scale = np.array([width, height], dtype=np.float64)
+    centers = (corners[:, :2] + corners[:, 2:]) / 2 / scale
+    sizes = (corners[:, 2:] - corners[:, :2]) / scale
+    return np.hstack((centers, sizes))
+
+
+def yolo_to_corners(rows, width, height):
+    """
+    (N, 4) normalized x_center, y_center, w, h -> (N, 4) int pixel corners,
+    clipped to the image and rounded like round().
+    """
+    half = rows[:, 2:] / 2
+    top_left = np.maximum(rows[:, :2] - half, 0)
+    bottom_right = np.minimum(rows[:, :2] + half, 1)
+    scale = np.array([width, height], dtype=np.float64)
+    # np.rint rounds half to even, as round() does
+    return np.rint(np.hstack((top_left, bottom_right)) * np.tile(scale, 2)).astype(np.int64)
+
+
+def parse_yolo_rows(text):
+    """
+    Parse the lines of a YOLO file at once. Return (class_ids, rows): an
+    (N,) int array and an (N, 4) float array of x_center, y_center, w, h.
+    Raise ValueError if a line does not have five numbers.
+    """
+    lines = text.split('\n')
+    fields = text.split()
+    count = sum(1 for line in lines if line.strip())
+    values = np.array(fields, dtype=np.float64)
+    if values.size != count * 5:
+        bad = next(line for line in lines if line.strip() and len(line.split()) != 5)
+        raise ValueError('expected 5 fields: %r' % bad.strip())
+    values = values.reshape(-1, 5)
+    class_ids = values[:, 0].astype(np.int64)
+    if not np.array_equal(class_ids, values[:, 0]):
+        raise ValueError('class index is not an integer')
+    return class_ids, values[:, 1:]
+
+
+def write_class_list(classes_file, class_list):
+    """
+    Write class_list to classes_file, one label per line, unless the file
+    already holds it. The file is replaced atomically, so readers never see
+    a truncated list. Return True if the file was written.
+    """
+    try:
+        if class_list_cache.get(classes_file).names == list(class_list):
+            return False
+    except OSError:
+        pass
+    with atomic_write(classes_file, 'w') as out_class_file:
         for c in class_list:
             out_class_file.write(c+'\n')
-
-        out_class_file.close()
-        out_file.close()
-
+    class_list_cache.discard(classes_file)
+    return True
+
+
+class ClassList(object):
+    """Labels of a classes.txt file, with a label -> class index map."""
+
+    def __init__(self, names):
+        self.names = names
+        self.ids = {}
+        for i, name in enumerate(names):
+            # Like list.index(), the first line of a label wins
+            self.ids.setdefault(name, i)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class ClassListCache(object):
+    """
+    Parsed classes.txt files of the process, keyed by real path. An entry is
+    read again when the mtime or size of its file changes.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, path):
+        """Return the ClassList of path. Raise OSError if it cannot be read."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        stamp = stat.st_mtime_ns, stat.st_size
+        with self.lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                return entry[1]
+        with open(path, 'r') as classes_file:
+            text = classes_file.read().strip('\n')
+        class_list = ClassList(text.split('\n') if text else [])
+        with self.lock:
+            self._entries[path] = (stamp, class_list)
+            self._entries.move_to_end(path)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return class_list
+
+    def discard(self, path):
+        with self.lock:
+            self._entries.pop(os.path.realpath(path), None)
+
+
+# Shared by the YOLO readers of the process
+class_list_cache = ClassListCache()
 
 
 class YoloReader:
@@ -83,7 +209,7 @@ class YoloReader:
     def __init__(self, file_path, image, class_list_path=None):
         # shapes type:
         # [labbel, [(x1,y1), (x2,y2), (x3,y3), (x4,y4)], color, color, difficult]
-        self.shapes = []
+        self._shapes = None
         self.file_path = file_path
 
         if class_list_path is None:
@@ -92,27 +218,42 @@ class YoloReader:
         else:
             self.class_list_path = class_list_path
 
-        # print (file_path, self.class_list_path)
-
-        classes_file = open(self.class_list_path, 'r')
-        self.classes = classes_file.read().strip('\n').split('\n')
-
-        # print (self.classes)
+        # A copy, the save path appends new labels to the reader's class list
+        self.classes = list(class_list_cache.get(self.class_list_path).names)
 
         img_size = [image.height(), image.width(),
                     1 if image.isGrayscale() else 3]
 
         self.img_size = img_size
 
+        # (N,) class indexes and (N, 4) xmin, ymin, xmax, ymax pixel corners
+        self.class_ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.int64)
         self.verified = False
         # try:
         self.parse_yolo_format()
         # except:
         #     pass
 
+    @property
+    def shapes(self):
+        if self._shapes is None:
+            self._shapes = [(self.classes[class_index], [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)],
+                             None, None, False)
+                            for class_index, (x_min, y_min, x_max, y_max)
+                            in zip(self.class_ids.tolist(), self.boxes.tolist())]
+        return self._shapes
+
     def get_shapes(self):
         return self.shapes
 
+    def get_box_arrays(self):
+        """
+        Return (boxes, class_ids, classes, difficult) without building the
+        shape tuples, like PascalVocReader.get_box_arrays().
+        """
+        return self.boxes, self.class_ids, self.classes, np.zeros(len(self.class_ids), dtype=bool)
+
     def add_shape(self, label, x_min, y_min, x_max, y_max, difficult):
 
         points = [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
@@ -134,21 +275,18 @@ class YoloReader:
         return label, x_min, y_min, x_max, y_max
 
     def parse_yolo_format(self):
+        with open(self.file_path, 'r') as bnd_box_file:
+            text = bnd_box_file.read()
         try:
-            bnd_box_file = open(self.file_path, 'r')
-            for bndBox in bnd_box_file:
-                try:
-                    class_index, x_center, y_center, w, h = bndBox.strip().split(' ')
-                    try:
-                        label, x_min, y_min, x_max, y_max = self.yolo_line_to_shape(class_index, x_center, y_center, w, h)
-                        self.add_shape(label, x_min, y_min, x_max, y_max, False)
-                    except IndexError:
-                        print(f"Error: Class index {class_index} out of range in file {self.file_path}")
-                        print(f"Available classes: {self.classes}")
-                        raise
-                except Exception as e:
-                    print(f"Error parsing line in {self.file_path}: {bndBox.strip()}")
-                    print(f"Error message: {str(e)}")
-                    raise
-        finally:
-            bnd_box_file.close()
+            class_ids, rows = parse_yolo_rows(text)
+        except ValueError as e:
+            print(f"Error parsing {self.file_path}: {str(e)}")
+            raise
+        out_of_range = (class_ids < 0) | (class_ids >= len(self.classes))
+        if out_of_range.any():
+            print(f"Error: Class index {class_ids[out_of_range][0]} out of range in file {self.file_path}")
+            print(f"Available classes: {self.classes}")
+            raise IndexError('class index out of range')
+        self.class_ids = class_ids
+        self.boxes = yolo_to_corners(rows, self.img_size[1], self.img_size[0])
+        self._shapes = None
@@ -0,0 +1,61 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.atomic_file import atomic_write, fsync_enabled, set_fsync
+
+
+class TestAtomicWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'a.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_replace(self):
+        for fsync in (False, True):
+            with atomic_write(self.path, 'w', encoding='utf-8', fsync=fsync) as f:
+                f.write('fsync %s' % fsync)
+            self.assertEqual('fsync %s' % fsync, self.read())
+        # The mode of the replaced file is kept
+        os.chmod(self.path, 0o640)
+        with atomic_write(self.path, 'wb') as f:
+            f.write(b'binary')
+        self.assertEqual('binary', self.read())
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(self.path).st_mode))
+        self.assertEqual(['a.xml'], os.listdir(self.tmp_dir))
+
+    def test_failure_keeps_old_file(self):
+        with atomic_write(self.path) as f:
+            f.write('old')
+        with self.assertRaises(ValueError):
+            with atomic_write(self.path) as f:
+                f.write('half')
+                raise ValueError('crash')
+        self.assertEqual('old', self.read())
+        self.assertEqual(['a.xml'], os.listdir(self.tmp_dir))
+
+    def test_set_fsync(self):
+        enabled = fsync_enabled()
+        try:
+            set_fsync(False)
+            self.assertFalse(fsync_enabled())
+            set_fsync(True)
+            self.assertTrue(fsync_enabled())
+        finally:
+            set_fsync(enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import random
+import sys
+import unittest
+
+try:
+    from PyQt5.QtGui import QImage, QColor
+except ImportError:
+    from PyQt4.QtGui import QImage, QColor
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.content_shrink import MIN_SIZE, ContentMaskCache, SummedAreaTable, content_mask, qimage_to_rgb_sum, shrink_box
+
+
+def reference_shrink(image, x1, y1, x2, y2, threshold):
+    """Pixel by pixel scan as Canvas.finalise used to do it."""
+    width, height = image.width(), image.height()
+
+    def is_content_pixel(x, y):
+        color = QColor(image.pixel(x, y))
+        return (color.red() + color.green() + color.blue()) / 3 < threshold
+
+    for x in range(x1, x2):
+        if any(is_content_pixel(x, y) for y in range(y1, y2)):
+            x1 = x
+            break
+    for x in range(x2 - 1, x1, -1):
+        if any(is_content_pixel(x, y) for y in range(y1, y2)):
+            x2 = min(x + 1, width)
+            break
+    for y in range(y1, y2):
+        if any(is_content_pixel(x, y) for x in range(x1, x2)):
+            y1 = y
+            break
+    for y in range(y2 - 1, y1, -1):
+        if any(is_content_pixel(x, y) for x in range(x1, x2)):
+            y2 = min(y + 1, height)
+            break
+    if x2 - x1 < MIN_SIZE:
+        center = (x1 + x2) / 2
+        x1 = int(max(0, center - MIN_SIZE / 2))
+        x2 = int(min(width, center + MIN_SIZE / 2))
+    if y2 - y1 < MIN_SIZE:
+        center = (y1 + y2) / 2
+        y1 = int(max(0, center - MIN_SIZE / 2))
+        y2 = int(min(height, center + MIN_SIZE / 2))
+    count = sum(1 for x in range(x1, x2) for y in range(y1, y2) if is_content_pixel(x, y))
+    return x1, y1, x2, y2, count
+
+
+class TestContentShrink(unittest.TestCase):
+
+    def random_image(self, width, height, seed):
+        rnd = random.Random(seed)
+        image = QImage(width, height, QImage.Format_RGB32)
+        image.fill(QColor(255, 255, 255))
+        for _ in range(rnd.randint(0, 6)):
+            x, y = rnd.randrange(width), rnd.randrange(height)
+            w, h = rnd.randint(1, 12), rnd.randint(1, 12)
+            gray = rnd.randint(0, 254)
+            for i in range(x, min(width, x + w)):
+                for j in range(y, min(height, y + h)):
+                    image.setPixel(i, j, QColor(gray, rnd.randint(0, 255), gray).rgb())
+        return image
+
+    def test_rgb_sum(self):
+        image = QImage(3, 2, QImage.Format_RGB888)
+        image.fill(QColor(10, 20, 30))
+        image.setPixel(1, 1, QColor(255, 255, 255).rgb())
+        rgb_sum = qimage_to_rgb_sum(image)
+        self.assertEqual((2, 3), rgb_sum.shape)
+        self.assertEqual(60, rgb_sum[0, 0])
+        self.assertEqual(765, rgb_sum[1, 1])
+        self.assertEqual((1, 2), qimage_to_rgb_sum(image, (1, 1, 3, 2)).shape)
+
+    def test_matches_pixel_scan(self):
+        for seed in range(40):
+            image = self.random_image(40, 30, seed)
+            rnd = random.Random(seed)
+            x1, x2 = sorted(rnd.sample(range(41), 2))
+            y1, y2 = sorted(rnd.sample(range(31), 2))
+            threshold = rnd.choice((50, 128, 200, 255))
+            table = SummedAreaTable(content_mask(qimage_to_rgb_sum(image), threshold))
+            self.assertEqual(reference_shrink(image, x1, y1, x2, y2, threshold),
+                             shrink_box(table, x1, y1, x2, y2))
+
+    def test_summed_area_table(self):
+        mask = content_mask(qimage_to_rgb_sum(self.random_image(40, 30, 11)), 200)
+        table = SummedAreaTable(mask)
+        rnd = random.Random(11)
+        for _ in range(50):
+            x1, x2 = sorted(rnd.sample(range(41), 2))
+            y1, y2 = sorted(rnd.sample(range(31), 2))
+            roi = mask[y1:y2, x1:x2]
+            self.assertEqual(int(roi.sum()), table.count(x1, y1, x2, y2))
+            cols = [x1 + i for i in range(roi.shape[1]) if roi[:, i].any()]
+            rows = [y1 + i for i in range(roi.shape[0]) if roi[i, :].any()]
+            self.assertEqual(cols[0] if cols else None, table.first_column(x1, y1, x2, y2))
+            self.assertEqual(cols[-1] if cols else None, table.last_column(x1, y1, x2, y2))
+            self.assertEqual(rows[0] if rows else None, table.first_row(x1, y1, x2, y2))
+            self.assertEqual(rows[-1] if rows else None, table.last_row(x1, y1, x2, y2))
+        self.assertEqual(0, table.count(5, 5, 5, 9))
+
+    def test_mask_cache(self):
+        image = self.random_image(40, 30, 3)
+        cache = ContentMaskCache(max_tables=2)
+        self.assertFalse(cache.is_loaded())
+        cache.load(image)
+        self.assertTrue(cache.is_loaded())
+        # Nothing is computed before the first table is asked for
+        self.assertIsNone(cache.rgb_sum)
+        first = cache.table(100)
+        self.assertIs(first, cache.table(100))
+        mask = content_mask(qimage_to_rgb_sum(image), 100)
+        self.assertEqual(int(mask.sum()), first.count(0, 0, 40, 30))
+        cache.table(150)
+        cache.table(200)
+        self.assertIsNot(first, cache.table(100))
+        cache.clear()
+        self.assertFalse(cache.is_loaded())
+
+    def test_uncached_image(self):
+        # Boxes of images above max_pixels are shrunk with a table of their surroundings
+        whole, boxed = ContentMaskCache(), ContentMaskCache(max_pixels=100)
+        for seed in range(20):
+            image = self.random_image(40, 30, seed)
+            if seed % 2:
+                image = image.convertToFormat(QImage.Format_RGB888)
+            whole.load(image)
+            boxed.load(image)
+            self.assertFalse(boxed.is_cached())
+            rnd = random.Random(seed)
+            x1, x2 = sorted(rnd.sample(range(41), 2))
+            y1, y2 = sorted(rnd.sample(range(31), 2))
+            self.assertEqual(whole.shrink(x1, y1, x2, y2, 200), boxed.shrink(x1, y1, x2, y2, 200))
+            self.assertIsNone(boxed.rgb_sum)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    from PyQt4.QtGui import QImage
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.constants import FORMAT_PASCALVOC, FORMAT_YOLO
+from libs.dataset_index import INDEX_CACHE_DIR, DatasetIndex, DatasetIndexWriter, find_annotation
+from libs.pascal_voc_io import PascalVocWriter
+
+
+class TestDatasetIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, '%d.png' % i)
+            QImage(20 + i, 10, QImage.Format_RGB32).save(path)
+            self.paths.append(path)
+        writer = PascalVocWriter('imgs', '0.png', (10, 20, 3), local_img_path=self.paths[0])
+        writer.add_bnd_box(1, 1, 5, 5, 'cat', 0)
+        writer.add_bnd_box(2, 2, 6, 6, 'dog', 0)
+        writer.verified = True
+        writer.save(os.path.join(self.tmp_dir, '0.xml'))
+        with open(os.path.join(self.tmp_dir, 'classes.txt'), 'w') as f:
+            f.write('cat\ndog\n')
+        with open(os.path.join(self.tmp_dir, '1.txt'), 'w') as f:
+            f.write('1 0.5 0.5 0.2 0.2\n')
+        self.index = DatasetIndex(DatasetIndex.path_for(self.tmp_dir, self.tmp_dir))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_refresh(self):
+        self.assertEqual(3, self.index.refresh(self.paths))
+        self.assertEqual(sorted(self.paths), sorted(self.index.paths_in_dir(self.tmp_dir)))
+        entry = self.index.get(self.paths[0])
+        self.assertEqual((20, 10), (entry['width'], entry['height']))
+        self.assertEqual(FORMAT_PASCALVOC, entry['ann_format'])
+        self.assertEqual((2, ['cat', 'dog'], True), (entry['box_count'], entry['labels'], entry['verified']))
+        entry = self.index.get(self.paths[1])
+        self.assertEqual((FORMAT_YOLO, 1, ['dog']), (entry['ann_format'], entry['box_count'], entry['labels']))
+        self.assertEqual({self.paths[2]}, self.index.unannotated_paths())
+        self.assertEqual({self.paths[1], self.paths[2]}, self.index.unverified_paths())
+
+        # Nothing changed on disk: nothing is written again
+        self.assertEqual(0, self.index.refresh(self.paths))
+        txt_path = os.path.join(self.tmp_dir, '2.txt')
+        with open(txt_path, 'w') as f:
+            f.write('0 0.5 0.5 0.2 0.2\n')
+        os.utime(txt_path, (time.time() + 10, time.time() + 10))
+        self.assertEqual(1, self.index.refresh(self.paths))
+        self.assertEqual(set(), self.index.unannotated_paths())
+
+        self.index.remove([self.paths[0]])
+        self.assertIsNone(self.index.get(self.paths[0]))
+
+    def test_path_for(self):
+        self.assertEqual(self.tmp_dir, os.path.dirname(DatasetIndex.path_for('imgs', self.tmp_dir)))
+        # Without a save dir nothing is written into the image dir
+        path = DatasetIndex.path_for(self.tmp_dir)
+        self.assertEqual(INDEX_CACHE_DIR, os.path.dirname(path))
+        self.assertNotEqual(path, DatasetIndex.path_for(os.path.join(self.tmp_dir, 'other')))
+
+    def test_writer(self):
+        self.index.refresh(self.paths)
+        with open(os.path.join(self.tmp_dir, '2.txt'), 'w') as f:
+            f.write('0 0.5 0.5 0.2 0.2\n')
+        writer = DatasetIndexWriter(self.index.db_path)
+        writer.update(self.paths[2])
+        writer.remove([self.paths[0]])
+        writer.flush()
+        self.assertEqual(['cat'], self.index.get(self.paths[2])['labels'])
+        self.assertIsNone(self.index.get(self.paths[0]))
+        writer.shutdown()
+        self.assertFalse(writer.isRunning())
+
+    def test_find_annotation(self):
+        save_dir = os.path.join(self.tmp_dir, 'ann')
+        self.assertEqual(FORMAT_PASCALVOC, find_annotation(self.paths[0])[1])
+        self.assertIsNone(find_annotation(self.paths[0], save_dir))
+        self.assertIsNone(find_annotation(self.paths[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
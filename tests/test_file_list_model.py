@@ -0,0 +1,56 @@
+import bisect
+import os
+import random
+import sys
+import unittest
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.file_list_model import FileListModel, sort_key
+
+
+class TestFileListModel(unittest.TestCase):
+
+    def test_insert_sorted(self):
+        rnd = random.Random(7)
+        names = ['/data/%s%03d.jpg' % (rnd.choice('aBcD'), i) for i in range(200)]
+        model = FileListModel()
+        paths = model.paths
+        for start in range(0, len(names), 30):
+            batch = names[start:start + 30]
+            old_keys = [sort_key(p) for p in model.paths]
+            positions = model.insert_sorted(batch)
+            expected = sorted(bisect.bisect_right(old_keys, sort_key(p)) for p in batch)
+            self.assertEqual(expected, positions)
+        self.assertIs(paths, model.paths)
+        self.assertEqual(sorted(names, key=sort_key), model.paths)
+        self.assertEqual(len(names), model.rowCount())
+        for row, path in enumerate(model.paths):
+            self.assertEqual(row, model.row_of(path))
+        self.assertEqual(-1, model.row_of('/data/missing.jpg'))
+
+    def test_positions_track_rows(self):
+        model = FileListModel()
+        model.insert_sorted(['b', 'd', 'f'])
+        current = model.row_of('d')
+        positions = model.insert_sorted(['a', 'c', 'e', 'g'])
+        self.assertEqual([0, 1, 2, 3], positions)
+        current += bisect.bisect_right(positions, current)
+        self.assertEqual('d', model.path_at(current))
+
+    def test_remove_and_clear(self):
+        model = FileListModel()
+        model.insert_sorted(['c', 'a', 'b'])
+        model.remove_row(model.row_of('b'))
+        self.assertEqual(['a', 'c'], model.paths)
+        self.assertEqual(1, model.row_of('c'))
+        self.assertNotIn('b', model)
+        model.release_sort_keys()
+        model.insert_sorted(['b'])
+        self.assertEqual(['a', 'b', 'c'], model.paths)
+        model.clear()
+        self.assertEqual(0, len(model))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+import unittest
+
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    from PyQt4.QtGui import QImage
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.image_cache import ImageCache, image_nbytes
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp_dir, '%d.png' % i)
+            open(path, 'wb').close()
+            self.paths.append(path)
+        self.image = QImage(16, 16, QImage.Format_RGB32)
+
+    def test_lru_budget(self):
+        cache = ImageCache(budget_bytes=2 * image_nbytes(self.image))
+        cache.put(self.paths[0], self.image)
+        cache.put(self.paths[1], self.image)
+        self.assertIsNotNone(cache.get(self.paths[0]))
+        cache.put(self.paths[2], self.image)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(self.paths[1]))
+        self.assertIsNotNone(cache.get(self.paths[2]))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+        cache.set_budget(image_nbytes(self.image))
+        self.assertEqual(1, len(cache))
+
+    def test_mtime_invalidation(self):
+        cache = ImageCache()
+        cache.put(self.paths[0], self.image)
+        self.assertIn(self.paths[0], cache)
+        os.utime(self.paths[0], (0, 0))
+        self.assertNotIn(self.paths[0], cache)
+        self.assertIsNone(cache.get(self.paths[0]))
+        self.assertEqual(0, cache.used_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
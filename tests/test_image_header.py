@@ -0,0 +1,111 @@
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from PyQt5.QtGui import QColor, QImage
+except ImportError:
+    from PyQt4.QtGui import QColor, QImage
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.image_header import ImageSizeCache, probe_image_size
+from libs.image_prefetcher import decode_image
+
+
+def exif_segment(orientation):
+    """APP1 segment holding a little endian EXIF block with one orientation tag."""
+    tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', 1)
+    tiff += struct.pack('<HHIHH', 274, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    data = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(data) + 2) + data
+
+
+class TestImageHeader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def save(self, name, image_format=QImage.Format_RGB32, width=37, height=21):
+        path = os.path.join(self.tmp_dir, name)
+        image = QImage(width, height, image_format)
+        image.fill(QColor(200, 30, 40))
+        self.assertTrue(image.save(path))
+        return path
+
+    def assert_matches_decoded(self, path):
+        image = decode_image(path)
+        self.assertEqual((image.width(), image.height(), 1 if image.isGrayscale() else 3),
+                         probe_image_size(path))
+
+    def test_formats(self):
+        for name in ('a.png', 'a.jpg', 'a.bmp', 'a.tif', 'a.ppm'):
+            path = self.save(name)
+            self.assert_matches_decoded(path)
+        for name in ('g.png', 'g.jpg', 'g.tif'):
+            self.assert_matches_decoded(self.save(name, QImage.Format_Grayscale8))
+        self.assert_matches_decoded(os.path.join(dir_name, 'test.512.512.bmp'))
+        self.assertIsNone(probe_image_size(os.path.join(self.tmp_dir, 'missing.png')))
+
+    def test_jpeg_orientation(self):
+        path = self.save('r.jpg')
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:2] + exif_segment(6) + data[2:])
+        self.assertEqual((21, 37, 3), probe_image_size(path))
+        self.assert_matches_decoded(path)
+
+    def test_cache(self):
+        path = self.save('c.png')
+        cache = ImageSizeCache()
+        self.assertEqual([21, 37, 3], cache.shape(path))
+        self.save('c.png', width=10, height=12)
+        os.utime(path, (0, 0))
+        self.assertEqual([12, 10, 3], cache.shape(path))
+        self.assertEqual([12, 10, 3], cache.shape(path, QImage(5, 5, QImage.Format_RGB32)))
+
+    def test_cache_depth(self):
+        # An RGB file holding only gray pixels has depth 3, with or without the decoded image
+        path = os.path.join(self.tmp_dir, 'gray_rgb.png')
+        image = QImage(8, 6, QImage.Format_RGB32)
+        image.fill(QColor(90, 90, 90))
+        self.assertTrue(image.save(path))
+        self.assertTrue(image.isGrayscale())
+        self.assertEqual([6, 8, 3], ImageSizeCache().shape(path, image))
+        self.assertEqual([6, 8, 3], ImageSizeCache().shape(path))
+        # The decoded image is used when the file cannot be read
+        missing = os.path.join(self.tmp_dir, 'missing.png')
+        self.assertEqual([6, 8, 3], ImageSizeCache().shape(missing, image))
+        self.assertEqual([6, 8, 1], ImageSizeCache().shape(missing, image.convertToFormat(QImage.Format_Grayscale8)))
+
+    def test_cache_threads(self):
+        paths = [self.save('t%d.png' % i, width=10 + i) for i in range(20)]
+        cache = ImageSizeCache(max_entries=5)
+        errors = []
+
+        def work():
+            try:
+                for _ in range(20):
+                    for i, path in enumerate(paths):
+                        self.assertEqual([21, 10 + i, 3], cache.shape(path))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache._entries), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import unittest
+
+try:
+    from PyQt5.QtGui import QColor, QImage, QPainter
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtGui import QApplication, QColor, QImage, QPainter
+    from PyQt4.QtCore import QRectF
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.image_pyramid import ImagePyramid
+
+
+class TestImagePyramid(unittest.TestCase):
+
+    app = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    @classmethod
+    def tearDownClass(cls):
+        # Release the application, other tests create their own
+        cls.app = None
+
+    def setUp(self):
+        # Four colored quadrants over tiles of 64 pixels, with clipped edge tiles
+        self.image = QImage(300, 200, QImage.Format_RGB32)
+        painter = QPainter(self.image)
+        painter.fillRect(0, 0, 150, 100, QColor(255, 0, 0))
+        painter.fillRect(150, 0, 150, 100, QColor(0, 255, 0))
+        painter.fillRect(0, 100, 150, 100, QColor(0, 0, 255))
+        painter.fillRect(150, 100, 150, 100, QColor(255, 255, 0))
+        painter.end()
+        self.pyramid = ImagePyramid(self.image, tile_size=64)
+
+    def tearDown(self):
+        self.pyramid.cancel()
+        self.pyramid = None
+
+    def build(self):
+        self.pyramid.start()
+        deadline = time.time() + 10
+        while len(self.pyramid.levels) < 4 and time.time() < deadline:
+            self.app.processEvents()
+
+    def render(self, scale):
+        out = QImage(int(300 * scale), int(200 * scale), QImage.Format_RGB32)
+        out.fill(QColor(0, 0, 0))
+        painter = QPainter(out)
+        painter.scale(scale, scale)
+        self.pyramid.draw(painter, QRectF(0, 0, 300, 200), scale)
+        painter.end()
+        return out
+
+    def test_size(self):
+        self.assertEqual((300, 200), (self.pyramid.width(), self.pyramid.height()))
+        self.assertEqual(self.image.size(), self.pyramid.size())
+        self.assertIs(self.image, self.pyramid.toImage())
+        self.assertFalse(self.pyramid.isNull())
+
+    def test_levels(self):
+        self.assertEqual(0, self.pyramid.level_for_scale(0.1))
+        self.build()
+        self.assertEqual([(300, 200), (150, 100), (75, 50), (37, 25)],
+                         [(level.width(), level.height()) for level in self.pyramid.levels])
+        self.assertEqual(0, self.pyramid.level_for_scale(2.0))
+        self.assertEqual(0, self.pyramid.level_for_scale(0.6))
+        self.assertEqual(1, self.pyramid.level_for_scale(0.5))
+        self.assertEqual(1, self.pyramid.level_for_scale(0.3))
+        self.assertEqual(2, self.pyramid.level_for_scale(0.25))
+        self.assertEqual(3, self.pyramid.level_for_scale(0.01))
+
+    def test_cancel(self):
+        self.pyramid.cancel()
+        self.pyramid._on_built(0, 1, self.image)
+        self.assertEqual(1, len(self.pyramid.levels))
+
+    def test_draw(self):
+        out = self.render(1.0)
+        self.assertEqual(self.image.convertToFormat(out.format()), out)
+        self.build()
+        out = self.render(0.25)
+        for x, y, color in ((10, 10, QColor(255, 0, 0)), (65, 10, QColor(0, 255, 0)),
+                            (10, 40, QColor(0, 0, 255)), (65, 40, QColor(255, 255, 0))):
+            self.assertEqual(color.rgb(), out.pixel(x, y))
+
+    def test_budget(self):
+        pyramid = ImagePyramid(self.image, tile_size=64, budget_bytes=66 * 66 * 4 * 3)
+        out = QImage(300, 200, QImage.Format_RGB32)
+        painter = QPainter(out)
+        pyramid.draw(painter, QRectF(0, 0, 300, 200), 1.0)
+        self.assertLessEqual(pyramid.used_bytes, pyramid.budget_bytes)
+        self.assertLess(len(pyramid._tiles), 20)
+        # The tiles drawn last are kept
+        self.assertIn((0, 4, 3, None), pyramid._tiles)
+        pyramid.draw(painter, QRectF(0, 0, 300, 200), 1.0, QColor(200, 200, 200))
+        painter.end()
+        self.assertIn((0, 4, 3, QColor(200, 200, 200).rgba()), pyramid._tiles)
+
+
+if __name__ == '__main__':
+    unittest.main()
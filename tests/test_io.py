@@ -29,6 +29,137 @@ class TestPascalVocRW(unittest.TestCase):
         self.assertEqual(face[1], [(113, 40), (450, 40), (450, 403), (113, 403)])
 
 
+    def test_tab_indented_output(self):
+        import shutil
+        import tempfile
+        dir_name = os.path.abspath(os.path.dirname(__file__))
+        sys.path.insert(0, os.path.join(dir_name, '..'))
+        from libs.pascal_voc_io import PascalVocWriter, PascalVocReader
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            target_file = os.path.join(tmp_dir, 'test.xml')
+            writer = PascalVocWriter('tests', 'test.jpg', (512, 512, 3))
+            writer.add_bnd_box(60, 40, 430, 504, 'red  car <&>', 0)
+            writer.save(target_file)
+            with open(target_file, 'rb') as f:
+                data = f.read()
+            self.assertTrue(data.startswith(b'<annotation>\n\t<folder>tests</folder>\n'))
+            self.assertIn(b'\n\t\t<bndbox>\n\t\t\t<xmin>60</xmin>\n', data)
+            self.assertTrue(data.endswith(b'</object>\n</annotation>\n'))
+            # Spaces inside a label are kept
+            self.assertEqual('red  car <&>', PascalVocReader(target_file).get_shapes()[0][0])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_box_arrays(self):
+        import shutil
+        import tempfile
+        dir_name = os.path.abspath(os.path.dirname(__file__))
+        sys.path.insert(0, os.path.join(dir_name, '..'))
+        from libs.pascal_voc_io import PascalVocReader
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            xml_file = os.path.join(tmp_dir, 'parts.xml')
+            with open(xml_file, 'w') as f:
+                f.write('<annotation verified="yes"><filename>a.jpg</filename>'
+                        '<size><width>640</width><height>480</height><depth>3</depth></size>'
+                        '<object><name>person</name><difficult>1</difficult>'
+                        '<bndbox><xmin>10.7</xmin><ymin>20</ymin><xmax>110</xmax><ymax>220</ymax></bndbox>'
+                        '<part><name>hand</name><bndbox><xmin>1</xmin><ymin>1</ymin><xmax>2</xmax><ymax>2</ymax>'
+                        '</bndbox></part></object>'
+                        '<object><name>dog</name><bndbox><ymax>9</ymax><xmax>8</xmax><ymin>7</ymin><xmin>6</xmin>'
+                        '</bndbox></object>'
+                        '<object><name>person</name><bndbox><xmin>1</xmin><ymin>2</ymin><xmax>3</xmax><ymax>4</ymax>'
+                        '</bndbox></object></annotation>')
+            reader = PascalVocReader(xml_file)
+            self.assertIsNone(reader.parse_error)
+            self.assertTrue(reader.verified)
+            self.assertEqual([480, 640, 3], reader.img_size)
+            boxes, label_ids, label_names, difficult = reader.get_box_arrays()
+            self.assertEqual([[10, 20, 110, 220], [6, 7, 8, 9], [1, 2, 3, 4]], boxes.tolist())
+            self.assertEqual([0, 1, 0], label_ids.tolist())
+            self.assertEqual(['person', 'dog'], label_names)
+            self.assertEqual([True, False, False], difficult.tolist())
+            self.assertEqual(('dog', [(6, 7), (8, 7), (8, 9), (6, 9)], None, None, False), reader.get_shapes()[1])
+
+            with open(xml_file, 'w') as f:
+                f.write('<annotation><object><name>cat</name></object>')
+            reader = PascalVocReader(xml_file)
+            self.assertIsNotNone(reader.parse_error)
+            self.assertEqual([], reader.get_shapes())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class TestYoloRW(unittest.TestCase):
+
+    def test_round_trip(self):
+        import shutil
+        import tempfile
+        dir_name = os.path.abspath(os.path.dirname(__file__))
+        sys.path.insert(0, os.path.join(dir_name, '..'))
+        try:
+            from PyQt5.QtGui import QImage
+        except ImportError:
+            from PyQt4.QtGui import QImage
+        from libs.yolo_io import YOLOWriter, YoloReader, class_list_cache, write_class_list
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            target_file = os.path.join(tmp_dir, 'a.txt')
+            class_list = ['dog', 'cat']
+            writer = YOLOWriter(tmp_dir, 'a.jpg', (400, 600, 3))
+            writer.add_bnd_box(60, 40, 430, 304, 'cat', 0)
+            writer.add_bnd_box(0, 0, 600, 400, 'bird', 0)
+            writer.save(class_list, target_file)
+            # Unknown labels are added to the class list
+            self.assertEqual(['dog', 'cat', 'bird'], class_list)
+            with open(target_file) as f:
+                self.assertEqual('1 0.408333 0.430000 0.616667 0.660000\n2 0.500000 0.500000 1.000000 1.000000\n',
+                                 f.read())
+
+            image = QImage(600, 400, QImage.Format_RGB32)
+            reader = YoloReader(target_file, image)
+            self.assertEqual([('cat', [(60, 40), (430, 40), (430, 304), (60, 304)], None, None, False),
+                              ('bird', [(0, 0), (600, 0), (600, 400), (0, 400)], None, None, False)],
+                             reader.get_shapes())
+            boxes, class_ids, classes, _ = reader.get_box_arrays()
+            self.assertEqual([[60, 40, 430, 304], [0, 0, 600, 400]], boxes.tolist())
+            self.assertEqual([1, 2], class_ids.tolist())
+            # Changing the class list of a reader leaves the cached names alone
+            reader.classes.append('fish')
+            self.assertNotIn('fish', class_list_cache.get(os.path.join(tmp_dir, 'classes.txt')).names)
+
+            # classes.txt is read again once it changes on disk
+            classes_file = os.path.join(tmp_dir, 'classes.txt')
+            self.assertIs(class_list_cache.get(classes_file), class_list_cache.get(classes_file))
+            with open(classes_file, 'w') as f:
+                f.write('dog\nkitten\nbird\nkitten\n')
+            self.assertEqual('kitten', YoloReader(target_file, image).get_shapes()[0][0])
+            self.assertEqual(1, class_list_cache.get(classes_file).ids['kitten'])
+
+            # classes.txt is only rewritten when the list changes
+            self.assertFalse(write_class_list(classes_file, ['dog', 'kitten', 'bird', 'kitten']))
+            os.utime(classes_file, (0, 0))
+            writer.save(['dog', 'kitten', 'bird', 'kitten', 'cat'], target_file)
+            self.assertNotEqual(0, os.path.getmtime(classes_file))
+            os.utime(classes_file, (0, 0))
+            writer.save(['dog', 'kitten', 'bird', 'kitten', 'cat'], target_file)
+            self.assertEqual(0, os.path.getmtime(classes_file))
+            self.assertEqual([], [name for name in os.listdir(tmp_dir) if name.endswith('.tmp')])
+
+            with open(target_file, 'w') as f:
+                f.write('1 0.5 0.5 0.1\n')
+            self.assertRaises(ValueError, YoloReader, target_file, image)
+            with open(target_file, 'w') as f:
+                f.write('7 0.5 0.5 0.1 0.1\n')
+            self.assertRaises(IndexError, YoloReader, target_file, image)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
 class TestCreateMLRW(unittest.TestCase):
 
     def test_a_write(self):
@@ -97,5 +228,92 @@ class TestCreateMLRW(unittest.TestCase):
         self.assertEqual(365, y_max, 'ymax is wrong')
 
 
+class TestCreateMLStore(unittest.TestCase):
+
+    def test_deferred_write(self):
+        import json
+        import shutil
+        import tempfile
+        dir_name = os.path.abspath(os.path.dirname(__file__))
+        sys.path.insert(0, os.path.join(dir_name, '..'))
+        from libs.create_ml_io import CreateMLStores, CreateMLWriter, CreateMLReader, create_ml_stores
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            output_file = os.path.join(tmp_dir, 'dataset.json')
+            box = {'label': 'cat', 'points': ((10, 10), (30, 10), (30, 40), (10, 40))}
+            for i in range(50):
+                writer = CreateMLWriter('imgs', '%d.jpg' % i, (100, 100, 3), [box], output_file)
+                # The first write creates the file, the others stay in memory
+                writer.write(flush=False)
+            with open(output_file) as f:
+                self.assertEqual(1, len(json.load(f)))
+            self.assertTrue(create_ml_stores.has_pending())
+
+            # Reads are served from memory, including unflushed saves
+            reader = CreateMLReader(output_file, 'imgs/49.jpg')
+            self.assertEqual([('cat', [(10, 10), (30, 10), (30, 40), (10, 40)], None, None, True)],
+                             reader.get_shapes())
+
+            CreateMLWriter('imgs', '3.jpg', (100, 100, 3), [box, box], output_file).write(flush=False)
+            create_ml_stores.flush()
+            self.assertFalse(create_ml_stores.has_pending())
+            with open(output_file) as f:
+                data = json.load(f)
+            self.assertEqual(['%d.jpg' % i for i in range(50)], [image['image'] for image in data])
+            self.assertEqual(2, len(data[3]['annotations']))
+            self.assertEqual([], [name for name in os.listdir(tmp_dir) if name.endswith('.tmp')])
+
+            # Another process changing the file is picked up
+            stores = CreateMLStores()
+            stores.write(output_file, {'image': 'new.jpg', 'verified': False, 'annotations': []})
+            self.assertIsNotNone(create_ml_stores.read(output_file, 'new.jpg')[0])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_offset_index(self):
+        import io
+        import json
+        import shutil
+        import tempfile
+        dir_name = os.path.abspath(os.path.dirname(__file__))
+        sys.path.insert(0, os.path.join(dir_name, '..'))
+        from libs.create_ml_io import CreateMLOffsetIndex, CreateMLStores, OFFSETS_EXT, scan_records
+
+        images = [{'image': 'a"]}[{\\.jpg', 'annotations': [{'label': '\u732b', 'coordinates': {'x': 1}}]},
+                  {'image': 'b.jpg', 'verified': True, 'annotations': []}, 12345,
+                  {'image': 'b.jpg', 'annotations': None}]
+        for text in (json.dumps(images), json.dumps(images, indent=2, ensure_ascii=False)):
+            data = text.encode('utf-8')
+            for chunk_size in (1, 3, 64, 1 << 20):
+                records = list(scan_records(io.BytesIO(data), chunk_size))
+                self.assertEqual([images[0], images[1], images[3]], [record for _, _, record in records])
+                for offset, length, record in records:
+                    self.assertEqual(record, json.loads(data[offset:offset + length].decode('utf-8')))
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'dataset.json')
+            with open(path, 'w') as f:
+                json.dump(images, f)
+            index = CreateMLOffsetIndex(path, chunk_size=16)
+            self.assertTrue(os.path.exists(path + OFFSETS_EXT))
+            self.assertEqual(2, len(index))
+            self.assertEqual(images[0], index.first())
+            # The first record of a name wins
+            self.assertEqual(images[1], index.get('b.jpg'))
+            self.assertIsNone(index.get('c.jpg'))
+            index.close()
+
+            with open(path, 'w') as f:
+                json.dump(images + [{'image': 'c.jpg', 'annotations': []}], f)
+            stores = CreateMLStores(stream_threshold=0)
+            entry, first = stores.read(path, 'c.jpg')
+            self.assertEqual(('c.jpg', images[0]), (entry['image'], first))
+            stores.discard(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+
 if __name__ == '__main__':
     unittest.main()
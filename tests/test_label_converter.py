@@ -0,0 +1,81 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    from PyQt4.QtGui import QImage
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.constants import FORMAT_PASCALVOC, FORMAT_YOLO, FORMAT_CREATEML
+from libs.label_converter import ConversionOptions, convert_chunk, convert_dir
+from libs.pascal_voc_io import PascalVocReader, PascalVocWriter
+
+
+class TestLabelConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.image_dir = os.path.join(self.tmp_dir, 'imgs')
+        os.mkdir(self.image_dir)
+        self.images = []
+        for i in range(4):
+            path = os.path.join(self.image_dir, '%d.png' % i)
+            QImage(200, 100, QImage.Format_RGB32).save(path)
+            self.images.append(path)
+            if i == 3:
+                continue
+            writer = PascalVocWriter('imgs', '%d.png' % i, (100, 200, 3), local_img_path=path)
+            writer.add_bnd_box(10 + i, 20, 60, 80, 'cat', 0)
+            writer.add_bnd_box(100, 5, 150, 50, 'dog', 1)
+            writer.verified = i == 0
+            writer.save(os.path.join(self.image_dir, '%d.xml' % i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        yolo_dir = os.path.join(self.tmp_dir, 'yolo')
+        json_dir = os.path.join(self.tmp_dir, 'json')
+        voc_dir = os.path.join(self.tmp_dir, 'voc')
+        for path in (yolo_dir, json_dir, voc_dir):
+            os.mkdir(path)
+
+        options = ConversionOptions(FORMAT_PASCALVOC, FORMAT_YOLO, target_dir=yolo_dir, class_list=['cat', 'dog'])
+        converted, skipped, errors, elapsed = convert_dir(self.image_dir, options, workers=2, chunk_size=1)
+        self.assertEqual((3, 1, []), (converted, skipped, errors))
+        with open(os.path.join(yolo_dir, 'classes.txt')) as f:
+            self.assertEqual('cat\ndog\n', f.read())
+
+        options = ConversionOptions(FORMAT_YOLO, FORMAT_CREATEML, source_dir=yolo_dir, target_dir=json_dir)
+        self.assertEqual(3, convert_chunk(self.images, options)[0])
+        options = ConversionOptions(FORMAT_CREATEML, FORMAT_PASCALVOC, source_dir=json_dir, target_dir=voc_dir)
+        self.assertEqual(3, convert_chunk(self.images, options)[0])
+
+        for i in range(3):
+            original = PascalVocReader(os.path.join(self.image_dir, '%d.xml' % i))
+            converted = PascalVocReader(os.path.join(voc_dir, '%d.xml' % i))
+            self.assertEqual([s[:2] for s in original.get_shapes()], [s[:2] for s in converted.get_shapes()])
+            self.assertEqual([200, 100], converted.img_size[1::-1])
+
+    def test_errors(self):
+        target_dir = os.path.join(self.tmp_dir, 'yolo')
+        os.mkdir(target_dir)
+        options = ConversionOptions(FORMAT_PASCALVOC, FORMAT_YOLO, target_dir=target_dir, class_list=['cat'])
+        converted, skipped, errors, _ = convert_chunk(self.images, options)
+        self.assertEqual((0, 1, 3), (converted, skipped, len(errors)))
+        # Nothing was written for the failed files
+        self.assertEqual([], os.listdir(target_dir))
+        options.class_list = ['cat', 'dog']
+        self.assertEqual(3, convert_chunk(self.images, options)[0])
+        self.assertEqual(3, len(convert_chunk(self.images, options)[2]))
+        options.overwrite = True
+        self.assertEqual(3, convert_chunk(self.images, options)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,18 @@
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
+try:
+    from PyQt5.QtGui import QCloseEvent, QColor, QPixmap
+except ImportError:
+    from PyQt4.QtGui import QCloseEvent, QColor, QPixmap
+
 from labelImg import get_main_app
+from libs.constants import FORMAT_YOLO
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
 
 
 class TestMainWindow(TestCase):
@@ -18,3 +29,113 @@ class TestMainWindow(TestCase):
 
     def test_noop(self):
         pass
+
+    def test_cancelled_close_keeps_workers(self):
+        self.win.may_continue = lambda: False
+        event = QCloseEvent()
+        self.win.closeEvent(event)
+        self.assertFalse(event.isAccepted())
+        self.assertFalse(self.win.save_queue._stopping)
+        del self.win.may_continue
+
+    def test_open_file_during_scan(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            image_dir = os.path.join(tmp_dir, 'images')
+            os.mkdir(image_dir)
+            for i in range(20):
+                shutil.copy(os.path.join(dir_name, 'test.512.512.bmp'), os.path.join(image_dir, '%02d.bmp' % i))
+            other = os.path.join(tmp_dir, 'other.bmp')
+            shutil.copy(os.path.join(dir_name, 'test.512.512.bmp'), other)
+            self.win.settings.path = os.path.join(tmp_dir, 'settings.pkl')
+            self.win.import_dir_images(image_dir)
+            scanner = self.win.dir_scanner
+            # The first image arrives, the rest of the scan is still queued
+            self.win.add_scanned_images(scanner, [os.path.join(image_dir, '00.bmp')])
+            self.assertEqual(1, len(self.win.m_img_list))
+            # As open_file does
+            self.win.cur_img_idx = 0
+            self.win.img_count = 1
+            self.win.load_file(other)
+            self.assertIsNone(self.win.dir_scanner)
+            scanner.wait()
+            self.app.processEvents()
+            self.assertEqual([], self.win.m_img_list)
+            self.assertEqual(other, self.win.file_path)
+        finally:
+            self.win.close_dataset_index()
+            shutil.rmtree(tmp_dir)
+
+    def test_overlay_cache(self):
+        canvas = self.win.canvas
+        pixmap = QPixmap(64, 48)
+        pixmap.fill(QColor(100, 100, 100))
+        canvas.load_pixmap(pixmap)
+        self.assertIs(canvas.pixmap, canvas.overlay_pixmap())
+        canvas.overlay_color = QColor(200, 200, 200)
+        brighter = canvas.overlay_pixmap()
+        self.assertIsNot(canvas.pixmap, brighter)
+        # A new but equal color, as paint_canvas sets on every zoom, keeps the cache
+        canvas.overlay_color = QColor(200, 200, 200)
+        self.assertIs(brighter, canvas.overlay_pixmap())
+        self.assertGreater(QColor(brighter.toImage().pixel(0, 0)).red(), 100)
+        canvas.overlay_color = QColor(50, 50, 50)
+        self.assertLess(QColor(canvas.overlay_pixmap().toImage().pixel(0, 0)).red(), 100)
+
+
+class TestSkipUnchangedSave(TestCase):
+
+    app = None
+    win = None
+
+    def setUp(self):
+        self.app, self.win = get_main_app()
+        self.tmp_dir = tempfile.mkdtemp()
+        # Keep the save dir and format used here out of the user's settings
+        self.win.settings.path = os.path.join(self.tmp_dir, 'settings.pkl')
+        image_path = os.path.join(self.tmp_dir, 'image.bmp')
+        shutil.copy(os.path.join(dir_name, 'test.512.512.bmp'), image_path)
+        self.win.default_save_dir = self.tmp_dir
+        self.win.load_file(image_path)
+        self.win.load_labels([('cat', [(10, 10), (50, 10), (50, 40), (10, 40)], None, None, False)])
+        self.base_path = os.path.join(self.tmp_dir, 'image')
+
+    def tearDown(self):
+        self.win.close()
+        self.app.quit()
+        shutil.rmtree(self.tmp_dir)
+
+    def save(self):
+        """Save synchronously, return True when the file was written."""
+        count = self.win.save_count
+        self.assertTrue(self.win.save_labels(self.base_path))
+        return self.win.save_count > count
+
+    def test_identical_save_is_skipped(self):
+        self.assertTrue(self.save())
+        skipped = self.win.skipped_save_count
+        self.assertFalse(self.save())
+        self.assertEqual(skipped + 1, self.win.skipped_save_count)
+
+    def test_changes_are_written(self):
+        self.assertTrue(self.save())
+        self.win.canvas.shapes[0].label = 'dog'
+        self.assertTrue(self.save())
+
+    def test_verified_is_written(self):
+        self.assertTrue(self.save())
+        self.win.label_file.toggle_verify()
+        self.assertTrue(self.save())
+        self.assertFalse(self.save())
+
+    def test_format_change_is_written(self):
+        self.assertTrue(self.save())
+        self.win.set_format(FORMAT_YOLO)
+        self.assertTrue(self.save())
+        self.assertTrue(os.path.exists(self.base_path + '.txt'))
+
+    def test_deleted_file_is_written(self):
+        self.assertTrue(self.save())
+        os.remove(self.base_path + '.xml')
+        self.assertTrue(self.save())
+        self.assertTrue(os.path.exists(self.base_path + '.xml'))
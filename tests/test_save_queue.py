@@ -0,0 +1,53 @@
+import os
+import sys
+import threading
+import unittest
+
+try:
+    from PyQt5.QtCore import Qt
+except ImportError:
+    from PyQt4.QtCore import Qt
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.save_queue import SaveQueue
+
+
+class TestSaveQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = SaveQueue()
+        self.saved, self.failed = [], []
+        self.queue.saved.connect(lambda image, path: self.saved.append(path), Qt.DirectConnection)
+        self.queue.failed.connect(lambda path, message: self.failed.append((path, message)), Qt.DirectConnection)
+
+    def tearDown(self):
+        self.queue.shutdown()
+
+    def test_coalesce(self):
+        gate = threading.Event()
+        writes = []
+        self.queue.submit('a.xml', 'a.png', gate.wait)
+        # Queued while the first write is blocked, the later job of b.xml replaces the earlier one
+        self.queue.submit('b.xml', 'b.png', lambda: writes.append('b1'))
+        self.queue.submit('c.xml', 'c.png', lambda: writes.append('c'))
+        self.queue.submit('b.xml', 'b.png', lambda: writes.append('b2'))
+        self.assertTrue(self.queue.has_pending())
+        gate.set()
+        self.queue.flush()
+        self.assertFalse(self.queue.has_pending())
+        self.assertEqual(['b2', 'c'], writes)
+        self.assertEqual(['a.xml', 'b.xml', 'c.xml'], self.saved)
+
+    def test_failure(self):
+        def fail():
+            raise IOError('disk full')
+        self.queue.submit('a.xml', 'a.png', fail)
+        self.queue.submit('b.xml', 'b.png', lambda: None)
+        self.queue.wait_for_image('b.png')
+        self.assertEqual([('a.xml', 'OSError: disk full')], self.failed)
+        self.assertEqual(['b.xml'], self.saved)
+
+
+if __name__ == '__main__':
+    unittest.main()
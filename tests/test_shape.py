@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+try:
+    from PyQt5.QtCore import QPointF, QRectF
+except ImportError:
+    from PyQt4.QtCore import QPointF, QRectF
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.shape import Shape
+
+
+class TestShapeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.shape = Shape('rect')
+        for x, y in ((10, 10), (50, 10), (50, 40), (10, 40)):
+            self.shape.add_point(QPointF(x, y))
+        self.shape.close()
+
+    def assert_rect(self, x1, y1, x2, y2):
+        rect = self.shape.bounding_rect()
+        self.assertEqual((x1, y1, x2, y2), (rect.left(), rect.top(), rect.right(), rect.bottom()))
+
+    def test_invalidation(self):
+        self.assert_rect(10, 10, 50, 40)
+        self.assertTrue(self.shape.contains_point(QPointF(30, 20)))
+        self.shape.move_by(QPointF(100, 0))
+        self.assert_rect(110, 10, 150, 40)
+        self.assertFalse(self.shape.contains_point(QPointF(30, 20)))
+        self.shape.move_vertex_by(2, QPointF(10, 10))
+        self.assert_rect(110, 10, 160, 50)
+        self.shape[0] = QPointF(100, 0)
+        self.assert_rect(100, 0, 160, 50)
+        self.shape.points = [QPointF(0, 0), QPointF(5, 0), QPointF(5, 5), QPointF(0, 5)]
+        self.assert_rect(0, 0, 5, 5)
+        # Changing the returned rect does not change the cache
+        self.shape.bounding_rect().translate(100, 100)
+        self.assert_rect(0, 0, 5, 5)
+
+    def test_paths(self):
+        line_path = self.shape.line_path()
+        self.assertIs(line_path, self.shape.line_path())
+        self.shape.set_open()
+        # Without the segment back to the first point
+        self.assertEqual(line_path.elementCount() - 1, self.shape.line_path().elementCount())
+        vertex_path = self.shape.vertex_path()
+        self.assertIs(vertex_path, self.shape.vertex_path())
+        self.shape.highlight_vertex(1, Shape.MOVE_VERTEX)
+        self.assertIsNot(vertex_path, self.shape.vertex_path())
+        self.assertEqual(Shape.h_vertex_fill_color, self.shape.vertex_fill_color)
+        self.shape.highlight_clear()
+        self.shape.vertex_path()
+        self.assertEqual(Shape.vertex_fill_color, self.shape.vertex_fill_color)
+
+    def test_axis_aligned_rect(self):
+        self.assertTrue(self.shape.is_axis_aligned_rect())
+        self.shape.move_vertex_by(1, QPointF(5, 0))
+        self.assertFalse(self.shape.is_axis_aligned_rect())
+        fragments = self.shape.vertex_fragments(QRectF(0, 0, 12, 12), 0.5)
+        self.assertEqual(4, len(fragments))
+        self.assertIs(fragments, self.shape.vertex_fragments(QRectF(0, 0, 12, 12), 0.5))
+        self.assertEqual((55, 10), (fragments[1].x, fragments[1].y))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+try:
+    from PyQt5.QtCore import QPointF
+except ImportError:
+    from PyQt4.QtCore import QPointF
+
+dir_name = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dir_name, '..'))
+from libs.shape import Shape
+from libs.spatial_index import ShapeGrid
+
+
+def make_rect(x1, y1, x2, y2):
+    shape = Shape('rect')
+    for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2)):
+        shape.add_point(QPointF(x, y))
+    shape.close()
+    return shape
+
+
+class TestShapeGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = ShapeGrid(cell_size=100, max_cells_per_shape=16)
+        self.a = make_rect(10, 10, 50, 50)
+        self.b = make_rect(30, 30, 250, 80)
+        self.c = make_rect(500, 500, 520, 520)
+        self.grid.rebuild([self.a, self.b, self.c])
+
+    def test_query_order(self):
+        self.assertEqual([self.a, self.b], self.grid.query_point(40, 40))
+        self.assertEqual([self.b], self.grid.query_point(200, 60))
+        self.assertEqual([], self.grid.query_point(400, 400))
+        self.assertEqual([self.c], self.grid.query_point(495, 495, radius=5))
+        self.assertEqual([self.a, self.b, self.c], self.grid.query_rect(0, 0, 600, 600))
+        # Spans far more cells than are occupied
+        self.assertEqual([self.a, self.b, self.c], self.grid.query_rect(-1e9, -1e9, 1e9, 1e9))
+        self.assertEqual([self.c], self.grid.query_rect(300, 300, 1e9, 1e9))
+
+    def test_move_and_remove(self):
+        self.a.move_by(QPointF(400, 400))
+        self.assertEqual([self.b], self.grid.query_point(40, 40))
+        self.assertEqual([self.a, self.c], self.grid.query_rect(400, 400, 600, 600))
+        # In-place point edits are announced with points_changed()
+        for point in self.c.points:
+            point += QPointF(-500, -500)
+        self.c.points_changed()
+        self.assertEqual([self.c], self.grid.query_point(15, 15))
+        self.grid.remove(self.b)
+        self.assertIsNone(self.b.listener)
+        self.assertEqual([self.c], self.grid.query_rect(0, 0, 300, 300))
+
+    def test_oversized(self):
+        big = make_rect(0, 0, 1000, 1000)
+        self.grid.insert(big)
+        self.assertEqual([big], self.grid.query_point(900, 900))
+        self.assertEqual([self.c, big], self.grid.query_point(510, 510))
+        big.move_by(QPointF(5000, 5000))
+        self.assertEqual([self.c], self.grid.query_point(510, 510))
+
+    def test_copy_is_not_indexed(self):
+        copy = self.a.copy()
+        self.assertIsNone(copy.listener)
+        copy.move_by(QPointF(1000, 1000))
+        self.assertEqual([self.a], self.grid.query_point(15, 15))
+
+
+if __name__ == '__main__':
+    unittest.main()
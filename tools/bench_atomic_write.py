@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cost of crash-safe annotation saves: PascalVocWriter.save with an atomic
+rename, with and without fsync, against writing the file in place.
+
+    python tools/bench_atomic_write.py [--objects 10] [--saves 200] [--dir DIR]
+
+Run it with --dir on the file system the annotations are saved to; the cost
+of fsync differs widely between local disks and network file systems.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from libs import pascal_voc_io
+from libs.atomic_file import atomic_write
+from libs.pascal_voc_io import PascalVocWriter
+
+
+def make_writer(num_objects):
+    writer = PascalVocWriter('images', 'image.jpg', [1080, 1920, 3], local_img_path='/data/images/image.jpg')
+    for i in range(num_objects):
+        writer.add_bnd_box(1 + i % 1800, 1 + i % 1000, 100 + i % 1800, 60 + i % 1000, 'label%d' % (i % 20), 0)
+    return writer
+
+
+def in_place_write(path, mode='w', encoding=None, fsync=None):
+    """Stand-in for atomic_write that truncates the target, as the writers used to."""
+    return open(path, mode, encoding=encoding)
+
+
+def time_saves(writer, target_dir, saves, write):
+    pascal_voc_io.atomic_write = write
+    start = time.perf_counter()
+    for i in range(saves):
+        writer.save(target_file=os.path.join(target_dir, '%d.xml' % (i % 50)))
+    return (time.perf_counter() - start) / saves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=10, help='objects per annotation')
+    parser.add_argument('--saves', type=int, default=200, help='saves per measurement')
+    parser.add_argument('--dir', help='directory to save to (default: a temporary directory)')
+    args = parser.parse_args(argv)
+
+    target_dir = tempfile.mkdtemp(dir=args.dir)
+    writer = make_writer(args.objects)
+    try:
+        cases = (
+            ('in place', in_place_write),
+            ('atomic', lambda path, mode='w', encoding=None: atomic_write(path, mode, encoding, fsync=False)),
+            ('atomic + fsync', lambda path, mode='w', encoding=None: atomic_write(path, mode, encoding, fsync=True)),
+        )
+        print('%-16s %12s %10s' % ('mode', 'ms/save', 'saves/s'))
+        for name, write in cases:
+            seconds = time_saves(writer, target_dir, args.saves, write)
+            print('%-16s %12.3f %10.1f' % (name, seconds * 1000, 1 / seconds))
+    finally:
+        pascal_voc_io.atomic_write = atomic_write
+        shutil.rmtree(target_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Canvas frames per second for a dense scene: a grid of same-label boxes as
+made by the batch dialog, painted shape by shape and in batches.
+
+    python tools/bench_canvas_paint.py [--shapes 10000] [--frames 10] [--zoom fit 1]
+
+Without a display, run it with QT_QPA_PLATFORM=offscreen.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    from PyQt5.QtGui import QColor, QPixmap
+    from PyQt5.QtCore import QPointF, QRect
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtGui import QApplication, QColor, QPixmap
+    from PyQt4.QtCore import QPointF, QRect
+
+from libs.canvas import Canvas
+from libs.shape import Shape
+from libs.utils import generate_color_by_text
+
+
+def make_scene(num_shapes, image_size, label):
+    """Boxes in a grid covering the image, all with the same label."""
+    width, height = image_size
+    columns = int(math.ceil(math.sqrt(num_shapes * width / float(height))))
+    rows = int(math.ceil(num_shapes / float(columns)))
+    cell_w, cell_h = width / float(columns), height / float(rows)
+    color = generate_color_by_text(label)
+    shapes = []
+    for i in range(num_shapes):
+        x, y = (i % columns) * cell_w + 2, (i // columns) * cell_h + 2
+        shape = Shape(label=label)
+        for px, py in ((x, y), (x + cell_w - 4, y), (x + cell_w - 4, y + cell_h - 4), (x, y + cell_h - 4)):
+            shape.add_point(QPointF(px, py))
+        shape.close()
+        shape.line_color = color
+        shape.fill_color = color
+        shapes.append(shape)
+    return shapes
+
+
+def frames_per_second(canvas, viewport, frames):
+    canvas.grab(viewport)
+    start = time.perf_counter()
+    for _ in range(frames):
+        canvas.grab(viewport)
+    return frames / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shapes', type=int, default=10000, help='boxes in the scene')
+    parser.add_argument('--frames', type=int, default=10, help='frames per measurement')
+    parser.add_argument('--image', default='4000x3000', help='image size, WIDTHxHEIGHT')
+    parser.add_argument('--viewport', default='1600x1000', help='visible canvas area, WIDTHxHEIGHT')
+    parser.add_argument('--zoom', nargs='+', default=['fit', '1'], help="zoom levels, 'fit' for the whole image")
+    parser.add_argument('--labels', action='store_true', help='paint the label text of every box')
+    args = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    image_size = [int(v) for v in args.image.split('x')]
+    viewport_size = [int(v) for v in args.viewport.split('x')]
+    pixmap = QPixmap(*image_size)
+    pixmap.fill(QColor(128, 128, 128))
+
+    canvas = Canvas()
+    canvas.load_pixmap(pixmap)
+    shapes = make_scene(args.shapes, image_size, 'component')
+    for shape in shapes:
+        shape.paint_label = args.labels
+    canvas.load_shapes(shapes)
+    viewport = QRect(0, 0, *viewport_size)
+
+    print('%-8s %12s %12s %12s' % ('zoom', 'per shape', 'batched', 'speedup'))
+    for zoom in args.zoom:
+        if zoom == 'fit':
+            canvas.scale = min(viewport_size[0] / float(image_size[0]), viewport_size[1] / float(image_size[1]))
+        else:
+            canvas.scale = float(zoom)
+        canvas.resize(canvas.sizeHint())
+        results = []
+        for batch_paint in (False, True):
+            canvas.batch_paint = batch_paint
+            results.append(frames_per_second(canvas, viewport, args.frames))
+        print('%-8s %8.1f fps %8.1f fps %11.1fx' % (zoom, results[0], results[1], results[1] / results[0]))
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of PascalVocWriter.save against the previous save path,
+which built an xml.etree tree, serialized it, parsed it back with lxml to
+pretty-print it and replaced the two space indents with tabs.
+
+    python tools/bench_voc_writer.py [--objects 1 100 10000] [--seconds 1]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from xml.etree import ElementTree
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from libs.pascal_voc_io import PascalVocWriter
+
+IMG_SIZE = [1080, 1920, 3]
+
+
+def make_writer(num_objects):
+    writer = PascalVocWriter('images', 'image.jpg', IMG_SIZE, local_img_path='/data/images/image.jpg')
+    for i in range(num_objects):
+        x, y = 1 + i % 1800, 1 + i % 1000
+        writer.add_bnd_box(x, y, x + 100, y + 60, 'label%d' % (i % 20), i % 2)
+    return writer
+
+
+def legacy_save(writer, target_file):
+    """The save path before the single pass writer."""
+    top = ElementTree.Element('annotation')
+    for tag, text in (('folder', writer.folder_name), ('filename', writer.filename), ('path', writer.local_img_path)):
+        ElementTree.SubElement(top, tag).text = text
+    ElementTree.SubElement(ElementTree.SubElement(top, 'source'), 'database').text = writer.database_src
+    size = ElementTree.SubElement(top, 'size')
+    for tag, value in (('width', writer.img_size[1]), ('height', writer.img_size[0]), ('depth', writer.img_size[2])):
+        ElementTree.SubElement(size, tag).text = str(value)
+    ElementTree.SubElement(top, 'segmented').text = '0'
+    for box in writer.box_list:
+        item = ElementTree.SubElement(top, 'object')
+        ElementTree.SubElement(item, 'name').text = box['name']
+        ElementTree.SubElement(item, 'pose').text = 'Unspecified'
+        ElementTree.SubElement(item, 'truncated').text = '0'
+        ElementTree.SubElement(item, 'difficult').text = str(bool(box['difficult']) & 1)
+        bnd_box = ElementTree.SubElement(item, 'bndbox')
+        for key in ('xmin', 'ymin', 'xmax', 'ymax'):
+            ElementTree.SubElement(bnd_box, key).text = str(box[key])
+    rough_string = ElementTree.tostring(top, 'utf8')
+    root = etree.fromstring(rough_string)
+    result = etree.tostring(root, pretty_print=True, encoding='utf-8').replace(b'  ', b'\t')
+    with open(target_file, 'w', encoding='utf-8') as out_file:
+        out_file.write(result.decode('utf8'))
+
+
+def saves_per_second(save, seconds):
+    count, start = 0, time.perf_counter()
+    while True:
+        save()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, nargs='+', default=[1, 100, 10000], help='objects per annotation')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent on each measurement')
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        target_file = os.path.join(tmp_dir, 'image.xml')
+        print('%8s %14s %14s %8s' % ('objects', 'legacy save/s', 'save/s', 'speedup'))
+        for num_objects in args.objects:
+            writer = make_writer(num_objects)
+            legacy = saves_per_second(lambda: legacy_save(writer, target_file), args.seconds)
+            current = saves_per_second(lambda: writer.save(target_file=target_file), args.seconds)
+            print('%8d %14.1f %14.1f %7.2fx' % (num_objects, legacy, current, current / legacy))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()